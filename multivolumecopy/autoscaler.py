@@ -0,0 +1,134 @@
+"""
+Chooses the number of workers from measured copy throughput.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class ThroughputAutoscaler(object):
+    """ Adjusts the number of workers one at a time, towards the knee of the throughput curve.
+
+    Throughput (bytes/s and files/s) is measured over windows of `interval` seconds.
+    After each window, the number of workers is compared to the previous window:
+
+        * if adding a worker raised throughput, another is added.
+        * if removing a worker did not lower throughput, another is removed.
+        * otherwise we have passed the knee, the previous number of workers is restored
+          and held for `hold_windows` windows, before probing again (alternating up/down).
+
+    Example:
+
+        .. code-block:: python
+
+            autoscaler = ThroughputAutoscaler(num_workers=2, min_workers=1, max_workers=8)
+
+            # main loop
+            autoscaler.record(bytes=1024)  # each copied file
+            autoscaler.evaluate()
+            >>> 3
+
+    """
+    def __init__(self, num_workers, min_workers=1, max_workers=8, interval=2.0, tolerance=0.05, hold_windows=5):
+        """ Constructor.
+
+        Args:
+            num_workers (int): number of workers to start with
+            min_workers (int, optional): never scale below this many workers
+            max_workers (int, optional): never scale above this many workers
+            interval (float, optional): seconds throughput is measured for, before each decision
+            tolerance (float, optional): ``(ex: 0.05 == 5%)`` smaller changes in throughput are considered noise
+            hold_windows (int, optional): windows to wait after finding the knee, before probing again
+        """
+        self.min_workers = max(min_workers, 1)
+        self.max_workers = max(max_workers, self.min_workers)
+        self.num_workers = min(max(num_workers, self.min_workers), self.max_workers)
+        self.interval = interval
+        self.tolerance = tolerance
+        self.hold_windows = hold_windows
+
+        self._direction = 1
+        self._held_windows = 0
+        self._previous = None  # (num_workers, bytes_per_second, files_per_second)
+        self.reset()
+
+    def reset(self, now=None):
+        """ Discards the current window (ex: while copying was paused for a device swap).
+        """
+        self._window_started_at = time.monotonic() if now is None else now
+        self._bytes = 0
+        self._files = 0
+
+    def record(self, bytes, files=1):
+        """ Records a copied file.
+        """
+        self._bytes += bytes
+        self._files += files
+
+    def evaluate(self, now=None):
+        """ Returns the number of workers that should be active, adjusting it if a window has elapsed.
+
+        Returns:
+            int: number of workers
+        """
+        now = time.monotonic() if now is None else now
+        elapsed = now - self._window_started_at
+        # windows without any copied files are extended (ex: large files copied in chunks)
+        if elapsed < self.interval or not self._files:
+            return self.num_workers
+
+        sample = (self.num_workers, self._bytes / elapsed, self._files / elapsed)
+        self.reset(now)
+        (previous, self._previous) = (self._previous, sample)
+        if previous is None:
+            return self._step(self._direction, sample, 'probing')
+
+        if previous[0] == self.num_workers:
+            self._held_windows += 1
+            if self._held_windows <= self.hold_windows:
+                return self.num_workers
+            return self._step(self._direction, sample, 'probing')
+
+        gain = self._gain(previous, sample)
+        if self.num_workers > previous[0] and gain > self.tolerance:
+            return self._step(1, sample, 'throughput rose {:+.0%}'.format(gain))
+        if self.num_workers < previous[0] and gain >= -self.tolerance:
+            return self._step(-1, sample, 'throughput held {:+.0%}'.format(gain))
+
+        # past the knee, return to previous (and measure against it while we hold)
+        self._previous = previous
+        self._direction = -self._direction
+        return self._scale(previous[0], sample, 'throughput {:+.0%}, reverting'.format(gain))
+
+    def _gain(self, previous, sample):
+        """ Returns the relative change in throughput between two samples.
+        (the average of the change in bytes/s and files/s, so both large and small files are represented)
+        """
+        gains = []
+        for (before, after) in zip(previous[1:], sample[1:]):
+            gains.append((after - before) / before if before else 0.0)
+        return sum(gains) / len(gains)
+
+    def _step(self, direction, sample, reason):
+        self._direction = direction
+        target = min(max(self.num_workers + direction, self.min_workers), self.max_workers)
+        if target == self.num_workers:
+            # at min/max, probe the other way next time
+            self._direction = -direction
+        return self._scale(target, sample, reason)
+
+    def _scale(self, num_workers, sample, reason):
+        self._held_windows = 0
+        if num_workers == self.num_workers:
+            return self.num_workers
+
+        logger.info('Autoscaling workers {} -> {} ({:.1f} MiB/s, {:.1f} files/s): {}'.format(
+            self.num_workers, num_workers, sample[1] / (1024 * 1024), sample[2], reason
+        ))
+        self.num_workers = num_workers
+        return self.num_workers
@@ -7,8 +7,8 @@ import argparse
 import logging
 import sys
 from multivolumecopy.resolvers import directorylistresolver, jobfileresolver
-from multivolumecopy import copyoptions, verifier
-from multivolumecopy.copiers import multiprocesscopier
+from multivolumecopy import copybackends, copyoptions, filesystem, topology, verifier
+from multivolumecopy.copiers import multiprocesscopier, threadpoolcopier
 import multivolumecopy
 
 
@@ -64,6 +64,17 @@ class CommandlineInterface(object):
             '--verify', help='Verify a single volume of a backup',
             action='store_true',
         )
+        self.parser.add_argument(
+            '--checksum', help=('Compare file contents (not only modified dates) when deciding '
+                                'if a file needs to be copied, or is different when verifying'),
+            action='store_true',
+        )
+        self.parser.add_argument(
+            '--trust-dst-files', help=('Skip destination files with the same size and modified date as the source, '
+                                       'without comparing contents (even with --checksum). Files are only renamed '
+                                       'into place once completely written, so these are complete copies'),
+            action='store_true',
+        )
         self.parser.add_argument(
             '-w', '--workers',
             help=('Set the number of worker processes that will simultaneously '
@@ -73,6 +84,60 @@ class CommandlineInterface(object):
             type=int,
         )
 
+        self.parser.add_argument(
+            '--tune',
+            help=('Choose the number of workers, chunk sizes and read order for the source/destination '
+                  'devices (spinning disk, ssd, network). Options set explicitly (ex: --workers) are kept'),
+            action='store_true',
+        )
+
+        self.parser.add_argument(
+            '--copier',
+            help=('Copy files in worker processes (multiprocess), or in threads within a single process '
+                  '(threadpool, less memory and no process startup). (default: multiprocess)'),
+            choices=['multiprocess', 'threadpool'],
+            default='multiprocess',
+        )
+
+        self.parser.add_argument(
+            '--autoscale',
+            help=('Adjust the number of workers while copying, towards the highest measured throughput. '
+                  '(starts from --workers)'),
+            action='store_true',
+        )
+
+        self.parser.add_argument(
+            '--copy-backend',
+            help=('Method used to copy file contents. "auto" benchmarks each method against '
+                  'the source/destination devices (result is cached). (default: kernel)'),
+            choices=[copybackends.AUTO, copybackends.KERNEL] + copybackends.names(),
+        )
+
+        self.parser.add_argument(
+            '--direct-io-threshold',
+            help=('Copy files this size or larger with O_DIRECT, bypassing the page cache '
+                  '(falls back to buffered copying if unsupported)'),
+            metavar='4G',
+            type=str,
+        )
+
+        # rate limits
+        self.parser.add_argument(
+            '--max-read-rate', help='Maximum bytes read per second, by all workers combined',
+            metavar='50M',
+            type=str,
+        )
+        self.parser.add_argument(
+            '--max-write-rate', help='Maximum bytes written per second, by all workers combined',
+            metavar='50M',
+            type=str,
+        )
+        self.parser.add_argument(
+            '--max-file-rate', help='Maximum files copied per second, by all workers combined',
+            metavar='200',
+            type=int,
+        )
+
         # misc
         self.parser.add_argument(
             '--device-padding', help='Room to leave on each backup disk before prompting for a new disk',
@@ -117,7 +182,10 @@ class CommandlineInterface(object):
             exitcode = int(not results.valid())
             sys.exit(exitcode)
 
-        copier_ = multiprocesscopier.MultiProcessCopier(resolver, self.options)
+        if args.copier == 'threadpool':
+            copier_ = threadpoolcopier.ThreadPoolCopier(resolver, self.options)
+        else:
+            copier_ = multiprocesscopier.MultiProcessCopier(resolver, self.options)
 
         copier_.start(args.device_startindex, args.select_index)
 
@@ -144,8 +212,27 @@ class CommandlineInterface(object):
         self.options.output = args.output
         self.options.device_padding = args.device_padding
         self.options.show_progressbar = not args.hide_progress
+        if args.tune:
+            self.options.device_tuning = set(topology.TUNABLE_OPTIONS)
         if args.workers:
             self.options.num_workers = args.workers
+            self.options.device_tuning.discard('num_workers')
+        if args.autoscale:
+            self.options.autoscale_workers = True
+        if args.checksum:
+            self.options.compare_checksum = True
+        if args.trust_dst_files:
+            self.options.trust_dst_files = True
+        if args.copy_backend:
+            self.options.copy_backend = args.copy_backend
+        if args.direct_io_threshold:
+            self.options.direct_io_threshold = filesystem.size_to_bytes(args.direct_io_threshold)
+        if args.max_read_rate:
+            self.options.max_read_bytes_per_second = filesystem.size_to_bytes(args.max_read_rate)
+        if args.max_write_rate:
+            self.options.max_write_bytes_per_second = filesystem.size_to_bytes(args.max_write_rate)
+        if args.max_file_rate:
+            self.options.max_files_per_second = args.max_file_rate
 
     def _get_resolver_from_args(self, args):
         if args.jobfile:
@@ -17,17 +17,38 @@ class Interpreter(object):
         #self._commands = [memstats.MemStats()]
         self._commands = []
 
-    def eval_user_commands(self):
+    def add_command(self, command):
+        """ Adds a command, executed when it's hotkey is entered.
+
+        Args:
+            command (commandbase.CommandBase): ``(ex: memstats.MemStats())``
+        """
+        self._commands.append(command)
+
+    def waitables(self):
+        """ Objects the caller can wait on, that become ready when user input is available.
+        (see :py:func:`multiprocessing.connection.wait` )
+        """
         # nothing to evaluate if no commands present
         if not self._commands:
-            return
+            return []
 
         # windows cannot select on file like objects
         if sys.platform.startswith('win'):
+            return []
+        return [sys.stdin]
+
+    def eval_user_commands(self, timeout=0):
+        """
+        Args:
+            timeout (float, optional):
+                seconds to wait for user input.
+        """
+        if not self.waitables():
             return
 
         # retrieve key, execute comman dif available
-        (readable, _, _) = select.select([sys.stdin], [], [], 0.2)
+        (readable, _, _) = select.select([sys.stdin], [], [], timeout)
         if readable:
             char = readable[0].read(1)
             for cmd in self._commands:
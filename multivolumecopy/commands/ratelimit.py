@@ -0,0 +1,44 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from multivolumecopy import ratelimiter
+from multivolumecopy.commands import commandbase
+
+
+class _ScaleRateLimit(commandbase.CommandBase):
+    """ Multiplies every configured rate limit by :py:attr:`FACTOR` ,
+    for all workers at once (unlimited rates are left unlimited).
+    """
+    FACTOR = 1.0
+
+    def __init__(self, limiter):
+        """
+        Args:
+            limiter (ratelimiter.RateLimiter): rate limiter shared with workers
+        """
+        super(_ScaleRateLimit, self).__init__()
+        self._limiter = limiter
+
+    def execute(self):
+        rates = []
+        for (bucket, name) in sorted(ratelimiter.BUCKET_NAMES.items()):
+            rate = self._limiter.rate(bucket)
+            if rate:
+                rate *= self.FACTOR
+                self._limiter.set_rate(bucket, rate)
+                rates.append('{}={:.0f}'.format(name, rate))
+        print('Rate limit: {}'.format(', '.join(rates)))
+
+
+class IncreaseRateLimit(_ScaleRateLimit):
+    """ Doubles the rate limits.
+    """
+    HOTKEY = '+'
+    FACTOR = 2.0
+
+
+class DecreaseRateLimit(_ScaleRateLimit):
+    """ Halves the rate limits.
+    """
+    HOTKEY = '-'
+    FACTOR = 0.5
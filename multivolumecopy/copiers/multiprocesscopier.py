@@ -3,16 +3,16 @@ from __future__ import division
 from __future__ import print_function
 import logging
 import multiprocessing
-import multiprocessing.managers
+import multiprocessing.connection
 import os
-import queue
 import sys
 import time
-from multivolumecopy import filesystem
+from multivolumecopy import autoscaler, copybackends, copyfile, copyprofile, dircache, filesystem, indexset
+from multivolumecopy import jobqueue, jobtable, memory, pagecache, ratelimiter, resultchannel, topology
 from multivolumecopy.copiers import copier
 from multivolumecopy.progress import lineformatter
 from multivolumecopy.prompts import commandlineprompt
-from multivolumecopy.commands import interpreter
+from multivolumecopy.commands import interpreter, ratelimit
 from multivolumecopy.reconcilers import keepfilesreconciler
 
 
@@ -22,6 +22,10 @@ logger = logging.getLogger(__name__)
 WINDOWS_DISKFULL_ERRNO = 39
 POSIX_DISKFULL_ERRNO = 28
 
+# fraction of free space that is not counted when estimating files that will fit on a volume
+# (filesystem metadata, directories, and other writers are not accounted for)
+WINDOW_MARGIN = 0.05
+
 
 class MultiProcessCopier(copier.Copier):
     """ Performs file copies using multiple threads (faster).
@@ -44,35 +48,44 @@ class MultiProcessCopier(copier.Copier):
         """
         super(MultiProcessCopier, self).__init__(resolver, options)
 
-        # NOTE: queueing using multiprocessing.Manager.list() to approximate LIFO queue.
+        # NOTE: copyfiles are stored once in shared memory (jobtable),
+        #       workers claim their indexes from a shared cursor (jobqueue).
         #       (for backup-file reconciliation, order must remain consistent in queue)
-        #       (LIFO allows us to re-enqeueue failed copies due to diskfull error)
+        #       (the queue is reset from the first uncopied index, to re-enqueue failed copies due to diskfull error)
 
         # queues/locks
-        self._mpmanager = multiprocessing.Manager()
-        self.joblist = self._mpmanager.list()
-        self.completed_queue = multiprocessing.Queue()
-        self.error_queue = multiprocessing.Queue()
-        self.started_queue = multiprocessing.Queue()
+        self.jobtable = jobtable.JobTable()
+        self.jobqueue = jobqueue.JobQueue()
+        self.results = resultchannel.ResultChannel()
         self.device_full_lock = multiprocessing.Event()
+        self.ratelimiter = ratelimiter.RateLimiter(read_bytes=self.options.max_read_bytes_per_second,
+                                                   write_bytes=self.options.max_write_bytes_per_second,
+                                                   files=self.options.max_files_per_second)
 
         # components
         self.prompt = commandlineprompt.CommandlinePrompt()
         self._interpreter = interpreter.Interpreter()
-        self.manager = _MultiProcessCopierWorkerManager(self.joblist,
-                                                        self.started_queue,
-                                                        self.completed_queue,
-                                                        self.error_queue,
+        if self.ratelimiter.limited() and sys.stdin.isatty():
+            self._interpreter.add_command(ratelimit.IncreaseRateLimit(self.ratelimiter))
+            self._interpreter.add_command(ratelimit.DecreaseRateLimit(self.ratelimiter))
+        self.manager = _MultiProcessCopierWorkerManager(self.jobtable,
+                                                        self.jobqueue,
+                                                        self.results,
                                                         self.device_full_lock,
-                                                        options)
+                                                        self.options,
+                                                        self.ratelimiter)
         self._progress_formatter = lineformatter.LineFormatter()
         self.reconciler = reconciler or keepfilesreconciler.KeepFilesReconciler(resolver, options)
 
         # internal data
         self._copyfiles = tuple()
-        self._copied_indexes = []
-        self._error_indexes = []
-        self._started_indexes = []
+        self._lanes = None  # [(start, stop, device), ...] (see `topology.device_lanes` )
+        self._copied_indexes = indexset.IndexSet()
+        self._error_indexes = indexset.IndexSet()
+        self._started_indexes = indexset.IndexSet()
+        self._volume_indexes = indexset.IndexSet()  # indexes copied to the current volume
+        self._peak_worker_rss = 0
+        self._num_retired_workers = 0
 
     def start(self, device_start_index=None, start_index=None, maxloops=-1):
         """ Copies files, prompting for new device when device is full.
@@ -108,14 +121,13 @@ class MultiProcessCopier(copier.Copier):
         """
         # where to copy from
         start_index = start_index or device_start_index or 0
+        self._volume_indexes = indexset.IndexSet.from_range(device_start_index or 0, start_index)
 
         self._copyfiles = self.resolver.get_copyfiles()
         self._setup_copied_indexes(device_start_index)
         self.write_jobfile(self._copyfiles)
 
-        # only queue copyfiles after startindex
-        for copyfile in self._copyfiles[start_index:]:
-            self.joblist.append(copyfile)
+        self.jobtable.load(self._copyfiles)
 
         # before we start, we reconcile using the `device_start_index`
         # then adjust copied_indexes to match `start_index` so that
@@ -123,6 +135,23 @@ class MultiProcessCopier(copier.Copier):
         self.reconciler.reconcile(self._copyfiles, self._copied_indexes)
         self._setup_copied_indexes(start_index)
 
+        # workers receive tuned options/profile with options
+        if self.options.device_tuning:
+            topology.tune(self.options, self._copyfiles, self.options.output)
+
+        if self.options.copy_backend == copybackends.AUTO:
+            self.options.copy_profile = copyprofile.load_or_calibrate(self._copyfiles,
+                                                                      self.options.output,
+                                                                      self.options.copy_profile_cachefile,
+                                                                      self.options.direct_io_threshold is not None)
+
+        # only queue copyfiles after startindex
+        self._lanes = topology.device_lanes(self._copyfiles)
+        if len(self._lanes) > self.jobqueue.lane_capacity:
+            logger.debug('Too many source device lanes ({}), not scheduling by device'.format(len(self._lanes)))
+            self._lanes = None
+        self._queue_copyfiles(start_index)
+
         # begin eventloop
         self._mainloop(maxloops)
 
@@ -151,62 +180,161 @@ class MultiProcessCopier(copier.Copier):
                 self._evaluate_diskfull_check()
 
                 if self.copy_finished():
+                    self._copy_directory_stats()
                     print('Successfully Copied {} Files'.format(len(self._copyfiles)))
                     return True
                 maxloops -= 1
-                time.sleep(0.1)
+                if maxloops != 0:
+                    self._wait_for_events()
         finally:
             self.manager.stop()
             self.manager.join(timeout=3000)
+            self._log_worker_memory()
+
+    def _wait_for_events(self):
+        """ Blocks until results are available, a worker exits, or user input is available.
+        (workers exit when the device is full, so this also covers diskfull)
+        """
+        waitables = [self.results] + self.manager.sentinels() + self._interpreter.waitables()
+        multiprocessing.connection.wait(waitables)
+
+    def _num_source_devices(self):
+        return len({device for (_, _, device) in self._lanes or []})
+
+    def _queue_copyfiles(self, start_index):
+        """ Queues copyfiles from `start_index` , scheduling reads from each source device.
+        """
+        num_devices = self._num_source_devices()
+        prefetch = self.options.prefetch_files if pagecache.supported() else 0
+        if num_devices < 2:
+            self.jobqueue.reset(start_index, len(self._copyfiles), prefetch=prefetch)
+        else:
+            max_readers = self.options.max_readers_per_device
+            if max_readers is None:
+                max_readers = -(-self.options.num_workers // num_devices)
+            self.jobqueue.reset(start_index, len(self._copyfiles), self._lanes, max_readers, prefetch=prefetch)
+        self._update_window(start_index)
+
+    def _update_window(self, start_index):
+        """ Source devices are only interleaved (and files reordered) for copyfiles
+        expected to fit on the current volume, so that volumes are still filled in index order.
+        """
+        if self._num_source_devices() < 2 and not self.options.physical_order:
+            return
+        window_stop = self._estimate_window_stop(start_index)
+        self.jobqueue.set_window(window_stop)
+        if self.options.physical_order:
+            self._order_window(start_index, window_stop)
+
+    def _order_window(self, start_index, window_stop):
+        """ Queues the copyfiles of each lane within the window in the order they are stored on disk.
+        """
+        lanes = self._lanes or [(0, len(self._copyfiles), 0)]
+        ordered = []
+        for (lane_start, lane_stop, _) in lanes:
+            segment = range(max(lane_start, start_index), min(lane_stop, window_stop))
+            ordered.extend(sorted(segment, key=self._physical_order_key))
+        if ordered:
+            self.jobqueue.set_order(start_index, ordered)
+
+    def _physical_order_key(self, index):
+        # physical offset (FIEMAP) where supported, otherwise inode number.
+        # (files that are copied or missing keep their position)
+        if index in self._copied_indexes:
+            return (2, index)
+        src = self._copyfiles[index].src
+        try:
+            offset = filesystem.physical_offset(src)
+            if offset is not None:
+                return (0, offset)
+            inode = self._copyfiles[index].inode
+            return (1, os.stat(src).st_ino if inode is None else inode)
+        except(OSError):
+            return (2, index)
+
+    def _estimate_window_stop(self, start_index):
+        """ Returns the index after the last uncopied copyfile expected to fit on the current volume.
+
+        The estimate is conservative (file sizes are rounded up to the volume's block size, and
+        `WINDOW_MARGIN` of free space is kept), so that files are only reordered if they will fit.
+        """
+        block_size = filesystem.volume_block_size(self.options.output)
+        free_bytes = filesystem.volume_free(self.options.output)
+        avail_bytes = free_bytes - int(free_bytes * WINDOW_MARGIN) - self.options.device_padding
+        for index in range(start_index, len(self._copyfiles)):
+            if index in self._copied_indexes:
+                continue
+            avail_bytes -= filesystem.allocated_size(self._copyfiles[index].bytes, block_size)
+            if avail_bytes < 0:
+                return index
+        return len(self._copyfiles)
 
     def _setup_copied_indexes(self, device_start_index):
         # affects which files get deleted during reconciliation.
         if not device_start_index:
             return
-        self._copied_indexes = [x.index for x in self._copyfiles[:device_start_index]]
+        self._copied_indexes = indexset.IndexSet.from_range(0, min(device_start_index, len(self._copyfiles)))
+
+    def _log_worker_memory(self):
+        """ Reports the most memory used by any worker, once workers have exited.
+        """
+        for result in self.results.read():
+            if result.status in (resultchannel.RETIRED, resultchannel.EXITED):
+                self._record_worker_exit(result)
+        logger.info('Peak worker memory: {} ({} workers retired)'.format(
+            filesystem.format_size(self._peak_worker_rss, 'M'), self._num_retired_workers
+        ))
+
+    def _record_worker_exit(self, result):
+        if result.status == resultchannel.EXITED:
+            self._peak_worker_rss = max(self._peak_worker_rss, result.bytes)
+            return
+
+        self._num_retired_workers += 1
+        self._log_retired_worker(result)
+
+    def _log_retired_worker(self, result):
+        reasons = {
+            resultchannel.RETIRED_MAX_TASKS: 'max_worker_tasks reached',
+            resultchannel.RETIRED_MAX_RSS: 'max_worker_rss exceeded',
+        }
+        logger.debug('Worker retired, {} (rss: {} bytes)'.format(
+            reasons.get(result.errno, 'unknown reason'), result.bytes
+        ))
 
     def copy_finished(self):
         processed_files = len(self._copied_indexes) + len(self._error_indexes)
         return processed_files == len(self._copyfiles)
 
     def _evaluate_queues(self):
-        self._evaluate_started_queue()
-        self._evaluate_error_queue()
-        self._evaluate_completed_queue()
+        filedata = None
+        for result in self.results.read():
+            if result.status in (resultchannel.RETIRED, resultchannel.EXITED):
+                self._record_worker_exit(result)
+                continue
 
-    def _evaluate_started_queue(self):
-        while True:
-            try:
-                data = self.started_queue.get(timeout=0)
-                self._started_indexes.append(data.index)
-            except queue.Empty:
-                return
+            if result.status == resultchannel.STARTED:
+                self._started_indexes.add(result.index)
+                continue
 
-    def _evaluate_completed_queue(self):
-        while True:
-            try:
-                filedata = self.completed_queue.get(timeout=0)
-                self._try_remove_started_index(filedata.index)
-                self._copied_indexes.append(filedata.index)
-                self._render_progress(filedata=filedata)
-            except queue.Empty:
-                return
+            self._started_indexes.discard(result.index)
+            filedata = self._copyfiles[result.index]
+            if result.status == resultchannel.COMPLETED:
+                self._copied_indexes.add(result.index)
+                self._volume_indexes.add(result.index)
+                self.manager.record_completed(result.bytes)
+            elif result.status == resultchannel.ERROR:
+                self._error_indexes.add(result.index)
 
-    def _evaluate_error_queue(self):
-        while True:
-            try:
-                filedata = self.error_queue.get(timeout=0)
-                self._try_remove_started_index(filedata.index)
-                self._error_indexes.append(filedata.index)
-                self._render_progress(filedata=filedata)
-            except queue.Empty:
-                return
+        # results arrive in batches, render once per batch
+        if filedata:
+            self._render_progress(filedata=filedata)
 
     def _evaluate_diskfull_check(self):
         if self.device_full_lock.is_set():
             # request stop, wait for all workers to finish current file
-            self.manager.stop()
-            self.manager.join()
+            self.manager.stop(spares=False)
+            self._join_workers()
 
             # copy operation may finish before we have updated screen/counters
             self._evaluate_queues()
@@ -216,31 +344,72 @@ class MultiProcessCopier(copier.Copier):
                 return
 
             # retrieve/requeue wip files, and prompt user to switch devices
-            self._empty_and_requeue_started_copyfiles()
+            frontier = self._empty_and_requeue_uncopied_copyfiles()
+            self._copy_directory_stats()
+            self._volume_indexes = indexset.IndexSet()
             # TODO: verify no extra files on disk (if reconciliation was inaccurate due to compression etc)
             # TODO: should be able to just re-use reconcile() and check freed space.
             self._prompt_diskfull()
             self.reconciler.reconcile(self._copyfiles, self._copied_indexes)
+            self._update_window(frontier)
             self.device_full_lock.clear()
             return 0
 
-    def _empty_and_requeue_started_copyfiles(self):
+    def _copy_directory_stats(self):
+        """ Copies the stats of the directories of files copied to the current volume,
+        once all of them have been written (writing files would change the directory's mtime).
         """
+        filepairs = ((self._copyfiles[index].src, self._copyfiles[index].dst)
+                     for index in self._volume_indexes)
+        num_directories = filesystem.copydirstats(filepairs)
+        logger.debug('Copied stats of {} directories'.format(num_directories))
+
+    def _join_workers(self):
+        # workers block writing results if the channel is full,
+        # so results are read while we wait for them to exit.
+        while self.manager.active_workers():
+            self._evaluate_queues()
+            multiprocessing.connection.wait([self.results] + self.manager.sentinels())
+        self.manager.join()
+
+    def _empty_and_requeue_uncopied_copyfiles(self):
+        """ Removes files that will be copied to the next device.
+
+        Volumes hold a contiguous range of indexes. Files copied after the first
+        file that was not copied (ex: by another worker, or from another source device)
+        are removed, and copied to the next device with it.
+
+        Returns:
+            int: the first index that will be copied to the next device.
         """
-        sorted_started_indexes = sorted(self._started_indexes)
-        requeued = 0
-        while len(self._started_indexes) > 0:
-            index = sorted_started_indexes.pop(0)
-            self._try_remove_started_index(index)
-            self.joblist.insert(0, self._copyfiles[index])
-            requeued += 1
+        frontier = self._copied_indexes.union(self._error_indexes).first_missing()
+        past_frontier = [index for index in self._copied_indexes if index > frontier]
+
+        # files in progress (ex: large files copied in chunks) may be partially written.
+        for index in list(self._started_indexes) + past_frontier:
+            dst = self._copyfiles[index].dst
+            filesystem.remove_partial(dst)
+            if os.path.isfile(dst):
+                os.remove(dst)
+
+        requeued = len(self._started_indexes) + len(past_frontier)
+        for index in past_frontier:
+            self._copied_indexes.discard(index)
+            self._volume_indexes.discard(index)
+        for index in [index for index in self._error_indexes if index > frontier]:
+            self._error_indexes.discard(index)  # retried on the next device
+        self._started_indexes.clear()
+        self._queue_copyfiles(frontier)
 
         if requeued:
             print('')
             logger.info('{} files have been requeued'.format(requeued))
+        return frontier
 
     def _render_progress(self, filedata=None):
-        msg = self._progress_formatter.format(len(self._copied_indexes), len(self._copyfiles), self._error_indexes, filedata)
+        msg = self._progress_formatter.format(
+            len(self._copied_indexes), len(self._copyfiles), self._error_indexes, filedata,
+        )
         sys.stdout.write(msg)
 
     def _prompt_diskfull(self):
@@ -267,31 +436,42 @@ class MultiProcessCopier(copier.Copier):
                 print('Aborted by user')
                 sys.exit(1)
 
-    def _try_remove_started_index(self, index):
-        try:
-            self._started_indexes.remove(index)
-        except(ValueError):
-            pass
-
 
 class _MultiProcessCopierWorkerManager(object):
     """ Manages worker processes, restarting them
     automatically when they exit (while iterating through this object).
     """
-    def __init__(self, joblist, started_queue, completed_queue, error_queue, device_full_lock, options):
+    def __init__(self, jobtable, jobqueue, results, device_full_lock, options, ratelimiter=None):
         self._workers = []
-        self._joblist = joblist
-        self._completed_queue = completed_queue
-        self._started_queue = started_queue
-        self._error_queue = error_queue
+        self._spares = []  # started workers, waiting to be activated
+        self._jobtable = jobtable
+        self._jobqueue = jobqueue
+        self._results = results
 
         self._device_full_lock = device_full_lock
         self._options = options
+        self._ratelimiter = ratelimiter
+
+        self._autoscaler = None
 
     @property
     def options(self):
         return self._options
 
+    @property
+    def num_workers(self):
+        """ Number of workers that should be active.
+        """
+        if self._autoscaler:
+            return self._autoscaler.num_workers
+        return self.options.num_workers
+
+    def record_completed(self, bytes):
+        """ Records a copied file, measuring throughput for the autoscaler.
+        """
+        if self._autoscaler:
+            self._autoscaler.record(bytes)
+
     def __iter__(self):
         """ iter workers, cleaning up old
         """
@@ -304,7 +484,12 @@ class _MultiProcessCopierWorkerManager(object):
                 worker.close()
 
     def build_workers(self, maxloops=-1):
-        """ Builds workers until number of active workers matches `options.num_workers`
+        """ Builds workers until number of active workers matches :py:attr:`num_workers`
+        (`options.num_workers` , or chosen by the autoscaler if `options.autoscale_workers` is set).
+
+        Spare workers are activated first, then replaced so that `options.spare_workers`
+        remain waiting. (a spare has already started it's interpreter and imported our modules,
+        so replacing a retired worker does not wait on process startup).
 
         Args:
             maxloops (int, optional):
@@ -312,41 +497,112 @@ class _MultiProcessCopierWorkerManager(object):
                 negative numbers are infinite.
                 (param for testing).
         """
+        self._autoscale()
+
         remaining_loops = maxloops
-        while True:
-            if self.active_workers() < self.options.num_workers:
-                worker = _MultiProcessCopierWorker(self._joblist,
-                                                   self._started_queue,
-                                                   self._completed_queue,
-                                                   self._error_queue,
-                                                   self._device_full_lock,
-                                                   self.options,
-                                                   maxtasks=self.options.max_worker_tasks)
-                self._workers.append(worker)
-                worker.start()
-            else:
-                break
+        while self.active_workers() < self.num_workers:
+            worker = self._activate_spare() or self._start_worker()
+            self._workers.append(worker)
 
             # exit on maxloops
             remaining_loops -= 1
             if remaining_loops == 0:
                 return
 
+        while len(self._spares) < self._num_spares():
+            self._spares.append(self._start_worker(spare=True))
+
+    def _num_spares(self):
+        """ Number of started workers that should be kept waiting.
+        """
+        return self.options.spare_workers
+
+    def _autoscale(self):
+        """ Adjusts :py:attr:`num_workers` from measured throughput (if autoscaling),
+        asking workers to exit when it is reduced.
+        """
+        if not self.options.autoscale_workers:
+            return
+
+        # created on first use, starting from `options.num_workers` once it has been tuned for the devices
+        if self._autoscaler is None:
+            self._autoscaler = autoscaler.ThroughputAutoscaler(self.options.num_workers,
+                                                               self.options.min_workers,
+                                                               self.options.max_workers,
+                                                               self.options.autoscale_interval)
+
+        # workers were stopped (ex: device swap), that time is not representative of throughput
+        if not self.active_workers():
+            self._autoscaler.reset()
+            return
+
+        num_workers = self.num_workers
+        excess_workers = min(num_workers - self._autoscaler.evaluate(), self.active_workers())
+        if excess_workers > 0:
+            self._jobqueue.put_poison_pills(excess_workers)
+
+    def _start_worker(self, spare=False):
+        worker = _MultiProcessCopierWorker(self._jobtable,
+                                           self._jobqueue,
+                                           self._results.writer(self.options.result_batch_size,
+                                                                self.options.result_flush_interval),
+                                           self._device_full_lock,
+                                           self.options,
+                                           maxtasks=self.options.max_worker_tasks,
+                                           activation_event=multiprocessing.Event() if spare else None,
+                                           ratelimiter=self._ratelimiter)
+        worker.start()
+        return worker
+
+    def _activate_spare(self):
+        """ Activates the oldest living spare worker.
+
+        Returns:
+            _MultiProcessCopierWorker, None: ``None`` if there are no spares.
+        """
+        while self._spares:
+            worker = self._spares.pop(0)
+            if worker.is_alive():
+                worker.activate()
+                return worker
+            worker.close()
+        return None
+
+    def sentinels(self):
+        """ Returns sentinels of workers, which become ready when the worker exits.
+        (see :py:attr:`multiprocessing.Process.sentinel` )
+
+        Workers that exited but have not been cleaned up yet are included (their sentinel is already ready),
+        so waiting on them cannot miss a worker that exited after workers were last built.
+        """
+        return [worker.sentinel for worker in self._workers]
+
     def active_workers(self):
         return len(list(filter(lambda x: x.is_alive(), self.__iter__())))
 
-    def stop(self):
+    def stop(self, spares=True):
+        """ Requests active workers exit after their current task.
+
+        Args:
+            spares (bool, optional):
+                if ``False`` , spare workers keep waiting (so they can be activated
+                when workers are rebuilt, ex: after a device is swapped).
+        """
         logger.debug('Stopping Workers...')
         # worker can only process a single queue item at a time.
         # please wait afterwards.
-        for i in range(self.active_workers()):
-            self._joblist.insert(0, None)
+        num_spares = len(self._spares) if spares else 0
+        self._jobqueue.put_poison_pills(self.active_workers() + num_spares)
+        for _ in range(num_spares):
+            worker = self._activate_spare()
+            if worker:
+                self._workers.append(worker)
 
     def terminate(self):
         logger.debug('Force Terminating Workers...')
         # please request stop first.
         # please wait afterwards.
-        for worker in self._workers:
+        for worker in self._workers + self._spares:
             if not worker.is_alive():
                 continue
             worker.terminate()
@@ -357,27 +613,33 @@ class _MultiProcessCopierWorkerManager(object):
                 continue
             worker.join(timeout)
 
+        # workers that exit for other reasons (ex: device full) leave their poison pill behind
+        if not self.active_workers():
+            self._jobqueue.clear_poison_pills()
 
-class _MultiProcessCopierWorker(multiprocessing.Process):
+
+class _CopierWorker(object):
     """ Performs copy on files added to the queue.
     Runs until it's lifespan is reached, or it receives a poison pill from the queue.
+
+    Combined with a :py:class:`multiprocessing.Process` or :py:class:`threading.Thread`
+    (ex: :py:class:`_MultiProcessCopierWorker` ) which calls :py:meth:`run` .
     """
-    def __init__(self, joblist, started_queue, completed_queue, error_queue, device_full_event, options, maxtasks=5, *args, **kwargs):
+    def __init__(self, jobtable, jobqueue, results, device_full_event, options, maxtasks=None,
+                 activation_event=None, ratelimiter=None, *args, **kwargs):
         """
 
         Args:
-            joblist (multiprocessing.Manager.list):
-                list of jobs shared between workers.
-                next job at index 0.
+            jobtable (jobtable.JobTable):
+                copyfiles shared between workers.
 
-            started_queue (multiprocessing.Queue):
-                file added here when we start processing it
+            jobqueue (jobqueue.JobQueue):
+                indexes of jobs shared between workers.
+                (poison pill is claimed as ``None`` )
 
-            completed_queue (multiprocessing.Queue):
-                file added here when it is done beng processed.
-
-            error_queue (multiprocessing.Queue):
-                file added here if it could not be copied
+            results (resultchannel.ResultWriter):
+                index of each file is written here when we start processing it,
+                and again when it is done being processed (or could not be copied).
 
             device_full_event (multiprocessing.Event):
                 event that is set when the disk indicates it is full.
@@ -385,22 +647,37 @@ class _MultiProcessCopierWorker(multiprocessing.Process):
             options (copyoptions.CopyOptions):
                 the copy options
 
-            maxtasks (int):
+            maxtasks (int, optional):
                 number of copies this process is allowed to have before it
                 exits. Manager will continuously create workers as needed.
-                This exists primarily to keep memory from getting fragmented
-                during copies.
+                ``None`` is unlimited, the worker is instead retired when it's
+                memory exceeds ``options.max_worker_rss`` .
+
+            activation_event (multiprocessing.Event, optional):
+                if provided, worker is a spare. it starts up, then waits
+                for :py:meth:`activate` before it claims jobs.
+
+            ratelimiter (ratelimiter.RateLimiter, optional):
+                bytes/files per second budget, shared by all workers.
         """
-        super(_MultiProcessCopierWorker, self).__init__(*args, **kwargs)
+        super(_CopierWorker, self).__init__(*args, **kwargs)
 
-        self._joblist = joblist
-        self._started_queue = started_queue
-        self._completed_queue = completed_queue
-        self._error_queue = error_queue
+        self._jobtable = jobtable
+        self._jobqueue = jobqueue
+        self._results = results
         self._device_full_event = device_full_event
         self.options = options
 
         self.maxtasks = maxtasks
+        self._activation_event = activation_event
+        self._ratelimiter = ratelimiter
+
+        # seconds an idle worker blocks waiting for jobs, before re-checking `device_full_event`
+        # (queued jobs, poison pills wake it immediately)
+        self.idle_timeout = 1.0
+
+        self._prefetcher = pagecache.Prefetcher(options.prefetch_files, options.prefetch_bytes)
+        self._dircache = dircache.DirectoryCache(options.dst_directory_cache_size)
 
     def run(self, maxloops=-1):
         """ Main loop.
@@ -415,9 +692,27 @@ class _MultiProcessCopierWorker(multiprocessing.Process):
         Returns:
             int: number of loops ran before exit.
         """
+        if self._activation_event is not None:
+            self._activation_event.wait()
+
+        try:
+            return self._copy_queued_files(maxloops)
+        finally:
+            self._dircache.close()
+            # results are buffered, send whatever remains before exit.
+            self._results.write(-1, resultchannel.EXITED, bytes=memory.peak_rss_bytes() or 0)
+            self._results.flush()
+
+    def activate(self):
+        """ Lets a spare worker begin claiming jobs.
+        """
+        if self._activation_event is not None:
+            self._activation_event.set()
+
+    def _copy_queued_files(self, maxloops=-1):
         loop_count = 0
         files_processed = 0
-        while files_processed < self.maxtasks:
+        while True:
             # for testing
             if maxloops - loop_count == 0:
                 return loop_count
@@ -427,46 +722,253 @@ class _MultiProcessCopierWorker(multiprocessing.Process):
                 logger.debug('Process Exit, device full')
                 return loop_count
 
-            # try retrieving next item from list, loop if unavailable
-            try:
-                data = self._joblist.pop(0)
-            except IndexError:
-                time.sleep(0.2)
+            # help copy chunks of large files before starting another file
+            chunk = self._jobqueue.claim_chunk()
+            if chunk is not None:
+                # buffered results are only sent on the next write, do not hold them during the copy
+                self._results.flush()
+                if not self._copy_chunk(*chunk):
+                    return loop_count
+                files_processed += 1
                 loop_count += 1
+                if self._retire_if_needed(files_processed):
+                    return loop_count
                 continue
 
+            # try claiming next index (or batch of small files) from queue
+            # (with the indexes after it that no other worker has read ahead)
+            prefetch = []
+            claim_kwargs = dict(count=self.options.small_file_batch_size, batchable=self._is_small_file,
+                                prefetch=prefetch)
+            indexes = self._jobqueue.claim(**claim_kwargs)
+
+            # nothing queued, send buffered results before we wait for a job
+            if indexes == []:
+                self._results.flush()
+                indexes = self._jobqueue.claim(timeout=self.idle_timeout, **claim_kwargs)
+
             # `None` is poison pill, causing exit
-            if data is None:
+            if indexes is None:
                 return loop_count
 
-            # inform wip queue that job started
-            self._started_queue.put(data)
+            if not indexes:
+                loop_count += 1
+                continue
 
-            # otherwise data is a single copyfile dict.
+            self._prefetch(prefetch)
             try:
-                kwargs = dict(mtime=self.options.compare_mtime,
-                              size=self.options.compare_size,
-                              checksum=self.options.compare_checksum)
-                if not os.path.isfile(data.dst):
-                    filesystem.copyfile(src=data.src, dst=data.dst, reraise=True, log_errors=False)
-                    filesystem.copyfilestat(src=data.src, dst=data.dst)
-                elif filesystem.files_different(data.src, data.dst, **kwargs):
-                    filesystem.copyfile(src=data.src, dst=data.dst, reraise=True, log_errors=False)
-                    filesystem.copyfilestat(src=data.src, dst=data.dst)
-                self._completed_queue.put(data)
-            except(OSError) as exc:
-                if not self._exception_indicates_device_full(exc):
-                    self._error_queue.put(data)
-                    raise
-                self._device_full_event.set()
+                if len(indexes) == 1:
+                    # inform main process that job started (now, not after the copy, so
+                    # it's progress and device-full handling know what is being copied)
+                    self._results.write(indexes[0], resultchannel.STARTED)
+                    self._results.flush()
+                    copied = self._copy(self._jobtable[indexes[0]])
+                else:
+                    copied = self._copy_batch(indexes)
+            finally:
+                # frees our read from the source device
+                self._jobqueue.release(indexes[0])
+            if not copied:
                 return loop_count
 
             # increment loop count, so we can kill worker, and release memory
+            # (a batch of small files counts as a single task)
             files_processed += 1
             loop_count += 1
+            if self._retire_if_needed(files_processed):
+                return loop_count
+
+    def _retire_if_needed(self, files_processed):
+        """ Informs main process this worker is exiting to release memory, if it should.
+
+        Returns:
+            bool: ``True`` if the worker should exit.
+        """
+        if self.maxtasks is not None and files_processed >= self.maxtasks:
+            logger.debug('Worker maxtasks reached. Exiting')
+            self._results.write(-1, resultchannel.RETIRED, bytes=memory.rss_bytes() or 0,
+                                errno=resultchannel.RETIRED_MAX_TASKS)
+            return True
+
+        max_rss = self.options.max_worker_rss
+        if max_rss is None:
+            return False
+        rss = memory.rss_bytes()
+        if rss is None or rss <= max_rss:
+            return False
+
+        # freed memory is often only held by the allocator, try returning it before giving up
+        if self.options.worker_malloc_trim and memory.malloc_trim():
+            rss = memory.rss_bytes()
+            if rss <= max_rss:
+                return False
+
+        logger.debug('Worker RSS {} exceeds max_worker_rss {}. Exiting'.format(rss, max_rss))
+        self._results.write(-1, resultchannel.RETIRED, bytes=rss, errno=resultchannel.RETIRED_MAX_RSS)
+        return True
+
+    def _prefetch(self, indexes):
+        """ Asks the kernel to read ahead the files that will be claimed next, while we copy.
+        """
+        if not indexes:
+            return
+        self._prefetcher.prefetch([self._jobtable[index] for index in indexes])
 
-        logger.debug('Worker maxtasks reached. Exiting')
-        return loop_count
+    def _copy_batch(self, indexes):
+        """ Copies a batch of small files, sending their results in a single message.
+
+        Notes:
+            If a file fails, the rest of the batch is still copied before the error is raised.
+            If the device is full, the rest of the batch is not reported, and is
+            queued again by the main process with every other uncopied file.
+
+        Returns:
+            bool: ``False`` if the device is full.
+        """
+        batch = [self._jobtable[index] for index in indexes]
+        error = None
+        with self._results.deferred():
+            for data in batch:
+                self._results.write(data.index, resultchannel.STARTED)
+                try:
+                    copied = self._copy(data)
+                except(OSError) as exc:
+                    # (error is already reported)
+                    error = error or exc
+                    continue
+                if not copied:
+                    return False
+        if error is not None:
+            raise error
+        return True
+
+    def _is_small_file(self, index):
+        return self._jobtable.filesize(index) < self.options.small_file_threshold
+
+    def _copy(self, data):
+        """ Copies a file, or splits it into chunks that all workers help copy.
+        Only the file's stats are copied, parent directory stats are copied
+        once the volume is complete (see :py:meth:`MultiProcessCopier._copy_directory_stats` ).
+
+        Args:
+            data (copyfile.CopyFile):
+                the file to copy
+
+        Returns:
+            bool: ``False`` if the device is full.
+        """
+        started_at = time.monotonic()
+        try:
+            kwargs = dict(mtime=self.options.compare_mtime,
+                          size=self.options.compare_size,
+                          checksum=self.options.compare_checksum,
+                          mtime_tolerance=self.options.compare_mtime_tolerance)
+            if self.options.trust_dst_files and self.options.compare_mtime:
+                # files are only renamed into place once they (and their stats) are completely written.
+                kwargs.update(size=True, checksum=False)
+            backend = self._copy_backend(data)
+            copied_bytes = 0
+            if filesystem.files_different(data.src, data.dst, stat_a=copyfile.srcstat(data), **kwargs):
+                # whoever copies the last chunk reports the file complete
+                if self._publish_chunks(data):
+                    return True
+                throttle = self._throttle(files=1)
+                filesystem.copyfile(src=data.src, dst=data.dst, reraise=True, log_errors=False, backend=backend,
+                                    drop_cache=self.options.drop_page_cache, throttle=throttle, compare=False,
+                                    dircache=self._dircache, copystat=True, srcstat=copyfile.srcstat(data))
+                copied_bytes = data.bytes
+            self._results.write(data.index, resultchannel.COMPLETED,
+                                bytes=copied_bytes, duration=time.monotonic() - started_at)
+        except(OSError) as exc:
+            if self._exception_indicates_device_full(exc):
+                self._device_full_event.set()
+                return False
+            self._results.write(data.index, resultchannel.ERROR,
+                                duration=time.monotonic() - started_at, errno=exc.errno)
+            raise
+        return True
+
+    def _publish_chunks(self, data):
+        """ Splits large files into chunks that can be copied by several workers at once.
+
+        Returns:
+            bool: ``True`` if the file was split into chunks.
+        """
+        chunk_size = self.options.chunked_copy_chunk_size
+        if data.bytes < self.options.chunked_copy_threshold or data.bytes <= chunk_size:
+            return False
+
+        # positional writes are required
+        if not hasattr(os, 'pwrite'):
+            return False
+
+        num_chunks = -(-data.bytes // chunk_size)
+        filesystem.preallocate(filesystem.partial_path(data.dst), data.bytes)
+        return self._jobqueue.publish_chunks(data.index, num_chunks)
+
+    def _copy_chunk(self, index, chunk):
+        """ Copies a single chunk of a large file.
+
+        Returns:
+            bool: ``False`` if the device is full.
+        """
+        data = self._jobtable[index]
+        chunk_size = self.options.chunked_copy_chunk_size
+        offset = chunk * chunk_size
+        started_at = time.monotonic()
+        try:
+            partial = filesystem.partial_path(data.dst)
+            filesystem.copyfile_range(data.src, partial, offset, min(chunk_size, data.bytes - offset),
+                                      drop_cache=self.options.drop_page_cache, direct=self._use_direct_io(data),
+                                      throttle=self._throttle())
+            if self._jobqueue.complete_chunk(index):
+                # stats are read from the source again, it may have changed since it was resolved
+                # (a single stat is negligible next to copying a chunked file)
+                filesystem.copyfilestat(src=data.src, dst=partial, parents=False)
+                filesystem.finish_partial(data.dst)
+                self._results.write(data.index, resultchannel.COMPLETED,
+                                    bytes=data.bytes, duration=time.monotonic() - started_at)
+        except(OSError) as exc:
+            if self._exception_indicates_device_full(exc):
+                self._device_full_event.set()
+                return False
+
+            # other workers may also fail copying chunks of this file, only report it once.
+            if self._jobqueue.fail_chunks(index):
+                filesystem.remove_partial(data.dst)
+                self._results.write(data.index, resultchannel.ERROR,
+                                    duration=time.monotonic() - started_at, errno=exc.errno)
+            raise
+        return True
+
+    def _throttle(self, files=0):
+        """ Takes `files` from the rate limiter (sleeping if over budget).
+
+        Returns:
+            callable, None: throttle for copies to call after each chunk, or ``None`` if bytes are not limited.
+        """
+        if self._ratelimiter is None:
+            return None
+        if files:
+            self._ratelimiter.throttle(files=files)
+        if self._ratelimiter.limits_bytes():
+            return self._ratelimiter.throttle
+        return None
+
+    def _copy_backend(self, data):
+        """ Returns name of backend that should copy file contents for copyfile `data` .
+        """
+        if self._use_direct_io(data):
+            return copybackends.DIRECT
+        if self.options.copy_profile:
+            return self.options.copy_profile.backend_for(data.bytes)
+        if self.options.copy_backend == copybackends.AUTO:
+            return copybackends.KERNEL
+        return self.options.copy_backend
+
+    def _use_direct_io(self, data):
+        threshold = self.options.direct_io_threshold
+        return threshold is not None and data.bytes >= threshold
 
     def _exception_indicates_device_full(self, os_error):
         """
@@ -482,3 +984,6 @@ class _MultiProcessCopierWorker(multiprocessing.Process):
         return False
 
 
+class _MultiProcessCopierWorker(_CopierWorker, multiprocessing.Process):
+    """ Worker process (see :py:class:`_CopierWorker` ).
+    """
@@ -0,0 +1,86 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import logging
+import multiprocessing
+import threading
+from multivolumecopy.copiers import multiprocesscopier
+
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadPoolCopier(multiprocesscopier.MultiProcessCopier):
+    """ Performs file copies using a pool of threads within this process.
+
+    Notes:
+        * Copying is mostly spent in syscalls that release the GIL, so threads copy concurrently
+          without starting an interpreter per worker (or the memory each costs).
+        * Resolving, reconciliation, device-full handling and volume rollover are
+          the same as :py:class:`multiprocesscopier.MultiProcessCopier` .
+        * Workers share this process's memory, so they are never retired to release it.
+    """
+    def __init__(self, resolver, options=None, reconciler=None):
+        """
+        Args:
+            resolver (resolver.Resolver):
+                Resolver, determines files to be copied.
+
+            options (CopyOptions, None):
+                Options to use while performing copy
+        """
+        super(ThreadPoolCopier, self).__init__(resolver, options, reconciler)
+        self.manager = _ThreadPoolCopierWorkerManager(self.jobtable,
+                                                      self.jobqueue,
+                                                      self.results,
+                                                      self.device_full_lock,
+                                                      self.options,
+                                                      self.ratelimiter)
+
+
+class _ThreadPoolCopierWorkerManager(multiprocesscopier._MultiProcessCopierWorkerManager):
+    """ Manages worker threads, restarting them
+    automatically when they exit (while iterating through this object).
+    """
+    def _num_spares(self):
+        # starting a thread is cheap
+        return 0
+
+    def _start_worker(self, spare=False):
+        worker = _ThreadPoolCopierWorker(self._jobtable,
+                                         self._jobqueue,
+                                         self._results.writer(self.options.result_batch_size,
+                                                              self.options.result_flush_interval),
+                                         self._device_full_lock,
+                                         self.options,
+                                         ratelimiter=self._ratelimiter)
+        worker.start()
+        return worker
+
+    def terminate(self):
+        # threads cannot be killed, they exit after their current file once stopped.
+        logger.debug('Worker threads cannot be terminated, waiting for them to stop...')
+
+
+class _ThreadPoolCopierWorker(multiprocesscopier._CopierWorker, threading.Thread):
+    """ Worker thread (see :py:class:`multiprocesscopier._CopierWorker` ).
+    """
+    def __init__(self, *args, **kwargs):
+        super(_ThreadPoolCopierWorker, self).__init__(*args, **kwargs)
+        self.daemon = True
+
+        # becomes readable when the thread exits (like :py:attr:`multiprocessing.Process.sentinel` )
+        (self.sentinel, self._sentinel_writer) = multiprocessing.Pipe(duplex=False)
+
+    def run(self, maxloops=-1):
+        try:
+            return super(_ThreadPoolCopierWorker, self).run(maxloops)
+        finally:
+            self._sentinel_writer.close()
+
+    def close(self):
+        self.sentinel.close()
+
+    def _retire_if_needed(self, files_processed):
+        # memory is shared with every other thread, exiting would not release it.
+        return False
@@ -0,0 +1,391 @@
+"""
+Methods of copying the contents of one open file to another.
+
+Every backend receives unbuffered source/destination files, and copies from
+their current offsets to the end of the source file (leaving both offsets at the end).
+This lets a backend that fails partway be picked up by the next backend in a chain.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import collections
+import errno
+import logging
+import mmap
+import os
+import shutil
+import threading
+try:
+    import queue
+except(ImportError):
+    import Queue as queue
+
+
+logger = logging.getLogger(__name__)
+
+# backends
+SHUTIL = 'shutil'
+COPY_FILE_RANGE = 'copy_file_range'
+SENDFILE = 'sendfile'
+MMAP = 'mmap'
+PREADV = 'preadv'
+PIPELINE = 'pipeline'
+READWRITE = 'readwrite'
+DIRECT = 'direct'  # O_DIRECT, bypassing the page cache (see :py:func:`copy_direct` )
+
+# chains of backends (see :py:func:`chain` )
+KERNEL = 'kernel'  # copy_file_range, then sendfile, then readwrite
+AUTO = 'auto'      # chosen per file-size class by benchmarking (see :py:mod:`multivolumecopy.copyprofile` )
+
+# errors indicating a backend is not supported for this src/dst (we fall back to the next backend)
+UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EBADF,
+    errno.ENODEV,
+    errno.ENOTSUP,
+    errno.EOPNOTSUPP,
+    errno.ENOTSOCK,
+}
+
+# userspace backends never use a buffer larger than this (`chunk_size` is intended for kernel-side copies)
+MAX_BUFFER_SIZE = 8 * 1024 * 1024
+
+# number of buffers `preadv` reads into with each syscall
+_PREADV_NUM_BUFFERS = 4
+
+# number of buffers in the ring `pipeline` reads into while the previous buffers are written
+_PIPELINE_NUM_BUFFERS = 3
+
+# O_DIRECT offsets, lengths and buffer addresses must be multiples of the device's logical block size.
+# (mmap-allocated buffers are page-aligned)
+DIRECT_ALIGNMENT = 4096
+DIRECT_BUFFER_SIZE = 8 * 1024 * 1024
+
+_local = threading.local()  # buffers reused by every copy made on a thread (see :py:func:`reusable_buffer` )
+
+_BACKENDS = collections.OrderedDict()
+
+
+def register(name):
+    """ Decorator, registers a backend function under `name` .
+
+    Backends are called with ``(fsrc, fdst, chunk_size, throttle)`` , and raise an
+    :py:class:`OSError` with an errno from :py:data:`UNSUPPORTED_ERRNOS`
+    if they cannot copy this pair of files. ``throttle(bytes)`` is called after each chunk is copied.
+    """
+    def wrapper(func):
+        _BACKENDS[name] = func
+        return func
+    return wrapper
+
+
+def names():
+    """ Returns names of all registered backends.
+    """
+    return list(_BACKENDS)
+
+
+def chain(name):
+    """ Returns the backends to try (in order) for backend/chain `name` .
+    (every chain ends in :py:data:`READWRITE` , which works for any pair of files)
+
+    Returns:
+        tuple: ``(ex: ('copy_file_range', 'sendfile', 'readwrite'))``
+    """
+    if name == KERNEL:
+        return (COPY_FILE_RANGE, SENDFILE, READWRITE)
+    if name not in _BACKENDS:
+        raise KeyError('Unknown copy backend: {}'.format(name))
+    if name == READWRITE:
+        return (READWRITE,)
+    return (name, READWRITE)
+
+
+def reusable_buffer(size, slot='default'):
+    """ Returns a writable buffer of `size` bytes. The same memory is returned to every copy
+    made by this thread (it only grows), so copying does not allocate once it reaches a steady state.
+    (a worker's heap does not fragment from large transient buffers)
+
+    Args:
+        size (int): bytes required
+        slot (str, optional): buffers used at the same time need different slots
+
+    Returns:
+        memoryview: view of exactly `size` bytes
+    """
+    buffers = getattr(_local, 'buffers', None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+    buf = buffers.get(slot)
+    if buf is None or len(buf) < size:
+        buf = buffers[slot] = bytearray(size)
+    return memoryview(buf)[:size]
+
+
+def copy(fsrc, fdst, backends, chunk_size, throttle=None):
+    """ Copies `fsrc` to `fdst` , trying each backend until one succeeds.
+
+    Args:
+        fsrc (io.FileIO): unbuffered source file, opened for reading.
+        fdst (io.FileIO): unbuffered destination file, opened for writing.
+        backends (tuple): names of backends to try, in order ``(see :py:func:`chain` )``
+        chunk_size (int): bytes to request per syscall
+        throttle (callable, optional): ``(ex: ratelimiter.RateLimiter.throttle)``
+            called with the number of bytes copied, after each chunk.
+
+    Returns:
+        str: name of the backend that copied the file.
+    """
+    throttle = throttle or _unthrottled
+    for name in backends:
+        try:
+            _BACKENDS[name](fsrc, fdst, chunk_size, throttle)
+            return name
+        except(OSError) as exc:
+            if exc.errno not in UNSUPPORTED_ERRNOS or name == backends[-1]:
+                raise
+            logger.debug('{} unsupported, falling back ({}): "{}"'.format(name, exc, fsrc.name))
+
+
+def copy_range(fsrc, fdst, offset, length, chunk_size, throttle=None):
+    """ Copies `length` bytes at `offset` in `fsrc` to the same offset in `fdst` .
+    Uses positional I/O (file offsets are not used or moved), so several
+    processes can copy different ranges of the same file at once.
+
+    Returns:
+        str: name of the backend that copied the range.
+    """
+    throttle = throttle or _unthrottled
+    end = offset + length
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while offset < end:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(end - offset, chunk_size), offset, offset)
+                if not copied:
+                    return COPY_FILE_RANGE
+                offset += copied
+                throttle(copied)
+            return COPY_FILE_RANGE
+        except(OSError) as exc:
+            if exc.errno not in UNSUPPORTED_ERRNOS:
+                raise
+            logger.debug('{} unsupported, falling back ({}): "{}"'.format(COPY_FILE_RANGE, exc, fsrc.name))
+
+    view = reusable_buffer(min(chunk_size, MAX_BUFFER_SIZE))
+    while offset < end:
+        read = os.preadv(fsrc.fileno(), [view[:min(end - offset, len(view))]], offset)
+        if not read:
+            break
+        written = 0
+        while written < read:
+            written += os.pwrite(fdst.fileno(), view[written:read], offset + written)
+        offset += read
+        throttle(read)
+    return PREADV
+
+
+def copy_direct(src_fd, dst_fd, offset, length, throttle=None):
+    """ Copies `length` bytes at `offset` between file descriptors opened with ``O_DIRECT`` ,
+    through a reusable aligned buffer.
+
+    Notes:
+        If the source ends within the range, the last block is written padded to the alignment,
+        the caller must truncate the destination to the source's size.
+
+    Raises:
+        OSError: ``EINVAL`` if `offset` is not aligned, or the filesystem refuses direct I/O.
+
+    Returns:
+        int: bytes read from the source.
+    """
+    if offset % DIRECT_ALIGNMENT:
+        raise OSError(errno.EINVAL, 'O_DIRECT offset is not aligned: {}'.format(offset))
+    direct_buffer = getattr(_local, 'direct_buffer', None)
+    if direct_buffer is None:
+        direct_buffer = _local.direct_buffer = mmap.mmap(-1, DIRECT_BUFFER_SIZE)
+
+    throttle = throttle or _unthrottled
+    length = max(min(length, os.fstat(src_fd).st_size - offset), 0)
+    view = memoryview(direct_buffer)
+    try:
+        copied = 0
+        while copied < length:
+            request = min(length - copied, DIRECT_BUFFER_SIZE)
+            request += -request % DIRECT_ALIGNMENT
+            read = os.preadv(src_fd, [view[:request]], offset + copied)
+            if not read:
+                break
+            # (a short read before the end of the range fails the next read, it is unaligned)
+            aligned = read + (-read % DIRECT_ALIGNMENT)
+            written = 0
+            while written < aligned:
+                written += os.pwrite(dst_fd, view[written:aligned], offset + copied + written)
+            copied += read
+            throttle(read)
+        return min(copied, length)
+    finally:
+        view.release()
+
+
+def _unthrottled(bytes):
+    pass
+
+
+class _ThrottledReader(object):
+    # file-like wrapper, for copies we do not control the loop of (ex: shutil.copyfileobj)
+    def __init__(self, fd, throttle):
+        self._fd = fd
+        self._throttle = throttle
+
+    def read(self, size=-1):
+        data = self._fd.read(size)
+        self._throttle(len(data))
+        return data
+
+
+@register(SHUTIL)
+def _shutil(fsrc, fdst, chunk_size, throttle):
+    if throttle is not _unthrottled:
+        fsrc = _ThrottledReader(fsrc, throttle)
+    # buffered writer on a duplicate fd, so short writes are retried (and offset is shared)
+    with os.fdopen(os.dup(fdst.fileno()), 'wb') as buffered_dst:
+        shutil.copyfileobj(fsrc, buffered_dst, min(chunk_size, MAX_BUFFER_SIZE))
+
+
+@register(COPY_FILE_RANGE)
+def _copy_file_range(fsrc, fdst, chunk_size, throttle):
+    if not hasattr(os, 'copy_file_range'):
+        raise OSError(errno.ENOSYS, 'os.copy_file_range() is not available')
+    while True:
+        copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), chunk_size)
+        if not copied:
+            return
+        throttle(copied)
+
+
+@register(SENDFILE)
+def _sendfile(fsrc, fdst, chunk_size, throttle):
+    if not hasattr(os, 'sendfile'):
+        raise OSError(errno.ENOSYS, 'os.sendfile() is not available')
+    while True:
+        copied = os.sendfile(fdst.fileno(), fsrc.fileno(), None, chunk_size)
+        if not copied:
+            return
+        throttle(copied)
+
+
+@register(MMAP)
+def _mmap(fsrc, fdst, chunk_size, throttle):
+    offset = os.lseek(fsrc.fileno(), 0, os.SEEK_CUR)
+    size = os.fstat(fsrc.fileno()).st_size
+    if offset >= size:
+        return
+
+    with mmap.mmap(fsrc.fileno(), size, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+        try:
+            while offset < size:
+                stop = min(offset + min(chunk_size, MAX_BUFFER_SIZE), size)
+                chunk_start = offset
+                while offset < stop:
+                    offset += fdst.write(view[offset:stop])
+                # keep source offset current, in case we fail partway
+                os.lseek(fsrc.fileno(), offset, os.SEEK_SET)
+                throttle(offset - chunk_start)
+        finally:
+            view.release()
+
+
+@register(PREADV)
+def _preadv(fsrc, fdst, chunk_size, throttle):
+    if not hasattr(os, 'preadv'):
+        raise OSError(errno.ENOSYS, 'os.preadv() is not available')
+
+    # one reusable buffer, split into several iovecs
+    buffer_size = max(min(chunk_size, MAX_BUFFER_SIZE) // _PREADV_NUM_BUFFERS, 1)
+    view = reusable_buffer(buffer_size * _PREADV_NUM_BUFFERS)
+    buffers = [view[i * buffer_size:(i + 1) * buffer_size] for i in range(_PREADV_NUM_BUFFERS)]
+
+    src_offset = os.lseek(fsrc.fileno(), 0, os.SEEK_CUR)
+    dst_offset = os.lseek(fdst.fileno(), 0, os.SEEK_CUR)
+    try:
+        while True:
+            read = os.preadv(fsrc.fileno(), buffers, src_offset)
+            if not read:
+                return
+            written = 0
+            while written < read:
+                chunk_written = os.pwrite(fdst.fileno(), view[written:read], dst_offset)
+                written += chunk_written
+                src_offset += chunk_written
+                dst_offset += chunk_written
+            throttle(read)
+    finally:
+        # pread/pwrite do not move offsets
+        os.lseek(fsrc.fileno(), src_offset, os.SEEK_SET)
+        os.lseek(fdst.fileno(), dst_offset, os.SEEK_SET)
+
+
+@register(PIPELINE)
+def _pipeline(fsrc, fdst, chunk_size, throttle):
+    # a reader thread fills a ring of buffers while this thread writes them,
+    # both release the GIL in their syscalls, so reads/writes to different devices overlap.
+    buffer_size = max(min(chunk_size, MAX_BUFFER_SIZE) // _PIPELINE_NUM_BUFFERS, 1)
+    empty = queue.Queue()
+    filled = queue.Queue()
+    for i in range(_PIPELINE_NUM_BUFFERS):
+        empty.put(reusable_buffer(buffer_size, slot='pipeline{}'.format(i)))
+    errors = []
+
+    def read():
+        try:
+            while True:
+                buf = empty.get()
+                if buf is None:
+                    return
+                read = fsrc.readinto(buf)
+                filled.put((buf, read))
+                if not read:
+                    return
+        except(BaseException) as exc:
+            errors.append(exc)
+            filled.put((None, 0))
+
+    src_offset = os.lseek(fsrc.fileno(), 0, os.SEEK_CUR)
+    reader = threading.Thread(target=read, name='pipeline-reader')
+    reader.daemon = True
+    reader.start()
+    try:
+        while True:
+            (buf, read) = filled.get()
+            if not read:
+                break
+            written = 0
+            while written < read:
+                chunk_written = fdst.write(buf[written:read])
+                written += chunk_written
+                src_offset += chunk_written
+            empty.put(buf)
+            throttle(read)
+    finally:
+        empty.put(None)
+        reader.join()
+        # the reader is ahead of what was written, in case we fail partway
+        os.lseek(fsrc.fileno(), src_offset, os.SEEK_SET)
+    if errors:
+        raise errors[0]
+
+
+@register(READWRITE)
+def _readwrite(fsrc, fdst, chunk_size, throttle):
+    view = reusable_buffer(min(chunk_size, MAX_BUFFER_SIZE))
+    while True:
+        read = fsrc.readinto(view)
+        if not read:
+            return
+        written = 0
+        while written < read:
+            written += fdst.write(view[written:read])
+        throttle(read)
@@ -1,4 +1,22 @@
 import collections
 
 
-CopyFile = collections.namedtuple('CopyFile', ('src', 'dst', 'relpath', 'bytes', 'index'))
+# source stat fields (mtime_ns, mode, inode, device) are captured while resolving
+# (``None`` if unknown, ex: loaded from a jobfile), so workers do not need to stat the source again.
+CopyFile = collections.namedtuple('CopyFile', ('src', 'dst', 'relpath', 'bytes', 'index',
+                                               'mtime_ns', 'mode', 'inode', 'device'),
+                                  defaults=(None, None, None, None))
+
+# the fields of a `os.stat_result` that a `CopyFile` can carry
+SrcStat = collections.namedtuple('SrcStat', ('st_size', 'st_mtime_ns', 'st_mode', 'st_ino', 'st_dev'))
+
+
+def srcstat(copyfile):
+    """ Returns the stat of a copyfile's source, captured when it was resolved.
+
+    Returns:
+        SrcStat, None: ``None`` if stat was not captured.
+    """
+    if copyfile.mtime_ns is None:
+        return None
+    return SrcStat(copyfile.bytes, copyfile.mtime_ns, copyfile.mode, copyfile.inode, copyfile.device)
@@ -1,4 +1,4 @@
-from multivolumecopy import filesystem
+from multivolumecopy import copybackends, filesystem
 import multiprocessing
 import numbers
 import os
@@ -28,10 +28,62 @@ class CopyOptions(object):
         # file that current index is recorded to [TODO]
         self.indexfile = os.path.abspath('./.mvcopy-index')
 
-        # maximum copy operations a worker can live through.
+        # number of started workers kept waiting, to replace workers as they exit.
+        # (spawning a process and importing modules is slow, but spares cost memory)
+        self.spare_workers = 1
+
+        # a worker whose resident memory (bytes) exceeds this after a copy operation
+        # is restarted to free up memory. ``None`` disables the check.
+        # (first, `malloc_trim` is tried if `worker_malloc_trim` is set)
+        self.max_worker_rss = 256 * 1024 * 1024
+
+        # ask the C allocator to return freed memory to the OS before retiring a worker (glibc only)
+        self.worker_malloc_trim = True
+
+        # maximum copy operations a worker can live through. ``None`` is unlimited.
+        # (a single file, a chunk of a large file, or a batch of small files)
         # (afterwards it's process is restarted to free up memory)
-        # (this adds up quickly, watch your process in top/taskmanager)
-        self.max_worker_tasks = 5
+        self.max_worker_tasks = None
+
+        # consecutive files smaller than this (bytes) are claimed/copied by a worker in batches
+        # of up to `small_file_batch_size` files, and reported in a single message.
+        self.small_file_threshold = 64 * 1024
+        self.small_file_batch_size = 256
+
+        # before copying, each worker asks the kernel to read ahead the next files in the queue
+        # (up to `prefetch_files` files, and `prefetch_bytes` bytes). ``0`` disables prefetching.
+        self.prefetch_files = 8
+        self.prefetch_bytes = 64 * 1024 * 1024
+
+        # after a file is copied, tell the kernel it's source/destination pages will not be read again,
+        # so a large backup does not evict everything else from the page cache.
+        self.drop_page_cache = True
+
+        # files this size or larger (bytes) are copied with O_DIRECT, bypassing the page cache,
+        # so huge files do not evict data other programs are using. ``None`` disables it.
+        # (falls back to buffered copying on filesystems that refuse O_DIRECT)
+        self.direct_io_threshold = None
+
+        # limit the bytes read/written and files copied per second by all workers combined,
+        # so a background backup leaves bandwidth for other programs. ``None`` is unlimited.
+        # (rates can be changed while copying, see `multivolumecopy.ratelimiter` )
+        self.max_read_bytes_per_second = None
+        self.max_write_bytes_per_second = None
+        self.max_files_per_second = None
+
+        # destination directories each worker keeps open, creating files relative to them
+        # instead of resolving their full path (and calling mkdir) for every file. ``0`` disables it.
+        self.dst_directory_cache_size = 32
+
+        # workers send results to the main process in batches.
+        # (flushed after this many files, or once oldest result is this many seconds old)
+        self.result_batch_size = 64
+        self.result_flush_interval = 0.005
+
+        # files larger than this (bytes) are split into chunks
+        # that several workers copy at once.
+        self.chunked_copy_threshold = 1024 * 1024 * 1024
+        self.chunked_copy_chunk_size = 256 * 1024 * 1024
 
         # Desired number of worker processes to execute copies
         # more workers == more ram. Conservative is better.
@@ -40,12 +92,49 @@ class CopyOptions(object):
         else:
             self.num_workers = (multiprocessing.cpu_count() - 2)
 
+        # options that are chosen from the source/destination devices (ex: spinning disk, ssd, network)
+        # before copying, overwriting their values. empty disables tuning.
+        # (see `multivolumecopy.topology.TUNABLE_OPTIONS` )
+        self.device_tuning = set()
+
+        # when files are read from several source devices, workers copying from each device at once.
+        # ``None`` divides `num_workers` evenly between source devices, ``0`` is unlimited.
+        # (devices are interleaved for files that are expected to fit on the current volume)
+        self.max_readers_per_device = None
+
+        # copy files expected to fit on the current volume in the order they are stored on the source device
+        # (FIEMAP, or inode order), instead of alphabetically. reduces seeks on spinning disks.
+        # (files are still assigned to volumes alphabetically)
+        self.physical_order = False
+
+        # adjust number of workers (starting from `num_workers`) towards the highest
+        # measured throughput, within `min_workers` and `max_workers` .
+        # (throughput is measured over `autoscale_interval` seconds before each decision)
+        self.autoscale_workers = False
+        self.min_workers = 1
+        self.max_workers = max(multiprocessing.cpu_count() * 2, 4)
+        self.autoscale_interval = 2.0
+
         # Determine whether a copy is needed by comparing
         # src/dst of the followng attributes.
         self.compare_mtime = True
         self.compare_size = False
         self.compare_checksum = False
 
+        # files are written to a temporary name, and renamed once they (and their stats) are complete.
+        # if enabled, an existing destination file with the source's size/mtime is trusted to be complete,
+        # and skipped without comparing contents (even if `compare_checksum` ). (requires `compare_mtime` )
+        self.trust_dst_files = False
+
+        # seconds modified dates can differ by and be considered the same
+        # (filesystems store mtimes at different resolutions, ex: FAT is 2s)
+        self.compare_mtime_tolerance = 1.0
+
+        # Backend used to copy file contents (see `copybackends.names()` ).
+        # 'auto' benchmarks backends against the src/dst devices, and caches the result.
+        self.copy_backend = copybackends.KERNEL
+        self.copy_profile_cachefile = os.path.expanduser('~/.cache/mvcopy-copyprofiles.json')
+
         # Display Size Unit
         self.size_unit = 'G'
 
@@ -54,6 +143,9 @@ class CopyOptions(object):
         # ================
         self.output = None
 
+        # `copyprofile.CopyProfile` chosen when `copy_backend` is 'auto'
+        self.copy_profile = None
+
     def validate(self):
         """ Returns true if combination of options is valid. Sets :py:meth:`errors`
         """
@@ -0,0 +1,311 @@
+"""
+Chooses the fastest copy backend for each file-size class,
+by benchmarking backends against the actual source/destination devices.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import json
+import logging
+import os
+import tempfile
+import time
+from multivolumecopy import copybackends, filesystem, pagecache
+
+
+logger = logging.getLogger(__name__)
+
+# (size_class, files smaller than this many bytes belong to class)
+SIZE_CLASSES = (
+    ('small', 1024 * 1024),
+    ('medium', 64 * 1024 * 1024),
+    ('large', None),
+)
+
+# backends compared during calibration
+CANDIDATE_BACKENDS = (
+    copybackends.COPY_FILE_RANGE,
+    copybackends.SENDFILE,
+    copybackends.MMAP,
+    copybackends.PREADV,
+    copybackends.PIPELINE,
+    copybackends.SHUTIL,
+    copybackends.READWRITE,
+)
+
+# calibration stays short, files larger than this are not used as samples
+_MAX_SAMPLE_BYTES = 256 * 1024 * 1024
+
+# number of timed copies per backend (fastest is used)
+_CALIBRATION_ROUNDS = 2
+
+
+def size_class(filesize):
+    """ Returns the name of the size class a file of `filesize` bytes belongs to.
+    """
+    for (name, limit) in SIZE_CLASSES:
+        if limit is None or filesize < limit:
+            return name
+
+
+class CopyProfile(object):
+    """ The copy backend to use for each file-size class.
+
+    Example:
+
+        .. code-block:: python
+
+            profile = CopyProfile({'small': 'sendfile', 'large': 'copy_file_range'})
+            profile.backend_for(1024)
+            >>> 'sendfile'
+            profile.backend_for(50 * 1024 * 1024)  # (not calibrated)
+            >>> 'kernel'
+
+    """
+    def __init__(self, backends=None):
+        """ Constructor.
+
+        Args:
+            backends (dict, optional): ``(ex: {'small': 'sendfile', 'medium': 'mmap'})``
+                backend for each size class. size classes without a backend use :py:data:`copybackends.KERNEL`
+        """
+        self.backends = dict(backends or {})
+
+    def __eq__(self, other):
+        if not isinstance(other, CopyProfile):
+            return NotImplemented
+        return self.backends == other.backends
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.backends)
+
+    def backend_for(self, filesize):
+        """ Returns the name of the backend that should copy a file of `filesize` bytes.
+        """
+        return self.backends.get(size_class(filesize), copybackends.KERNEL)
+
+
+def profile_key(copyfiles, output):
+    """ Returns key identifying the source/destination devices of a copy job in the profile cache.
+
+    Returns:
+        str, None: ``(ex: '2049:2065')`` or ``None`` if no source files exist.
+    """
+    for copyfile in copyfiles:
+        try:
+            src_dev = os.stat(copyfile.src).st_dev
+        except(OSError):
+            continue
+        return '{}:{}'.format(src_dev, os.stat(output).st_dev)
+    return None
+
+
+def load_or_calibrate(copyfiles, output, cachefile, direct_io=False):
+    """ Returns the cached profile for these devices,
+    calibrating (and caching the result) if there isn't one.
+
+    Args:
+        copyfiles (tuple): A tuple of `copyfile.CopyFile` s
+        output (str): directory the backup is written to
+        cachefile (str): json file profiles are cached to (keyed by devices)
+        direct_io (bool, optional): also report direct I/O throughput when calibrating
+            (see :py:func:`compare_direct_io` )
+
+    Returns:
+        CopyProfile
+    """
+    if not os.path.isdir(output):
+        os.makedirs(output)
+
+    key = profile_key(copyfiles, output)
+    if key is None:
+        return CopyProfile()
+
+    cache = _read_cache(cachefile)
+    if key in cache:
+        logger.debug('Using cached copy profile for devices {}: {}'.format(key, cache[key]))
+        return CopyProfile(cache[key])
+
+    profile = calibrate(copyfiles, output, direct_io)
+    # (calibration failed, ex: device full. try again next time)
+    if profile.backends:
+        cache[key] = profile.backends
+        _write_cache(cachefile, cache)
+    return profile
+
+
+def calibrate(copyfiles, output, direct_io=False):
+    """ Times each backend copying a sample source file from each size class to `output` ,
+    and chooses the fastest.
+
+    Notes:
+        The sample is copied once before it is timed, so that every backend
+        reads it from the page cache. This compares the cost of each copy path
+        rather than the cost of the first read from disk.
+
+        Calibration is optional. If a sample cannot be copied (ex: device full, permissions),
+        it's size class uses the default backend.
+
+    Args:
+        direct_io (bool, optional): also report direct I/O throughput (see :py:func:`compare_direct_io` )
+
+    Returns:
+        CopyProfile
+    """
+    backends = {}
+    try:
+        (fd, tempdst) = tempfile.mkstemp(prefix='.mvcopy-calibrate-', dir=output)
+        os.close(fd)
+    except(OSError) as exc:
+        logger.warning('Unable to calibrate copy backends, using defaults: {}'.format(exc))
+        return CopyProfile()
+
+    try:
+        for (name, sample) in _find_samples(copyfiles).items():
+            try:
+                filesystem.copyfile_contents(sample.src, tempdst)  # warm page cache
+            except(OSError) as exc:
+                logger.warning('Unable to calibrate copy backend for {} files, using default: {}'.format(name, exc))
+                continue
+            timings = {}
+            for backend in CANDIDATE_BACKENDS:
+                duration = _time_backend(backend, sample.src, tempdst)
+                if duration is not None:
+                    timings[backend] = duration
+            if timings:
+                backends[name] = min(timings, key=timings.get)
+                logger.info('Copy backend for {} files: {} ({})'.format(name, backends[name], sample.src))
+        if direct_io:
+            compare_direct_io(copyfiles, tempdst)
+    finally:
+        _remove(tempdst)
+    return CopyProfile(backends)
+
+
+def compare_direct_io(copyfiles, tempdst):
+    """ Logs the throughput of direct I/O against buffered copying, for the largest sample source file.
+
+    Notes:
+        Unlike calibration, the source is evicted from the page cache before each copy,
+        since direct I/O always reads from the device.
+
+    Args:
+        copyfiles (tuple): A tuple of `copyfile.CopyFile` s
+        tempdst (str): file that samples are copied to (overwritten)
+
+    Returns:
+        dict: ``(ex: {'kernel': 104857600.0, 'direct': 209715200.0})`` bytes/s for each backend.
+            a backend is omitted if it is unsupported for these devices.
+    """
+    candidates = [copyfile for copyfile in copyfiles if 0 < copyfile.bytes <= _MAX_SAMPLE_BYTES]
+    sample = max(candidates, key=lambda copyfile: copyfile.bytes, default=None)
+    if sample is None or not os.path.isfile(sample.src):
+        return {}
+
+    throughput = {}
+    for backend in (copybackends.KERNEL, copybackends.DIRECT):
+        _evict(sample.src)
+        started_at = time.monotonic()
+        try:
+            used_backend = filesystem.copyfile_contents(sample.src, tempdst, backend)
+        except(OSError) as exc:
+            logger.debug('Copy backend {} failed during calibration: {}'.format(backend, exc))
+            continue
+        duration = time.monotonic() - started_at
+        if backend == copybackends.DIRECT and used_backend != backend:
+            continue
+        throughput[backend] = sample.bytes / duration if duration else float('inf')
+
+    logger.info('Direct I/O throughput: {}, buffered: {} ({})'.format(
+        _format_throughput(throughput.get(copybackends.DIRECT)),
+        _format_throughput(throughput.get(copybackends.KERNEL)),
+        sample.src,
+    ))
+    return throughput
+
+
+def _remove(filepath):
+    try:
+        os.remove(filepath)
+    except(OSError) as exc:
+        logger.warning('Unable to remove calibration file "{}": {}'.format(filepath, exc))
+
+
+def _evict(filepath):
+    try:
+        with open(filepath, 'rb') as fd:
+            pagecache.dontneed(fd.fileno())
+    except(OSError):
+        pass
+
+
+def _format_throughput(bytes_per_second):
+    if bytes_per_second is None:
+        return 'unsupported'
+    return '{:.1f} MiB/s'.format(bytes_per_second / (1024 * 1024))
+
+
+def _find_samples(copyfiles):
+    """ Returns the first existing source file in each size class.
+
+    Returns:
+        dict: ``{'small': CopyFile(...), 'medium': CopyFile(...)}``
+    """
+    samples = {}
+    for copyfile in copyfiles:
+        name = size_class(copyfile.bytes)
+        if name in samples or not copyfile.bytes or copyfile.bytes > _MAX_SAMPLE_BYTES:
+            continue
+        if not os.path.isfile(copyfile.src):
+            continue
+        samples[name] = copyfile
+        if len(samples) == len(SIZE_CLASSES):
+            break
+    return samples
+
+
+def _time_backend(backend, src, dst):
+    """ Returns fastest time (in seconds) `backend` copied `src` to `dst` ,
+    or ``None`` if the backend is unsupported for these files.
+    """
+    durations = []
+    for _ in range(_CALIBRATION_ROUNDS):
+        started_at = time.monotonic()
+        try:
+            used_backend = filesystem.copyfile_contents(src, dst, backend)
+        except(OSError) as exc:
+            logger.debug('Copy backend {} failed during calibration: {}'.format(backend, exc))
+            return None
+        # backend fell back to another backend
+        if used_backend != backend:
+            return None
+        durations.append(time.monotonic() - started_at)
+    return min(durations)
+
+
+def _read_cache(cachefile):
+    if not os.path.isfile(cachefile):
+        return {}
+    try:
+        with open(cachefile, 'r') as fd:
+            return json.load(fd)
+    except(ValueError, OSError):
+        logger.warning('Unable to read copy profile cache, ignoring: "{}"'.format(cachefile))
+        return {}
+
+
+def _write_cache(cachefile, cache):
+    try:
+        cachedir = os.path.dirname(cachefile)
+        if cachedir and not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+        with open(cachefile, 'w') as fd:
+            fd.write(json.dumps(cache, indent=2))
+    except(OSError):
+        logger.warning('Unable to write copy profile cache: "{}"'.format(cachefile))
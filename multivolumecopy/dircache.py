@@ -0,0 +1,86 @@
+"""
+Keeps destination directories open, so files can be created relative to them
+(``openat`` ) without resolving their full path, or calling ``mkdir`` , for every file.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import collections
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+def supported():
+    """ Returns ``True`` if this platform can open files relative to a directory file descriptor.
+    """
+    return os.open in os.supports_dir_fd and os.rename in os.supports_dir_fd and hasattr(os, 'O_DIRECTORY')
+
+
+class DirectoryCache(object):
+    """ Least-recently-used cache of open destination directories, created as they are requested.
+
+    Each worker has it's own cache. Descriptors refer to the directory on the device
+    that was mounted when it was opened, so the cache must not outlive the volume
+    (workers are stopped before each device swap).
+
+    Example:
+
+        .. code-block:: python
+
+            dircache = DirectoryCache(max_dirs=32)
+            dir_fd = dircache.open('/dst/movies')   # created if missing
+            fd = os.open('amelie.mkv', os.O_WRONLY | os.O_CREAT, dir_fd=dir_fd)
+            dircache.close()
+
+    """
+    def __init__(self, max_dirs=32):
+        """ Constructor.
+
+        Args:
+            max_dirs (int, optional): maximum directories kept open at once.
+        """
+        self.max_dirs = max_dirs
+        self._fds = collections.OrderedDict()  # {dirpath: fd}
+
+    def __len__(self):
+        return len(self._fds)
+
+    def open(self, dirpath):
+        """ Returns a file descriptor for a directory, creating it (and it's parents) if it does not exist.
+
+        Args:
+            dirpath (str): ``(ex: '/dst/movies')``
+
+        Returns:
+            int, None: directory file descriptor, or ``None`` if unsupported (the directory is still created).
+        """
+        fd = self._fds.get(dirpath)
+        if fd is not None:
+            self._fds.move_to_end(dirpath)
+            return fd
+
+        if not self.max_dirs or not supported():
+            os.makedirs(dirpath, exist_ok=True)
+            return None
+
+        try:
+            fd = os.open(dirpath, os.O_RDONLY | os.O_DIRECTORY)
+        except(FileNotFoundError):
+            os.makedirs(dirpath, exist_ok=True)
+            fd = os.open(dirpath, os.O_RDONLY | os.O_DIRECTORY)
+
+        self._fds[dirpath] = fd
+        while len(self._fds) > self.max_dirs:
+            (_, evicted_fd) = self._fds.popitem(last=False)
+            os.close(evicted_fd)
+        return fd
+
+    def close(self):
+        """ Closes all cached directories.
+        """
+        while self._fds:
+            (_, fd) = self._fds.popitem()
+            os.close(fd)
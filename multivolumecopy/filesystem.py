@@ -5,10 +5,16 @@ Tools for working with files/filesystem.
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
+import concurrent.futures
+import errno
+import hashlib
 import logging
 import os
 import re
 import shutil
+import stat
+import struct
+from multivolumecopy import copybackends, pagecache
 
 
 logger = logging.getLogger(__name__)
@@ -20,6 +26,27 @@ _UNIT_TO_BYTES = (
     (('B', ''), 1),
 )
 
+# kernel-side copies are requested in chunks of at least/at most this size
+_MIN_CHUNK_SIZE = 8 * 1024 * 1024
+_MAX_CHUNK_SIZE = 1024 * 1024 * 1024
+
+# files are written to a hidden name in their destination directory, and renamed once complete
+_PARTIAL_SUFFIX = '.mvcopy-partial'
+_NAME_MAX = 255
+
+# contents are compared in chunks of this size (see :py:func:`contents_different` )
+_COMPARE_CHUNK_SIZE = 1024 * 1024
+
+# throttled copies use smaller chunks, so the rate limit is applied smoothly
+_THROTTLED_CHUNK_SIZE = 1024 * 1024
+
+# linux FS_IOC_FIEMAP ioctl, requesting the first extent of a file
+_FS_IOC_FIEMAP = 0xC020660B
+# struct fiemap: fm_start, fm_length, fm_flags, fm_mapped_extents, fm_extent_count, fm_reserved
+_FIEMAP = struct.Struct('=QQIIII')
+# struct fiemap_extent: fe_logical, fe_physical, fe_length, fe_reserved64[2], fe_flags, fe_reserved[3]
+_FIEMAP_EXTENT = struct.Struct('=QQQQQIIII')
+
 
 def size_to_bytes(size):
     """ Converts a string representation of a unit to a size in bytes.
@@ -107,6 +134,23 @@ def volume_free(output):
     return avail_bytes
 
 
+def volume_block_size(output):
+    """ Obtains the size of the blocks files are allocated in, on the volume (on which directory `output` resides).
+
+    Returns:
+        int: size in bytes
+    """
+    return os.statvfs(output).f_frsize
+
+
+def allocated_size(size, block_size):
+    """ Returns the bytes a file of `size` bytes occupies, when allocated in blocks of `block_size` .
+    """
+    if block_size <= 0:
+        return size
+    return -(-size // block_size) * block_size
+
+
 # TODO DELETE ME
 def backup_bytes(output):
     """ Obtains the total size occupied by the files under provided directory `output` .
@@ -180,40 +224,104 @@ def get_mount(filepath):
     return path
 
 
-def files_different(file_a, file_b, mtime=True, size=True, checksum=False):
+def files_different(file_a, file_b, mtime=True, size=True, checksum=False, mtime_tolerance=1.0, stat_a=None):
     """ Returns ``True`` if the provided files are not the same.
 
+    Each file is stat-ed once. The cheap comparisons (size, mtime) are made first,
+    contents are only compared if they did not already find a difference.
+
     Args:
         file_a (str): path to the first file.
         file_b (str): path to the second file.
+            (``True`` is returned if it does not exist, or is not a file)
         mtime (bool, optional): Compare the last-modified dates
         size (bool, optional): Compare the file-sizes
-        checksum (bool, optional): Compare the file checksums (slow).
+        checksum (bool, optional): Compare the file contents (slow, see :py:func:`contents_different` ).
+        mtime_tolerance (float, optional): seconds last-modified dates can differ by, and be considered the same.
+            (filesystems store mtimes at different resolutions, ex: FAT is 2s)
+        stat_a (os.stat_result, copyfile.SrcStat, optional): stat of `file_a` , if it is already known.
 
     Returns:
         bool: True if files are different.
     """
-    checks = []
-    checkmsg = []
-    if mtime:
-        # reporting differences despite repr of float being equal
-        checks.append(int(os.path.getmtime(file_a)) != int(os.path.getmtime(file_b)))
-        checkmsg.append('mod-time')
+    if stat_a is None:
+        stat_a = os.stat(file_a)
+    try:
+        stat_b = os.stat(file_b)
+    except(FileNotFoundError, NotADirectoryError):
+        return True
+    if not stat.S_ISREG(stat_b.st_mode):
+        return True
 
-    if size:
-        checks.append(os.path.getsize(file_a) == os.path.getsize(file_b))
-        checkmsg.append('size')
+    if (size or checksum) and stat_a.st_size != stat_b.st_size:
+        return True
+
+    if mtime and abs(stat_a.st_mtime_ns - stat_b.st_mtime_ns) > mtime_tolerance * 1e9:
+        return True
 
     if checksum:
-        checkmsg.append('checksum')
-        raise NotImplementedError('todo')
+        return contents_different(file_a, file_b)
 
-    return all(checks)
+    return False
+
+
+def contents_different(file_a, file_b, chunk_size=_COMPARE_CHUNK_SIZE):
+    """ Returns ``True`` if the contents of two files differ.
+
+    Files are read chunk by chunk, stopping at the first chunk that differs.
+    Chunks of `file_b` are read (in another thread) while the same chunk
+    of `file_a` is read, so the reads overlap when files are on different devices.
+
+    Args:
+        file_a (str): path to the first file.
+        file_b (str): path to the second file.
+        chunk_size (int, optional): bytes compared at a time.
+
+    Returns:
+        bool: True if contents are different.
+    """
+    with open(file_a, 'rb', buffering=0) as fd_a:
+        with open(file_b, 'rb', buffering=0) as fd_b:
+            view_a = copybackends.reusable_buffer(chunk_size, slot='compare_a')
+            view_b = copybackends.reusable_buffer(chunk_size, slot='compare_b')
 
+            # a file that fits in a single chunk is not worth a thread
+            if os.fstat(fd_a.fileno()).st_size <= chunk_size:
+                return _read_chunk(fd_a, view_a) != _read_chunk(fd_b, view_b)
 
-def copyfile(src, dst, reraise=True, log_errors=True):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                while True:
+                    future_b = executor.submit(_read_chunk, fd_b, view_b)
+                    chunk_a = _read_chunk(fd_a, view_a)
+                    chunk_b = future_b.result()
+                    if chunk_a != chunk_b:
+                        return True
+                    if not chunk_a:
+                        return False
+
+
+def _read_chunk(fd, view):
+    """ Fills `view` from `fd` (short reads are retried).
+
+    Returns:
+        memoryview: the part of `view` that was read (empty at the end of the file).
+    """
+    read = 0
+    while read < len(view):
+        chunk_read = fd.readinto(view[read:])
+        if not chunk_read:
+            break
+        read += chunk_read
+    return view[:read]
+
+
+def copyfile(src, dst, reraise=True, log_errors=True, backend=copybackends.KERNEL, drop_cache=False, throttle=None,
+             compare=True, dircache=None, copystat=False, srcstat=None):
     """ Copies a single file, if it needs copying.
 
+    The file is written to a temporary name (see :py:func:`partial_path` ), and renamed to `dst`
+    once it (and it's stats) are completely written. A file named `dst` is never partially written.
+
     Args:
         src (str): ``(ex: '/src/file.txt')
             file to copy
@@ -221,27 +329,57 @@ def copyfile(src, dst, reraise=True, log_errors=True):
         dst (str): ``(ex: '/dst/file.txt')``
             copy file to
 
+        backend (str, optional): ``(ex: 'kernel', 'sendfile', 'mmap')``
+            copy backend used to copy file contents (see :py:func:`copyfile_contents` )
+
+        drop_cache (bool, optional):
+            evict the file from the page cache once it is copied (see :py:func:`copyfile_contents` )
+
+        throttle (callable, optional):
+            rate limits the copy (see :py:func:`copyfile_contents` )
+
+        compare (bool, optional):
+            if ``False`` , `dst` is overwritten without checking if it is already the same
+            (ex: the caller has already compared them with :py:func:`files_different` ).
+
+        dircache (dircache.DirectoryCache, optional):
+            creates/opens the destination directory, `dst` is created relative to it.
+            (otherwise, the directory is created with ``os.makedirs`` )
+
+        copystat (bool, optional):
+            copy the file's stats before it is renamed to `dst` (see :py:func:`copyfilestat` , parents are not copied).
+
+        srcstat (copyfile.SrcStat, optional):
+            stat of `src` captured by the resolver (see :py:func:`copyfilestat` ).
+            ignored if the file that was copied no longer matches it's size/mtime.
+
     Returns:
         bool: True if a file was copied.
     """
-    if os.path.isfile(dst):
-        if not files_different(src, dst):
-            logger.debug('file exists, same mod-date/size. skipped: "{}"'.format(dst))
-            return False
+    if compare and not files_different(src, dst):
+        logger.debug('file exists, same mod-date/size. skipped: "{}"'.format(dst))
+        return False
 
     # make directories, and copy file
+    partial = partial_path(dst)
     try:
         dstdir = os.path.dirname(dst)
-        try:
-            os.makedirs(dstdir)
-        except(FileExistsError):
-            pass
-        logger.debug('copying file: "{}" to "{}"'.format(src, dst))
-        shutil.copyfile(src, dst)
+        dir_fd = None
+        if dircache is not None:
+            dir_fd = dircache.open(dstdir)
+        else:
+            try:
+                os.makedirs(dstdir)
+            except(FileExistsError):
+                pass
+        (used_backend, copied_stat) = _copyfile_contents(src, partial, backend, drop_cache, throttle, dir_fd)
+        if copystat:
+            copyfilestat(src, partial, parents=False, srcstat=_current_srcstat(srcstat, copied_stat))
+        finish_partial(dst, dir_fd)
+        logger.debug('copied file ({}): "{}" to "{}"'.format(used_backend, src, dst))
         return True
     except(OSError):
-        if os.path.isfile(dst):
-            os.remove(dst)
+        remove_partial(dst)
         if log_errors:
             logger.error('Unable to copy "{}" to "{}"'.format(src, dst))
         if reraise:
@@ -250,7 +388,286 @@ def copyfile(src, dst, reraise=True, log_errors=True):
     return False
 
 
-def copyfilestat(src, dst):
+def partial_path(dst):
+    """ Returns the temporary name `dst` is written to, until it is complete.
+
+    Returns:
+        str: ``(ex: '/dst/path/.file.txt.mvcopy-partial')``
+    """
+    (dirname, basename) = os.path.split(dst)
+    name = '.{}{}'.format(basename, _PARTIAL_SUFFIX)
+    if len(os.fsencode(name)) > _NAME_MAX:
+        name = '.{}{}'.format(hashlib.sha1(os.fsencode(basename)).hexdigest(), _PARTIAL_SUFFIX)
+    return os.path.join(dirname, name)
+
+
+def finish_partial(dst, dir_fd=None):
+    """ Renames the completely written :py:func:`partial_path` of `dst` to `dst` (replacing it if it exists).
+
+    Args:
+        dst (str): ``(ex: '/dst/path/file.txt')``
+        dir_fd (int, optional): open file descriptor of `dst` 's directory.
+    """
+    if dir_fd is None:
+        os.replace(partial_path(dst), dst)
+        return
+    # (dir_fd is only supported on posix, where rename replaces `dst` )
+    os.rename(os.path.basename(partial_path(dst)), os.path.basename(dst), src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+
+
+def remove_partial(dst):
+    """ Removes the :py:func:`partial_path` of `dst` , if it exists.
+    """
+    try:
+        os.remove(partial_path(dst))
+    except(FileNotFoundError):
+        pass
+
+
+def copyfile_contents(src, dst, backend=copybackends.KERNEL, drop_cache=False, throttle=None, dir_fd=None):
+    """ Copies the contents of `src` to `dst` , keeping data in the kernel when possible.
+
+    By default, backends are tried in the following order, falling back to the next
+    if the kernel/filesystem does not support it for this pair of files.
+
+        * ``os.copy_file_range`` (linux, may use reflinks/server-side copies)
+        * ``os.sendfile``
+        * userspace read/write loop, with a large reusable buffer
+
+    Args:
+        src (str): ``(ex: '/src/file.txt')
+            file to copy
+
+        dst (str): ``(ex: '/dst/file.txt')``
+            copy file to (overwritten if it exists)
+
+        backend (str, optional): ``(ex: 'kernel', 'sendfile', 'mmap')``
+            copy backend (or chain of backends) to use. see :py:mod:`multivolumecopy.copybackends`
+            ``'direct'`` copies with ``O_DIRECT`` , bypassing the page cache
+            (falling back to ``'kernel'`` if the filesystem refuses it).
+
+        drop_cache (bool, optional):
+            once copied, tell the kernel `src` and `dst` will not be read again (see :py:func:`pagecache.dontneed` )
+
+        throttle (callable, optional): ``(ex: ratelimiter.RateLimiter.throttle)``
+            called with the number of bytes copied after each chunk, sleeping to limit the copy rate.
+            (chunks are reduced to 1MiB when set)
+
+        dir_fd (int, optional):
+            open file descriptor of `dst` 's directory, `dst` is created relative to it.
+
+    Returns:
+        str: the backend used to copy the file ``(ex: 'copy_file_range', 'sendfile', 'readwrite')``
+    """
+    return _copyfile_contents(src, dst, backend, drop_cache, throttle, dir_fd)[0]
+
+
+def _copyfile_contents(src, dst, backend=copybackends.KERNEL, drop_cache=False, throttle=None, dir_fd=None):
+    """ :py:func:`copyfile_contents` , also returning the stat of the opened `src` .
+
+    Returns:
+        tuple: ``('copy_file_range', os.stat_result(...))``
+    """
+    if backend == copybackends.DIRECT:
+        try:
+            return _copyfile_direct(src, dst, throttle=throttle, dir_fd=dir_fd)
+        except(OSError) as exc:
+            if exc.errno not in copybackends.UNSUPPORTED_ERRNOS:
+                raise
+            logger.debug('{} unsupported, falling back ({}): "{}"'.format(backend, exc, src))
+            backend = copybackends.KERNEL
+
+    with open(src, 'rb', buffering=0) as fsrc:
+        with open(dst, 'wb', buffering=0, opener=lambda path, flags: _open_dst(path, flags, dir_fd)) as fdst:
+            src_stat = os.fstat(fsrc.fileno())
+            chunk_size = _chunk_size(src_stat.st_size, throttle)
+            used_backend = copybackends.copy(fsrc, fdst, copybackends.chain(backend), chunk_size, throttle)
+            if drop_cache:
+                pagecache.dontneed(fsrc.fileno())
+                pagecache.dontneed(fdst.fileno())
+            return (used_backend, src_stat)
+
+
+def _current_srcstat(srcstat, copied_stat):
+    """ Returns `srcstat` (captured by the resolver) if the source that was copied still matches it.
+
+    The resolver's stat can be stale (ex: a resumed job, or a file modified during a long copy),
+    and applying it would make the new contents look unchanged.
+
+    Args:
+        srcstat (copyfile.SrcStat, None): stat captured by the resolver
+        copied_stat (os.stat_result): ``os.fstat`` of the source, while it was copied
+
+    Returns:
+        copyfile.SrcStat, os.stat_result, None: `copied_stat` if the source changed.
+    """
+    if srcstat is None:
+        return None
+    if srcstat.st_mtime_ns == copied_stat.st_mtime_ns and srcstat.st_size == copied_stat.st_size:
+        return srcstat
+    logger.debug('source changed since it was resolved, using it\'s current stat')
+    return copied_stat
+
+
+def _copyfile_direct(src, dst, offset=0, length=None, truncate=True, throttle=None, dir_fd=None):
+    """ Copies a file (or a range of it) with ``O_DIRECT`` (see :py:func:`copybackends.copy_direct` ).
+
+    Returns:
+        tuple: ``('direct', os.stat_result(...))`` the stat of the opened `src` .
+    """
+    if not hasattr(os, 'O_DIRECT'):
+        raise OSError(errno.ENOSYS, 'O_DIRECT is not available')
+
+    flags = os.O_WRONLY | os.O_DIRECT | (os.O_CREAT | os.O_TRUNC if truncate else 0)
+    src_fd = os.open(src, os.O_RDONLY | os.O_DIRECT)
+    try:
+        dst_fd = _open_dst(dst, flags, dir_fd)
+        try:
+            src_stat = os.fstat(src_fd)
+            size = src_stat.st_size
+            if length is None:
+                length = size - offset
+            copybackends.copy_direct(src_fd, dst_fd, offset, length, throttle)
+            # the last block is written padded to the alignment
+            if offset + length >= size:
+                os.ftruncate(dst_fd, size)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    return (copybackends.DIRECT, src_stat)
+
+
+def _open_dst(dst, flags, dir_fd=None):
+    """ Opens `dst` , relative to it's directory's file descriptor `dir_fd` if provided.
+
+    Returns:
+        int: file descriptor
+    """
+    if dir_fd is None:
+        return os.open(dst, flags, 0o666)
+    return os.open(os.path.basename(dst), flags, 0o666, dir_fd=dir_fd)
+
+
+def _chunk_size(size, throttle=None):
+    """ Returns the chunk size kernel-side copies of `size` bytes are requested in.
+    """
+    if throttle:
+        return _THROTTLED_CHUNK_SIZE
+    return min(max(size, _MIN_CHUNK_SIZE), _MAX_CHUNK_SIZE)
+
+
+def preallocate(dst, size):
+    """ Creates (or truncates) `dst` , and reserves `size` bytes for it.
+    (so that ranges of it can be written by several processes at once, see :py:func:`copyfile_range` )
+
+    Args:
+        dst (str): ``(ex: '/dst/file.img')``
+            file to create
+
+        size (int):
+            size of file in bytes
+    """
+    dstdir = os.path.dirname(dst)
+    try:
+        os.makedirs(dstdir)
+    except(FileExistsError):
+        pass
+
+    with open(dst, 'wb', buffering=0) as fdst:
+        # reserving space tells us immediately if the device is full
+        if size and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fdst.fileno(), 0, size)
+                return
+            except(OSError) as exc:
+                if exc.errno not in copybackends.UNSUPPORTED_ERRNOS:
+                    raise
+        os.ftruncate(fdst.fileno(), size)
+
+
+def copyfile_range(src, dst, offset, length, drop_cache=False, direct=False, throttle=None):
+    """ Copies `length` bytes at `offset` in `src` , to the same offset in `dst` .
+    `dst` must already exist (see :py:func:`preallocate` ).
+
+    Args:
+        src (str): ``(ex: '/src/file.img')``
+            file to copy
+
+        dst (str): ``(ex: '/dst/file.img')``
+            file to write range to
+
+        offset (int):
+            first byte of range
+
+        length (int):
+            number of bytes in range
+
+        drop_cache (bool, optional):
+            once copied, evict the range from the page cache (see :py:func:`copyfile_contents` )
+
+        direct (bool, optional):
+            copy with ``O_DIRECT`` , bypassing the page cache (falls back if the filesystem refuses it)
+
+        throttle (callable, optional):
+            rate limits the copy (see :py:func:`copyfile_contents` )
+
+    Returns:
+        str: the backend used to copy the range ``(ex: 'copy_file_range', 'preadv', 'direct')``
+    """
+    if direct:
+        try:
+            return _copyfile_direct(src, dst, offset, length, truncate=False, throttle=throttle)[0]
+        except(OSError) as exc:
+            if exc.errno not in copybackends.UNSUPPORTED_ERRNOS:
+                raise
+            logger.debug('{} unsupported, falling back ({}): "{}"'.format(copybackends.DIRECT, exc, src))
+
+    with open(src, 'rb', buffering=0) as fsrc:
+        with open(dst, 'r+b', buffering=0) as fdst:
+            chunk_size = _chunk_size(length, throttle)
+            used_backend = copybackends.copy_range(fsrc, fdst, offset, length, chunk_size, throttle)
+            if drop_cache:
+                pagecache.dontneed(fsrc.fileno(), offset, length)
+                pagecache.dontneed(fdst.fileno(), offset, length)
+            return used_backend
+
+
+def physical_offset(filepath):
+    """ Returns where a file's first byte is physically stored on its device (linux FIEMAP).
+    Files sorted by this are read with fewer seeks on spinning disks.
+
+    Args:
+        filepath (str): ``(ex: '/src/file.img')``
+
+    Raises:
+        OSError: if the file cannot be opened.
+
+    Returns:
+        int, None: ``(ex: 1048576)`` byte offset on the device (``0`` for empty files).
+            ``None`` if the filesystem/platform does not support FIEMAP.
+    """
+    try:
+        import fcntl
+    except(ImportError):
+        return None
+
+    request = bytearray(_FIEMAP.pack(0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + bytes(_FIEMAP_EXTENT.size))
+    with open(filepath, 'rb', buffering=0) as fd:
+        try:
+            fcntl.ioctl(fd.fileno(), _FS_IOC_FIEMAP, request)
+        except(OSError) as exc:
+            if exc.errno == errno.ENOTTY or exc.errno in copybackends.UNSUPPORTED_ERRNOS:
+                return None
+            raise
+
+    mapped_extents = _FIEMAP.unpack_from(request)[3]
+    if not mapped_extents:
+        return 0
+    return _FIEMAP_EXTENT.unpack_from(request, _FIEMAP.size)[1]
+
+
+def copyfilestat(src, dst, parents=True, srcstat=None):
     """ Copy permissions, access-time, modification-time, ACLs from
     srcfile to dstfile (including all parent directories in relpath).
 
@@ -260,10 +677,24 @@ def copyfilestat(src, dst):
 
         dst (str): ``(ex: '/dst/path/file.txt')``
             location to copy to
+
+        parents (bool, optional):
+            if ``False`` , only the file's stats are copied (not it's parent directories).
+
+        srcstat (copyfile.SrcStat, optional):
+            stat of `src` captured by the resolver. if provided, the file's mode/mtime
+            are applied from it instead of stat-ing `src` again (access-time is set to the mtime).
     """
     src = src.replace('\\', '/')
     dst = dst.replace('\\', '/')
 
+    if not parents:
+        try:
+            _copystat(src, dst, srcstat)
+        except(Exception):
+            logger.warning('Unable to copy stats from "{}"'.format(src))
+        return
+
     relpath = common_relpath(src, dst)
 
     # get src/dst root
@@ -273,15 +704,84 @@ def copyfilestat(src, dst):
     # copystat for each directory + the file
     srcpath = srcroot
     dstpath = dstroot
-    for part in relpath.split('/'):
+    parts = relpath.split('/')
+    for (i, part) in enumerate(parts):
         srcpath += '/{}'.format(part)
         dstpath += '/{}'.format(part)
         try:
-            shutil.copystat(srcpath, dstpath)
+            _copystat(srcpath, dstpath, srcstat if i == len(parts) - 1 else None)
         except(Exception):
             logger.warning('Unable to copy stats from "{}"'.format(src))
 
 
+def copydirstats(filepairs):
+    """ Copy permissions, access-time, modification-time, ACLs of the parent directories
+    of many files (see :py:func:`copyfilestat` ). Each directory is copied once, deepest first.
+
+    Notes:
+        Call once the files have been written, creating files changes the mtime of their directory.
+
+    Args:
+        filepairs (iterable): ``(ex: [('/src/path/file.txt', '/dst/path/file.txt'), ...])``
+            src/dst of copied files.
+
+    Returns:
+        int: number of directories.
+    """
+    dirpairs = {}  # {dstdir: srcdir}
+    for (src, dst) in filepairs:
+        src = src.replace('\\', '/')
+        dst = dst.replace('\\', '/')
+        if os.path.dirname(dst) in dirpairs:
+            continue
+
+        relpath = common_relpath(src, dst)
+        srcpath = src[: -1 * (len(relpath) + 1)]
+        dstpath = dst[: -1 * (len(relpath) + 1)]
+        for part in relpath.split('/')[:-1]:
+            srcpath += '/{}'.format(part)
+            dstpath += '/{}'.format(part)
+            dirpairs[dstpath] = srcpath
+
+    for dstpath in sorted(dirpairs, key=lambda path: path.count('/'), reverse=True):
+        try:
+            shutil.copystat(dirpairs[dstpath], dstpath)
+        except(Exception):
+            logger.warning('Unable to copy stats from "{}"'.format(dirpairs[dstpath]))
+    return len(dirpairs)
+
+
+def _copystat(src, dst, srcstat=None):
+    """ :py:func:`shutil.copystat` , using `srcstat` instead of stat-ing `src` if it is provided.
+    """
+    if srcstat is None:
+        shutil.copystat(src, dst)
+        return
+    _copyxattrs(src, dst)
+    os.chmod(dst, stat.S_IMODE(srcstat.st_mode))
+    os.utime(dst, ns=(srcstat.st_mtime_ns, srcstat.st_mtime_ns))
+
+
+def _copyxattrs(src, dst):
+    """ Copies extended attributes (ex: ACLs) from `src` to `dst` , where supported.
+    """
+    if not hasattr(os, 'listxattr'):
+        return
+    ignored_errnos = (errno.ENOTSUP, errno.ENODATA, errno.EINVAL, errno.EPERM)
+    try:
+        names = os.listxattr(src)
+    except(OSError) as exc:
+        if exc.errno not in ignored_errnos:
+            raise
+        return
+    for name in names:
+        try:
+            os.setxattr(dst, name, os.getxattr(src, name))
+        except(OSError) as exc:
+            if exc.errno not in ignored_errnos:
+                raise
+
+
 def common_relpath(path_a, path_b):
     """ Returns common end-path for two identical
     filepaths with different root-directories.
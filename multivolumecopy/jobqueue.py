@@ -0,0 +1,433 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import multiprocessing
+
+
+# positions within JobQueue._state
+_POISON_PILLS = 0
+_NUM_LANES = 1
+_WINDOW_STOP = 2
+_MAX_READERS = 3
+_ORDER_START = 4
+_ORDER_STOP = 5
+_PREFETCH = 6      # indexes read ahead of each claim
+_STATE_FIELDS = 7
+
+# fields of each slot within JobQueue._lanes
+_LANE_START = 0
+_LANE_CURSOR = 1
+_LANE_STOP = 2
+_LANE_DEVICE = 3
+_LANE_PREFETCHED = 4  # positions before this have been returned to be prefetched
+_LANE_FIELDS = 5
+
+# fields of each slot within JobQueue._chunks
+_CHUNK_INDEX = 0
+_CHUNK_TOTAL = 1   # (0 when slot is unused)
+_CHUNK_NEXT = 2
+_CHUNK_DONE = 3
+_CHUNK_FIELDS = 4
+
+
+class JobQueue(object):
+    """ Queue of copyfile indexes, shared between worker processes.
+
+    Jobs are integer indexes into a :py:class:`multivolumecopy.jobtable.JobTable` .
+    Workers claim ranges of indexes from a cursor in shared memory,
+    so no manager process is required, and claiming a job is O(1).
+
+    Claims are served in the following order:
+
+        * poison pills (the worker should exit)
+        * the next indexes from the cursor of a lane
+
+    Files that must be copied again (ex: in progress when the device was full)
+    are queued again with :py:meth:`reset` from the first of them.
+
+    Indexes can be split into lanes (contiguous ranges read from the same source device).
+    Each claim is served from the lane whose device has the fewest readers, and
+    devices can be limited to `max_readers` at once (see :py:meth:`release` ).
+    Lanes are only interleaved before the window stop (ex: files that fit on the current volume),
+    after it indexes are claimed in order.
+
+    Lane cursors walk positions, which are the same as indexes unless a range of positions
+    is reordered with :py:meth:`set_order` (ex: to read files in the order they are stored on disk).
+
+    Large files can be split into chunks (byte ranges) that are claimed separately
+    with :py:meth:`claim_chunk` , so that several workers copy them at once.
+
+    Each claim can also return the indexes after it to read ahead (see `prefetch` in :py:meth:`reset` ).
+    Each lane tracks the positions that have been returned, so each index is only prefetched once.
+
+    Example:
+
+        .. code-block:: python
+
+            queue = JobQueue()
+            queue.reset(0, 100)
+            queue.claim(2)
+            >>> [0, 1]
+            queue.reset(1, 100)
+            queue.claim(2)
+            >>> [1, 2]
+            queue.put_poison_pills(1)
+            queue.claim(2)
+            >>> None
+
+    """
+    def __init__(self, chunk_capacity=16, lane_capacity=64):
+        """ Constructor.
+
+        Args:
+            chunk_capacity (int, optional):
+                maximum number of files that can be split into chunks at once.
+
+            lane_capacity (int, optional):
+                maximum number of lanes (and source devices).
+        """
+        self._condition = multiprocessing.Condition()
+        self._state = multiprocessing.RawArray('q', _STATE_FIELDS)
+        self._chunks = multiprocessing.RawArray('q', chunk_capacity * _CHUNK_FIELDS)
+        self._lanes = multiprocessing.RawArray('q', lane_capacity * _LANE_FIELDS)
+        self._readers = multiprocessing.RawArray('q', lane_capacity)  # active claims for each device
+        self._order = None  # RawArray('q', n)  index claimed at each position (see `reset` , `set_order` )
+
+    @property
+    def lane_capacity(self):
+        return len(self._readers)
+
+    def reset(self, start, stop, lanes=None, max_readers=0, prefetch=0):
+        """ Queue indexes between `start` and `stop` , discarding all other jobs.
+
+        Notes:
+            Shared memory for the order of positions (see :py:meth:`set_order` ) is allocated
+            on the first call (covering positions up to `stop` ), so it must be called before workers are started.
+
+        Args:
+            start (int): first index to be claimed
+            stop (int): claims end before this index
+
+            lanes (list, optional): ``(ex: [(0, 100, 0), (100, 250, 1)])``
+                ``(start, stop, device)`` contiguous ranges of indexes read from the same device.
+                (ranges are clipped to `start` / `stop` , device is a number less than :py:attr:`lane_capacity` )
+                by default, all indexes are a single lane.
+
+            max_readers (int, optional):
+                maximum claims from each device that can be in progress at once. ``0`` is unlimited.
+
+            prefetch (int, optional):
+                number of indexes after each claim (within it's lane) that should be read ahead.
+                (see `prefetch` in :py:meth:`claim` )
+        """
+        if lanes is None:
+            lanes = [(start, stop, 0)]
+        lanes = [(max(lane_start, start), min(lane_stop, stop), device)
+                 for (lane_start, lane_stop, device) in lanes
+                 if lane_stop > start and lane_start < stop]
+        if len(lanes) > self.lane_capacity:
+            raise IndexError('JobQueue lane capacity exceeded: {}'.format(self.lane_capacity))
+
+        with self._condition:
+            if self._order is None:
+                self._order = multiprocessing.RawArray('q', stop)
+            for (i, (lane_start, lane_stop, device)) in enumerate(lanes):
+                slot = i * _LANE_FIELDS
+                self._lanes[slot + _LANE_START] = lane_start
+                self._lanes[slot + _LANE_CURSOR] = lane_start
+                self._lanes[slot + _LANE_STOP] = lane_stop
+                self._lanes[slot + _LANE_DEVICE] = device
+                self._lanes[slot + _LANE_PREFETCHED] = lane_start
+            for device in range(len(self._readers)):
+                self._readers[device] = 0
+            self._state[_NUM_LANES] = len(lanes)
+            self._state[_ORDER_START] = 0
+            self._state[_ORDER_STOP] = 0
+            self._state[_WINDOW_STOP] = stop
+            self._state[_MAX_READERS] = max_readers
+            self._state[_PREFETCH] = prefetch
+            self._state[_POISON_PILLS] = 0
+            self._clear_chunks()
+            self._condition.notify_all()
+
+    def set_order(self, start, indexes):
+        """ Positions from `start` claim `indexes` in this order, instead of their own index.
+        Each lane must contain the same indexes as before (only the order within a lane can change).
+
+        Args:
+            start (int): first reordered position
+            indexes (list): ``(ex: [12, 10, 11])``
+        """
+        with self._condition:
+            if start < 0 or start + len(indexes) > len(self._order):
+                raise IndexError('JobQueue order does not include positions {}-{}'.format(start, start + len(indexes)))
+            self._order[start:start + len(indexes)] = indexes
+            self._state[_ORDER_START] = start
+            self._state[_ORDER_STOP] = start + len(indexes)
+
+            # positions ahead of the cursor hold different indexes now
+            for slot in self._lane_slots():
+                self._lanes[slot + _LANE_PREFETCHED] = self._lanes[slot + _LANE_CURSOR]
+
+    def set_window(self, stop):
+        """ Lanes are interleaved for indexes before `stop` , afterwards indexes are claimed in order.
+        """
+        with self._condition:
+            self._state[_WINDOW_STOP] = stop
+            self._condition.notify_all()
+
+    def claim(self, count=1, timeout=0, batchable=None, prefetch=None):
+        """ Claims the next job(s).
+
+        Args:
+            count (int, optional):
+                maximum number of indexes to claim.
+
+            timeout (float, optional):
+                if there is nothing to claim, wait up to this many seconds
+                for jobs to be queued (or a poison pill). ``None`` waits indefinitely.
+
+            batchable (callable, optional): ``(ex: lambda index: filesizes[index] < 65536)``
+                if provided, more than one index is only claimed while ``batchable(index)``
+                is true for every claimed index (ex: batches of small files).
+                (called while the queue is locked, keep it cheap)
+
+            prefetch (list, optional):
+                if provided, the indexes that follow this claim in it's lane that have not been
+                prefetched yet are appended to it (up to `prefetch` indexes given to :py:meth:`reset` ).
+
+        Returns:
+            list, None:
+                ``None`` if the worker received a poison pill,
+                otherwise a list of claimed indexes (empty if there are no more jobs).
+        """
+        with self._condition:
+            if timeout != 0:
+                self._condition.wait_for(self._claimable, timeout)
+
+            if self._state[_POISON_PILLS] > 0:
+                self._state[_POISON_PILLS] -= 1
+                return None
+
+            slot = self._choose_lane()
+            if slot is None:
+                return []
+            start = self._lanes[slot + _LANE_CURSOR]
+            stop = min(start + count, self._lanes[slot + _LANE_STOP])
+            claimed = self._batch(self._indexes_at(start, stop), batchable)
+            self._lanes[slot + _LANE_CURSOR] = start + len(claimed)
+            self._add_reader(slot, 1)
+            if prefetch is not None:
+                prefetch.extend(self._advance_prefetch(slot))
+            return claimed
+
+    def release(self, index):
+        """ Records that the claim beginning with `index` is finished (so it's device can be read from again).
+        """
+        with self._condition:
+            self._add_reader(self._find_lane(index), -1)
+            self._condition.notify_all()
+
+    def put_poison_pills(self, count):
+        """ The next `count` claims will receive a poison pill, instead of a job.
+        """
+        with self._condition:
+            self._state[_POISON_PILLS] += count
+            self._condition.notify_all()
+
+    def clear_poison_pills(self):
+        """ Discards poison pills that have not been claimed.
+        """
+        with self._condition:
+            self._state[_POISON_PILLS] = 0
+
+    def publish_chunks(self, index, num_chunks):
+        """ Splits job `index` into `num_chunks` chunks that can be claimed by any worker.
+
+        Returns:
+            bool: ``False`` if there is no room for more chunked files (copy it normally).
+        """
+        with self._condition:
+            for slot in range(0, len(self._chunks), _CHUNK_FIELDS):
+                if self._chunks[slot + _CHUNK_TOTAL]:
+                    continue
+                self._chunks[slot + _CHUNK_INDEX] = index
+                self._chunks[slot + _CHUNK_TOTAL] = num_chunks
+                self._chunks[slot + _CHUNK_NEXT] = 0
+                self._chunks[slot + _CHUNK_DONE] = 0
+                self._condition.notify_all()
+                return True
+            return False
+
+    def claim_chunk(self):
+        """ Claims the next unclaimed chunk of a chunked file.
+        (returns nothing if a poison pill is waiting, so that it is claimed first)
+
+        Returns:
+            tuple, None: ``(index, chunk)`` or ``None`` if there are no chunks to claim.
+        """
+        with self._condition:
+            if self._state[_POISON_PILLS] > 0:
+                return None
+            for slot in range(0, len(self._chunks), _CHUNK_FIELDS):
+                if self._chunks[slot + _CHUNK_NEXT] < self._chunks[slot + _CHUNK_TOTAL]:
+                    chunk = self._chunks[slot + _CHUNK_NEXT]
+                    self._chunks[slot + _CHUNK_NEXT] += 1
+                    return (self._chunks[slot + _CHUNK_INDEX], chunk)
+            return None
+
+    def complete_chunk(self, index):
+        """ Records that a chunk of job `index` was copied.
+
+        Returns:
+            bool: ``True`` if this was the last chunk of the file (the file is complete).
+        """
+        with self._condition:
+            slot = self._find_chunk_slot(index)
+            if slot is None:
+                return False
+            self._chunks[slot + _CHUNK_DONE] += 1
+            if self._chunks[slot + _CHUNK_DONE] < self._chunks[slot + _CHUNK_TOTAL]:
+                return False
+            self._chunks[slot + _CHUNK_TOTAL] = 0
+            return True
+
+    def fail_chunks(self, index):
+        """ Discards remaining chunks of job `index` .
+
+        Returns:
+            bool: ``True`` if job `index` was still being copied in chunks
+            (so only the first failed chunk reports the failure).
+        """
+        with self._condition:
+            slot = self._find_chunk_slot(index)
+            if slot is None:
+                return False
+            self._chunks[slot + _CHUNK_TOTAL] = 0
+            return True
+
+    def clear_chunks(self):
+        """ Discards all chunked files (ex: before requeueing them).
+        """
+        with self._condition:
+            self._clear_chunks()
+
+    def remaining(self):
+        """ Returns the number of indexes that have not yet been claimed.
+        """
+        with self._condition:
+            remaining = 0
+            for slot in self._lane_slots():
+                remaining += self._lanes[slot + _LANE_STOP] - self._lanes[slot + _LANE_CURSOR]
+            return remaining
+
+    def _batch(self, candidates, batchable):
+        # (call while holding `self._condition` )
+        candidates = list(candidates)
+        if batchable is None or len(candidates) < 2:
+            return candidates
+
+        # the first index is always claimed, but only batched with others if it is batchable.
+        if not batchable(candidates[0]):
+            return candidates[:1]
+        for (i, index) in enumerate(candidates[1:], start=1):
+            if not batchable(index):
+                return candidates[:i]
+        return candidates
+
+    def _claimable(self):
+        # (call while holding `self._condition` )
+        return (self._state[_POISON_PILLS] > 0
+                or self._choose_lane() is not None
+                or self._has_unclaimed_chunks())
+
+    def _advance_prefetch(self, slot):
+        """ Returns indexes within `prefetch` positions of the lane's cursor that have not been returned yet.
+        (call while holding `self._condition` )
+        """
+        cursor = self._lanes[slot + _LANE_CURSOR]
+        start = max(cursor, self._lanes[slot + _LANE_PREFETCHED])
+        stop = min(cursor + self._state[_PREFETCH], self._lanes[slot + _LANE_STOP])
+        if start >= stop:
+            return []
+        self._lanes[slot + _LANE_PREFETCHED] = stop
+        return list(self._indexes_at(start, stop))
+
+    def _indexes_at(self, start, stop):
+        """ Returns indexes claimed at positions `start` to `stop` .
+        (call while holding `self._condition` )
+        """
+        order_start = self._state[_ORDER_START]
+        order_stop = self._state[_ORDER_STOP]
+        if stop <= order_start or start >= order_stop:
+            return range(start, stop)
+
+        indexes = []
+        for position in range(start, stop):
+            if order_start <= position < order_stop:
+                indexes.append(self._order[position])
+            else:
+                indexes.append(position)
+        return indexes
+
+    def _lane_slots(self):
+        # (call while holding `self._condition` )
+        return range(0, self._state[_NUM_LANES] * _LANE_FIELDS, _LANE_FIELDS)
+
+    def _choose_lane(self):
+        """ Returns slot of the lane the next index should be claimed from,
+        or ``None`` if nothing can be claimed.
+        (call while holding `self._condition` )
+        """
+        pending = [slot for slot in self._lane_slots()
+                   if self._lanes[slot + _LANE_CURSOR] < self._lanes[slot + _LANE_STOP]]
+        if not pending:
+            return None
+
+        lowest_cursor = min(self._lanes[slot + _LANE_CURSOR] for slot in pending)
+        max_readers = self._state[_MAX_READERS]
+        best = None
+        for slot in pending:
+            cursor = self._lanes[slot + _LANE_CURSOR]
+            readers = self._readers[self._lanes[slot + _LANE_DEVICE]]
+            if max_readers and readers >= max_readers:
+                continue
+            # past the window, only the lowest index can be claimed
+            if cursor >= self._state[_WINDOW_STOP] and cursor != lowest_cursor:
+                continue
+            if best is None or (readers, cursor) < best[0]:
+                best = ((readers, cursor), slot)
+        return best[1] if best else None
+
+    def _find_lane(self, index):
+        # (call while holding `self._condition` )
+        for slot in self._lane_slots():
+            if self._lanes[slot + _LANE_START] <= index < self._lanes[slot + _LANE_STOP]:
+                return slot
+        return None
+
+    def _add_reader(self, slot, count):
+        # (call while holding `self._condition` )
+        if slot is None:
+            return
+        device = self._lanes[slot + _LANE_DEVICE]
+        self._readers[device] = max(0, self._readers[device] + count)
+
+    def _has_unclaimed_chunks(self):
+        # (call while holding `self._condition` )
+        for slot in range(0, len(self._chunks), _CHUNK_FIELDS):
+            if self._chunks[slot + _CHUNK_NEXT] < self._chunks[slot + _CHUNK_TOTAL]:
+                return True
+        return False
+
+    def _find_chunk_slot(self, index):
+        # (call while holding `self._condition` )
+        for slot in range(0, len(self._chunks), _CHUNK_FIELDS):
+            if self._chunks[slot + _CHUNK_TOTAL] and self._chunks[slot + _CHUNK_INDEX] == index:
+                return slot
+        return None
+
+    def _clear_chunks(self):
+        # (call while holding `self._condition` )
+        for slot in range(0, len(self._chunks), _CHUNK_FIELDS):
+            self._chunks[slot + _CHUNK_TOTAL] = 0
@@ -0,0 +1,95 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import multiprocessing
+from multivolumecopy import copyfile
+
+
+_STR_FIELDS = ('src', 'dst', 'relpath')
+_STAT_FIELDS = ('mtime_ns', 'mode', 'inode', 'device')
+_UNKNOWN = -1  # stat field was not captured
+_ENCODING = 'utf-8'
+_ENCODING_ERRORS = 'surrogateescape'  # os.walk() filepaths may not be valid utf-8
+
+
+class JobTable(object):
+    """ Read-only table of copyfiles, stored in shared memory.
+
+    Workers receive this table instead of the copyfiles themselves,
+    and look up the copyfile for each index they claim from a :py:class:`multivolumecopy.jobqueue.JobQueue` .
+    The table is not copied into a server process, and lookups do not require IPC.
+
+    Example:
+
+        .. code-block:: python
+
+            table = JobTable()
+            table.load(copyfiles)
+            table[2]
+            >>> CopyFile(src='/src/c.txt', dst='/dst/c.txt', relpath='c.txt', bytes=1024, index=2)
+
+    """
+    def __init__(self):
+        self._offsets = None   # RawArray('q', n + 1)  start of each record within `self._blob`
+        self._bytes = None     # RawArray('q', n)      filesize of each copyfile
+        self._blob = None      # RawArray('c', ...)    null-separated src/dst/relpath for each copyfile
+        self._stats = None     # RawArray('q', n * 4)  mtime_ns/mode/inode/device of each copyfile
+
+    def __len__(self):
+        if self._bytes is None:
+            return 0
+        return len(self._bytes)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('JobTable index out of range: {}'.format(index))
+
+        record = self._blob[self._offsets[index]:self._offsets[index + 1]]
+        fields = record.decode(_ENCODING, _ENCODING_ERRORS).split('\0')
+        kwargs = dict(zip(_STR_FIELDS, fields))
+        stats = self._stats[index * len(_STAT_FIELDS):(index + 1) * len(_STAT_FIELDS)]
+        kwargs.update((field, None if value == _UNKNOWN else value) for (field, value) in zip(_STAT_FIELDS, stats))
+        return copyfile.CopyFile(bytes=self._bytes[index], index=index, **kwargs)
+
+    def filesize(self, index):
+        """ Returns size (bytes) of copyfile at `index` , without reading the whole record.
+        """
+        return self._bytes[index]
+
+    def load(self, copyfiles):
+        """ Allocates shared memory, and writes `copyfiles` to it.
+        Must be called before workers are started.
+
+        Args:
+            copyfiles (tuple):
+                A tuple of `copyfile.CopyFile` s
+        """
+        offsets = multiprocessing.RawArray('q', len(copyfiles) + 1)
+        filesizes = multiprocessing.RawArray('q', len(copyfiles))
+        stats = multiprocessing.RawArray('q', len(copyfiles) * len(_STAT_FIELDS))
+
+        # first pass determines size of blob, without holding all records in memory
+        offset = 0
+        for (i, copyfile_) in enumerate(copyfiles):
+            offsets[i] = offset
+            offset += len(self._encode(copyfile_))
+            filesizes[i] = copyfile_.bytes
+            for (j, field) in enumerate(_STAT_FIELDS):
+                value = getattr(copyfile_, field)
+                stats[i * len(_STAT_FIELDS) + j] = _UNKNOWN if value is None else value
+        offsets[len(copyfiles)] = offset
+
+        blob = multiprocessing.RawArray('c', max(offset, 1))
+        for (i, copyfile_) in enumerate(copyfiles):
+            blob[offsets[i]:offsets[i + 1]] = self._encode(copyfile_)
+
+        self._offsets = offsets
+        self._bytes = filesizes
+        self._blob = blob
+        self._stats = stats
+
+    def _encode(self, copyfile_):
+        fields = [getattr(copyfile_, field) for field in _STR_FIELDS]
+        return '\0'.join(fields).encode(_ENCODING, _ENCODING_ERRORS)
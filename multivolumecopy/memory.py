@@ -0,0 +1,79 @@
+"""
+Measures/releases memory used by the current process.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import ctypes
+import ctypes.util
+import logging
+import os
+import sys
+
+
+logger = logging.getLogger(__name__)
+
+_LIBC = None
+
+
+def rss_bytes():
+    """ Returns the resident set size of the current process (bytes).
+
+    Notes:
+        Reads ``/proc/self/statm`` when available (linux).
+        Otherwise falls back to :py:mod:`resource` , which only reports the peak RSS.
+
+    Returns:
+        int, None: ``None`` if it cannot be measured on this platform.
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as fd:
+            resident_pages = int(fd.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except(OSError, ValueError, IndexError):
+        pass
+
+    return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    """ Returns the highest resident set size the current process has reached (bytes).
+
+    Returns:
+        int, None: ``None`` if it cannot be measured on this platform.
+    """
+    try:
+        import resource
+    except(ImportError):
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macos, kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return maxrss
+    return maxrss * 1024
+
+
+def malloc_trim():
+    """ Asks the C allocator to return free heap memory to the OS (glibc only).
+
+    Returns:
+        bool: ``True`` if memory was released.
+    """
+    global _LIBC
+    if _LIBC is None:
+        _LIBC = _load_libc() or False
+    if not _LIBC:
+        return False
+    return bool(_LIBC.malloc_trim(0))
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6')
+        libc.malloc_trim  # musl does not implement malloc_trim
+    except(OSError, AttributeError):
+        logger.debug('malloc_trim() is not available')
+        return None
+    return libc
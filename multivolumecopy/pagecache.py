@@ -0,0 +1,122 @@
+"""
+Hints to the kernel about which files will be read soon, and which are done with.
+(uses ``posix_fadvise`` , a no-op on platforms without it)
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+def supported():
+    """ Returns ``True`` if this platform accepts page cache hints.
+    """
+    return hasattr(os, 'posix_fadvise')
+
+
+def willneed(filepath, length=0):
+    """ Asks the kernel to start reading the first `length` bytes of a file into the page cache
+    (asynchronously), so it is already cached when it is copied.
+
+    Args:
+        filepath (str): ``(ex: '/src/file.txt')``
+        length (int, optional): bytes to read ahead. ``0`` is the whole file.
+
+    Returns:
+        bool: ``True`` if the hint was given.
+    """
+    if not supported():
+        return False
+    try:
+        fd = os.open(filepath, os.O_RDONLY)
+    except(OSError):
+        return False  # (errors are reported when the file is copied)
+    try:
+        return advise(fd, 0, length, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+def dontneed(fd, offset=0, length=0):
+    """ Tells the kernel a range of an open file will not be read again, so its pages can be evicted.
+
+    Notes:
+        Clean pages are dropped immediately. Dirty pages (ex: a destination that was just written)
+        are only scheduled for writeback, so they are not left waiting to be flushed all at once.
+
+    Args:
+        fd (int): open file descriptor
+        offset (int, optional): first byte of range
+        length (int, optional): bytes in range. ``0`` is until the end of the file.
+
+    Returns:
+        bool: ``True`` if the hint was given.
+    """
+    if not supported():
+        return False
+    return advise(fd, offset, length, os.POSIX_FADV_DONTNEED)
+
+
+def advise(fd, offset, length, advice):
+    """ Calls ``posix_fadvise`` , ignoring filesystems that do not support it.
+
+    Returns:
+        bool: ``True`` if the hint was given.
+    """
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+        return True
+    except(OSError) as exc:
+        logger.debug('posix_fadvise({}) failed: {}'.format(advice, exc))
+        return False
+
+
+class Prefetcher(object):
+    """ Reads ahead the source files workers will copy next, within a budget.
+
+    Each file should only be given to a prefetcher once
+    (see `prefetch` in :py:meth:`multivolumecopy.jobqueue.JobQueue.claim` ).
+
+    Example:
+
+        .. code-block:: python
+
+            prefetcher = Prefetcher(max_files=8, max_bytes=64 * 1024 * 1024)
+            prefetcher.prefetch([copyfile_a, copyfile_b])
+            >>> 2
+
+    """
+    def __init__(self, max_files=8, max_bytes=64 * 1024 * 1024):
+        """ Constructor.
+
+        Args:
+            max_files (int, optional): maximum files read ahead per call
+            max_bytes (int, optional): maximum bytes read ahead per call
+                (larger files only have their beginning read ahead)
+        """
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+
+    def prefetch(self, copyfiles):
+        """ Reads ahead files, until the budget is spent.
+
+        Args:
+            copyfiles (list): ``[CopyFile(...), ...]`` files that will be copied soon, in order.
+
+        Returns:
+            int: number of files that were read ahead.
+        """
+        prefetched = 0
+        budget = self.max_bytes
+        for copyfile in copyfiles[:self.max_files]:
+            if budget <= 0:
+                break
+            length = min(copyfile.bytes, budget)
+            budget -= length
+            if length and willneed(copyfile.src, length):
+                prefetched += 1
+        return prefetched
@@ -0,0 +1,126 @@
+"""
+Limits the bytes and files all workers copy per second.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import logging
+import multiprocessing
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# buckets
+READ_BYTES = 0
+WRITE_BYTES = 1
+FILES = 2
+_NUM_BUCKETS = 3
+
+BUCKET_NAMES = {READ_BYTES: 'read bytes/s', WRITE_BYTES: 'write bytes/s', FILES: 'files/s'}
+
+# fields of each bucket within RateLimiter._buckets
+_RATE = 0        # tokens added per second (0 is unlimited)
+_TOKENS = 1      # (negative while workers are waiting to repay what they took)
+_UPDATED_AT = 2  # time.monotonic() tokens were last added
+_BUCKET_FIELDS = 3
+
+
+class RateLimiter(object):
+    """ Token buckets in shared memory, limiting bytes read/written and files copied
+    per second by every worker (processes or threads) combined.
+
+    Workers take what they used from each bucket after each chunk they copy, and sleep
+    while the bucket is in debt. Rates can be changed at any time from any process.
+
+    Example:
+
+        .. code-block:: python
+
+            limiter = RateLimiter(read_bytes=50 * 1024 * 1024, files=200)
+
+            # worker
+            limiter.throttle(files=1)          # before each file
+            limiter.throttle(1024 * 1024)      # after each chunk (bytes read and written)
+
+            # main process
+            limiter.set_rate(READ_BYTES, 100 * 1024 * 1024)
+
+    """
+    def __init__(self, read_bytes=None, write_bytes=None, files=None, burst=1.0):
+        """ Constructor.
+
+        Args:
+            read_bytes (int, optional): bytes read per second. ``None`` is unlimited.
+            write_bytes (int, optional): bytes written per second. ``None`` is unlimited.
+            files (int, optional): files copied per second. ``None`` is unlimited.
+            burst (float, optional): seconds of unused budget a bucket can save up.
+        """
+        self.burst = burst
+        self._lock = multiprocessing.Lock()
+        self._buckets = multiprocessing.RawArray('d', _NUM_BUCKETS * _BUCKET_FIELDS)
+        for (bucket, rate) in ((READ_BYTES, read_bytes), (WRITE_BYTES, write_bytes), (FILES, files)):
+            self.set_rate(bucket, rate)
+
+    def set_rate(self, bucket, rate):
+        """ Changes the rate of a bucket (takes effect immediately, in every worker).
+
+        Args:
+            bucket (int): ``(ex: READ_BYTES, WRITE_BYTES, FILES)``
+            rate (float, None): per second. ``None`` is unlimited.
+        """
+        with self._lock:
+            slot = bucket * _BUCKET_FIELDS
+            self._buckets[slot + _RATE] = rate or 0
+            self._buckets[slot + _TOKENS] = 0
+            self._buckets[slot + _UPDATED_AT] = time.monotonic()
+
+    def rate(self, bucket):
+        """ Returns the rate of a bucket, or ``None`` if it is unlimited.
+        """
+        return self._buckets[bucket * _BUCKET_FIELDS + _RATE] or None
+
+    def limited(self):
+        """ Returns ``True`` if any bucket has a rate.
+        """
+        return any(self.rate(bucket) for bucket in range(_NUM_BUCKETS))
+
+    def limits_bytes(self):
+        """ Returns ``True`` if bytes read or written are limited.
+        (if not, copies do not need to be throttled after each chunk)
+        """
+        return bool(self.rate(READ_BYTES) or self.rate(WRITE_BYTES))
+
+    def throttle(self, bytes=0, files=0):
+        """ Takes `bytes` (read and written) and `files` from their buckets,
+        sleeping until the buckets are no longer in debt.
+
+        Returns:
+            float: seconds slept
+        """
+        delay = max(self._take(READ_BYTES, bytes), self._take(WRITE_BYTES, bytes), self._take(FILES, files))
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def _take(self, bucket, amount):
+        """ Takes `amount` tokens from a bucket.
+
+        Returns:
+            float: seconds until the bucket is no longer in debt.
+        """
+        slot = bucket * _BUCKET_FIELDS
+        if not amount or not self._buckets[slot + _RATE]:
+            return 0.0
+
+        with self._lock:
+            rate = self._buckets[slot + _RATE]
+            if not rate:
+                return 0.0
+            now = time.monotonic()
+            elapsed = now - self._buckets[slot + _UPDATED_AT]
+            tokens = min(self._buckets[slot + _TOKENS] + elapsed * rate, rate * self.burst)
+            tokens -= amount
+            self._buckets[slot + _TOKENS] = tokens
+            self._buckets[slot + _UPDATED_AT] = now
+        return max(-tokens / rate, 0.0)
@@ -2,7 +2,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 import os
-from multivolumecopy import filesystem
+from multivolumecopy import filesystem, indexset
 from multivolumecopy.reconcilers import reconciler
 
 
@@ -16,6 +16,10 @@ class KeepFilesReconciler(reconciler.Reconciler):
     def calculate(self, copyfiles, copied_indexes):
         """ Determines files that need to be deleted.
         """
+        # membership is tested for every copyfile
+        if not isinstance(copied_indexes, indexset.IndexSet):
+            copied_indexes = indexset.IndexSet(copied_indexes)
+
         unrelated_files = set(self._get_unrelated_files(copyfiles, copied_indexes))
         wontfit_files = set(self._get_files_that_wont_fit(copyfiles, copied_indexes))
         files_to_remove = unrelated_files | wontfit_files
@@ -25,7 +29,7 @@ class KeepFilesReconciler(reconciler.Reconciler):
         # catches both files that have alread been copied (`copied_indexes`)
         # and files that have nothing to do with our copy job.
         unrelated_files = set()
-        uncopied_dstfiles = [copyfiles[i].dst for i in range(len(copyfiles)) if i not in copied_indexes]
+        uncopied_dstfiles = {copyfiles[i].dst for i in range(len(copyfiles)) if i not in copied_indexes}
 
         for (root, _, filenames) in os.walk(self.options.output):
             for filename in filenames:
@@ -42,7 +46,7 @@ class KeepFilesReconciler(reconciler.Reconciler):
         # (cannot be 100% accurate, due to filesystem features/compression)
         filepaths = []
         avail_bytes = self._estimate_available_bytes()
-        target_indexes = self._estimate_targets(avail_bytes, copyfiles, copied_indexes)
+        target_indexes = indexset.IndexSet(self._estimate_targets(avail_bytes, copyfiles, copied_indexes))
         purge_indexes = [i for i in range(len(copyfiles))
                          if i not in copied_indexes and i not in target_indexes]
         for i in purge_indexes:
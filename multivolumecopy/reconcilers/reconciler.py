@@ -44,8 +44,8 @@ class Reconciler(object):
             copyfiles (tuple):
                 A tuple of `resolver.CopyFile` s
 
-            copied_indexes (list):
-                A list of indexes within `copyfiles` that have already
+            copied_indexes (indexset.IndexSet, list):
+                Indexes within `copyfiles` that have already
                 been copied to another device.
         """
         for filepath in self.calculate(copyfiles, copied_indexes):
@@ -68,8 +68,8 @@ class Reconciler(object):
             copyfiles (tuple):
                 A tuple of `resolver.CopyFile` s
 
-            copied_indexes (list):
-                A list of indexes within `copyfiles` that have already
+            copied_indexes (indexset.IndexSet, list):
+                Indexes within `copyfiles` that have already
                 been copied to another device.
 
         Returns:
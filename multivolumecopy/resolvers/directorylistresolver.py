@@ -55,6 +55,10 @@ def _list_copyfiles(srcpaths, output):
                     'dst': '/dst/path',
                     'bytes': 1024,
                     'index': 0,
+                    'mtime_ns': 1577836800000000000,
+                    'mode': 33188,
+                    'inode': 1234,
+                    'device': 2049,
                 },
                 ...
             ]
@@ -68,11 +72,17 @@ def _list_copyfiles(srcpaths, output):
             for filename in filenames:
                 filepath = os.path.abspath('{}/{}'.format(root, filename))
                 relpath = filepath[len(srcpath) + 1:]
+                # captured once, workers use it instead of stat-ing the source again.
+                stat = os.stat(filepath)
                 copyfiles.append({
                     'src':      filepath,
                     'dst':      os.path.abspath('{}/{}'.format(output, relpath)),
                     'relpath':  relpath,
-                    'bytes':    os.path.getsize(filepath),
+                    'bytes':    stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'mode':     stat.st_mode,
+                    'inode':    stat.st_ino,
+                    'device':   stat.st_dev,
                 })
 
     # sort alphabetically by src
@@ -46,4 +46,8 @@ def _get_copyfiles(filepath, device_start_index=None, start_index=None):
     # JSON does not free memory well, so we do in separate process
     with open(filepath, 'r') as fd:
         raw_copyfiles = json.loads(fd.read())
-    return tuple([multivolumecopy.copyfile.CopyFile(*x) for x in raw_copyfiles])
+
+    # sources may have changed since the jobfile was written, their mtime/mode are not trusted.
+    # (workers stat the source instead, inode/device are still used for scheduling)
+    return tuple([multivolumecopy.copyfile.CopyFile(*x)._replace(mtime_ns=None, mode=None)
+                  for x in raw_copyfiles])
@@ -0,0 +1,142 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import collections
+import contextlib
+import multiprocessing
+import struct
+import time
+
+
+# Result.status
+STARTED = 0
+COMPLETED = 1
+ERROR = 2
+RETIRED = 3  # worker exited to release memory (`errno` is a RETIRED_* reason, `bytes` is it's RSS)
+EXITED = 4   # worker exited, for any reason (`bytes` is it's peak RSS)
+
+# Result.errno of RETIRED results
+RETIRED_MAX_TASKS = 1
+RETIRED_MAX_RSS = 2
+
+#: index, status, bytes, duration, errno
+_RECORD = struct.Struct('=qBqdi')
+
+
+Result = collections.namedtuple('Result', ('index', 'status', 'bytes', 'duration', 'errno'))
+
+
+class ResultChannel(object):
+    """ Single channel carrying results from all workers to the main process.
+
+    Workers write compact fixed-size records (see :py:class:`Result` ) to their own
+    :py:class:`ResultWriter` , which sends them in batches. Only indexes are sent,
+    the main process looks up the copyfile itself.
+
+    Example:
+
+        .. code-block:: python
+
+            channel = ResultChannel()
+
+            # worker
+            writer = channel.writer()
+            writer.write(10, STARTED)
+            writer.write(10, COMPLETED, bytes=1024, duration=0.01)
+            writer.flush()
+
+            # main process
+            channel.read()
+            >>> [Result(index=10, status=0, bytes=0, duration=0.0, errno=0),
+                 Result(index=10, status=1, bytes=1024, duration=0.01, errno=0)]
+
+    """
+    def __init__(self):
+        self._reader, self._writer = multiprocessing.Pipe(duplex=False)
+        self._lock = multiprocessing.Lock()
+
+    def fileno(self):
+        """ File descriptor that is readable when results are available.
+        (so the channel can be passed to :py:func:`multiprocessing.connection.wait` )
+        """
+        return self._reader.fileno()
+
+    def writer(self, batch_size=64, flush_interval=0.005):
+        """ Creates a writer for a single worker.
+
+        Args:
+            batch_size (int, optional):
+                flush after this many records are buffered.
+
+            flush_interval (float, optional):
+                flush once the oldest buffered record is this many seconds old.
+                (checked each time a record is written, call :py:meth:`ResultWriter.flush`
+                before work that may not write for a while)
+
+        Returns:
+            ResultWriter
+        """
+        return ResultWriter(self._writer, self._lock, batch_size, flush_interval)
+
+    def read(self):
+        """ Returns all results that are available, without blocking.
+
+        Returns:
+            list: ``[Result(...), Result(...), ...]``
+        """
+        results = []
+        while self._reader.poll(0):
+            data = self._reader.recv_bytes()
+            results.extend(Result(*record) for record in _RECORD.iter_unpack(data))
+        return results
+
+
+class ResultWriter(object):
+    """ Buffers results within a worker, and sends them in batches.
+    """
+    def __init__(self, connection, lock, batch_size=64, flush_interval=0.005):
+        self._connection = connection
+        self._lock = lock
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._buffer = bytearray()
+        self._buffered = 0
+        self._buffered_at = 0.0
+        self._deferred = False
+
+    def write(self, index, status, bytes=0, duration=0.0, errno=0):
+        """ Buffers a result, flushing if the batch is full or old enough.
+        """
+        if not self._buffered:
+            self._buffered_at = time.monotonic()
+        self._buffer += _RECORD.pack(index, status, bytes, duration, errno or 0)
+        self._buffered += 1
+
+        if self._deferred:
+            return
+        if self._buffered >= self.batch_size:
+            self.flush()
+        elif (time.monotonic() - self._buffered_at) >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """ Sends all buffered results.
+        """
+        if not self._buffered:
+            return
+        with self._lock:
+            self._connection.send_bytes(self._buffer)
+        self._buffer = bytearray()
+        self._buffered = 0
+
+    @contextlib.contextmanager
+    def deferred(self):
+        """ Context manager, results written within it are sent in a single message when it exits.
+        """
+        self._deferred = True
+        try:
+            yield
+        finally:
+            self._deferred = False
+            self.flush()
@@ -0,0 +1,277 @@
+"""
+Identifies the storage devices behind source/destination paths,
+to tune copy options (linux only) and schedule reads for them.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import collections
+import logging
+import multiprocessing
+import os
+import re
+from multivolumecopy import filesystem
+
+
+logger = logging.getLogger(__name__)
+
+# device classes
+HDD = 'hdd'
+SSD = 'ssd'
+NETWORK = 'network'
+MEMORY = 'memory'
+
+NETWORK_FSTYPES = {
+    'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'sshfs', 'fuse.sshfs', '9p', 'ceph', 'glusterfs', 'fuse.glusterfs',
+}
+MEMORY_FSTYPES = {'tmpfs', 'ramfs'}
+
+# options chosen for each device class (see :py:func:`tune` )
+PROFILES = {
+    # a single writer copying large sequential chunks, seeks are expensive.
+    HDD: {
+        'num_workers': 1,
+        'chunked_copy_threshold': 8 * 1024 * 1024 * 1024,
+        'chunked_copy_chunk_size': 1024 * 1024 * 1024,
+        'small_file_batch_size': 1024,
+        'physical_order': True,
+    },
+    # latency-bound, keep many requests in flight.
+    NETWORK: {
+        'num_workers': 8,
+        'chunked_copy_threshold': 256 * 1024 * 1024,
+        'chunked_copy_chunk_size': 64 * 1024 * 1024,
+        'small_file_batch_size': 256,
+    },
+    # many concurrent streams.
+    SSD: {
+        'num_workers': min(max(multiprocessing.cpu_count() * 2, 4), 16),
+        'chunked_copy_threshold': 256 * 1024 * 1024,
+        'chunked_copy_chunk_size': 64 * 1024 * 1024,
+        'small_file_batch_size': 256,
+    },
+}
+
+# options that can be tuned (see `copyoptions.CopyOptions.device_tuning` )
+TUNABLE_OPTIONS = frozenset({
+    'num_workers',
+    'chunked_copy_threshold',
+    'chunked_copy_chunk_size',
+    'small_file_batch_size',
+    'physical_order',
+})
+
+MountInfo = collections.namedtuple('MountInfo', ('mountpoint', 'devnum', 'fstype', 'source'))
+DeviceInfo = collections.namedtuple('DeviceInfo', ('mountpoint', 'fstype', 'source', 'rotational'))
+
+
+def read_mountinfo(filepath='/proc/self/mountinfo'):
+    """ Parses mounts from `/proc/self/mountinfo` .
+
+    Returns:
+        list: ``[MountInfo(mountpoint='/', devnum='259:2', fstype='ext4', source='/dev/nvme0n1p2'), ...]``
+            (empty if unavailable)
+    """
+    mounts = []
+    try:
+        with open(filepath, 'r') as fd:
+            lines = fd.readlines()
+    except(OSError):
+        return mounts
+
+    for line in lines:
+        # 36 35 98:0 /mnt1 /mnt/parent rw,noatime master:1 - ext3 /dev/root rw,errors=continue
+        (mount_fields, _, fs_fields) = line.partition(' - ')
+        mount_fields = mount_fields.split()
+        fs_fields = fs_fields.split()
+        if len(mount_fields) < 5 or len(fs_fields) < 2:
+            continue
+        mounts.append(MountInfo(_unescape(mount_fields[4]), mount_fields[2], fs_fields[0], _unescape(fs_fields[1])))
+    return mounts
+
+
+def is_rotational(devnum, sysfs='/sys'):
+    """ Returns ``True`` if a block device is rotational (spinning disk).
+
+    Args:
+        devnum (str): ``(ex: '8:1')`` major/minor device number
+
+    Returns:
+        bool, None: ``None`` if unknown (ex: not a block device)
+    """
+    devpath = os.path.realpath(os.path.join(sysfs, 'dev', 'block', devnum))
+    # partitions inherit the queue of their parent disk
+    for path in (devpath, os.path.dirname(devpath)):
+        rotational = os.path.join(path, 'queue', 'rotational')
+        if os.path.isfile(rotational):
+            with open(rotational, 'r') as fd:
+                return fd.read().strip() == '1'
+    return None
+
+
+def device_info(path, mounts=None):
+    """ Returns information about the device a path is stored on.
+
+    Args:
+        path (str): ``(ex: '/mnt/movies/amelie.mkv')``
+        mounts (list, optional): output of :py:func:`read_mountinfo`
+
+    Returns:
+        DeviceInfo, None: ``None`` if the mount could not be found.
+    """
+    if mounts is None:
+        mounts = read_mountinfo()
+    try:
+        mountpoint = filesystem.get_mount(os.path.realpath(path))
+    except(RuntimeError):
+        return None
+
+    # the last mount is the visible one, when mounts are stacked
+    for mount in reversed(mounts):
+        if mount.mountpoint == mountpoint:
+            return DeviceInfo(mountpoint, mount.fstype, mount.source, is_rotational(mount.devnum))
+    return None
+
+
+def device_class(info):
+    """ Returns the class of a device, which determines how it is tuned.
+
+    Returns:
+        str, None: ``(ex: 'hdd', 'ssd', 'network', 'memory')`` or ``None`` if unknown.
+    """
+    if info is None:
+        return None
+    if info.fstype in NETWORK_FSTYPES:
+        return NETWORK
+    if info.fstype in MEMORY_FSTYPES:
+        return MEMORY
+    if info.rotational is None:
+        return None
+    return HDD if info.rotational else SSD
+
+
+def profile_for(classes):
+    """ Returns the device class whose profile should be used to copy between devices.
+    (the slowest device determines the profile)
+
+    Args:
+        classes (list): ``(ex: ['ssd', 'hdd', 'ssd'])`` classes of every source device, and the destination device.
+
+    Returns:
+        str, None: ``(ex: 'hdd')`` or ``None`` if any device is unknown.
+    """
+    classes = set(classes)
+    if None in classes:
+        return None
+    for name in (HDD, NETWORK):
+        if name in classes:
+            return name
+    return SSD
+
+
+def source_devices(copyfiles):
+    """ Returns a source directory on each device that copyfiles are read from.
+
+    Notes:
+        The device captured by the resolver is used if available, otherwise
+        the device of each directory is checked once (files are sorted by path).
+
+    Returns:
+        dict: ``{st_dev: '/src/dir', ...}``
+    """
+    devices = {}
+    last_dirname = None
+    for copyfile in copyfiles:
+        dirname = os.path.dirname(copyfile.src)
+        if copyfile.device is not None:
+            devices.setdefault(copyfile.device, dirname)
+            continue
+        if dirname == last_dirname:
+            continue
+        last_dirname = dirname
+        try:
+            devices.setdefault(os.stat(dirname).st_dev, dirname)
+        except(OSError):
+            pass  # (missing files are reported when copied)
+    return devices
+
+
+def device_lanes(copyfiles):
+    """ Splits copyfiles into lanes, contiguous ranges of indexes read from the same source device.
+
+    Notes:
+        The device captured by the resolver is used if available, otherwise
+        the device of each directory is checked once (files are sorted by path).
+
+    Returns:
+        list: ``(ex: [(0, 100, 0), (100, 250, 1), (250, 300, 0)])``
+            ``(start, stop, device)`` where device is numbered in order of first appearance.
+    """
+    lanes = []
+    devices = {}  # {st_dev: device}
+    (last_dirname, st_dev) = (None, None)
+    for (index, copyfile) in enumerate(copyfiles):
+        dirname = os.path.dirname(copyfile.src)
+        if copyfile.device is not None:
+            st_dev = copyfile.device
+        elif dirname != last_dirname:
+            last_dirname = dirname
+            try:
+                st_dev = os.stat(dirname).st_dev
+            except(OSError):
+                pass  # (missing files are reported when copied, keep previous device)
+        device = devices.setdefault(st_dev, len(devices))
+
+        if lanes and lanes[-1][2] == device:
+            lanes[-1][1] = index + 1
+        else:
+            lanes.append([index, index + 1, device])
+    return [tuple(lane) for lane in lanes]
+
+
+def tune(options, copyfiles, output):
+    """ Sets copy options for the source/destination devices of a copy job.
+    Only options listed in `options.device_tuning` are changed.
+
+    Notes:
+        The slowest device (of every source device, and the destination) chooses the profile.
+        At least one worker is used for each source device, so they can be read from at once.
+
+    Args:
+        options (copyoptions.CopyOptions): options to modify
+        copyfiles (tuple): A tuple of `copyfile.CopyFile` s
+        output (str): directory the backup is written to
+
+    Returns:
+        str, None: ``(ex: 'hdd')`` name of the profile that was used, or ``None`` if devices are unknown.
+    """
+    mounts = read_mountinfo()
+    src_dirs = list(source_devices(copyfiles).values())
+    if not src_dirs or not mounts:
+        return None
+
+    src_infos = [device_info(src_dir, mounts) for src_dir in src_dirs]
+    dst_info = device_info(output, mounts)
+    name = profile_for([device_class(info) for info in src_infos] + [device_class(dst_info)])
+    if name is None:
+        logger.debug('Unable to identify devices, not tuning: {} -> {}'.format(src_infos, dst_info))
+        return None
+
+    tuned = {}
+    for (attr, value) in sorted(PROFILES[name].items()):
+        if attr not in options.device_tuning:
+            continue
+        if attr == 'num_workers':
+            value = max(value, len(src_dirs))
+        setattr(options, attr, value)
+        tuned[attr] = value
+    logger.info('Tuned for {} ({} -> {}): {}'.format(
+        name, ', '.join(info.source for info in src_infos), dst_info.source,
+        ', '.join('{}={}'.format(*item) for item in tuned.items())
+    ))
+    return name
+
+
+def _unescape(field):
+    # mountinfo escapes whitespace/backslashes as octal (ex: '\040' is a space)
+    return re.sub(r'\\([0-7]{3})', lambda match: chr(int(match.group(1), 8)), field)
@@ -1,6 +1,6 @@
 import logging
 import os
-from multivolumecopy import filesystem
+from multivolumecopy import filesystem, indexset
 from multivolumecopy.resolvers import jobfileresolver
 
 
@@ -63,7 +63,8 @@ class Verifier(object):
         different = []
         kwargs = dict(mtime=self.options.compare_mtime,
                       size=self.options.compare_size,
-                      checksum=self.options.compare_checksum)
+                      checksum=self.options.compare_checksum,
+                      mtime_tolerance=self.options.compare_mtime_tolerance)
         for copyfile in self.copyfiles[device_start_index:last_copied_index]:
             if not os.path.isfile(copyfile.src):
                 continue
@@ -91,6 +92,7 @@ class Verifier(object):
         """ Returns sum of sizes from all files successfully copied.
         """
         size = 0
+        missing_indexes = indexset.IndexSet(missing_indexes)
         for i in range(device_start_index, last_copied_index):
             # exclude src-files that are missing - they will not be included in backup
             if i in missing_indexes:
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+""" Compares the multiprocess and threadpool copiers, copying the same files.
+
+Reports time, throughput and the peak memory of a worker (multiprocess) or of the copier (threadpool).
+
+RUN:
+      ::
+
+        python tests/interactive/benchmark_copiers.py               # 2000x 64K files, 2 workers
+        python tests/interactive/benchmark_copiers.py 200 1M 4      # 200x 1M files, 4 workers
+
+"""
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+COPIERS = ('multiprocess', 'threadpool')
+
+
+def create_files(srcdir, num_files, filesize):
+    block = os.urandom(min(filesize, 1024 * 1024))
+    for i in range(num_files):
+        with open(os.path.join(srcdir, 'file{:06d}'.format(i)), 'wb') as fd:
+            remaining = filesize
+            while remaining > 0:
+                fd.write(block[:remaining])
+                remaining -= len(block)
+
+
+def run_copier(copier, srcdir, dstdir, num_workers):
+    cmds = [sys.executable, '-m', 'multivolumecopy', srcdir, '-o', dstdir,
+            '--copier', copier, '-w', str(num_workers), '--hide-progress', '-v']
+    started_at = time.monotonic()
+    process = subprocess.run(cmds, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                             universal_newlines=True, cwd=os.path.dirname(dstdir))
+    duration = time.monotonic() - started_at
+    match = re.search(r'Peak worker memory: (\S+)', process.stdout)
+    return (duration, match.group(1) if match else '?')
+
+
+def main(num_files=2000, filesize='64K', num_workers=2):
+    from multivolumecopy import filesystem
+    filesize = filesystem.size_to_bytes(filesize)
+    root = tempfile.mkdtemp(prefix='mvcopy-benchmark-')
+    try:
+        srcdir = os.path.join(root, 'src')
+        os.makedirs(srcdir)
+        create_files(srcdir, int(num_files), filesize)
+        total_mib = int(num_files) * filesize / (1024 * 1024)
+
+        print('{} files, {:.1f} MiB, {} workers'.format(num_files, total_mib, num_workers))
+        for copier in COPIERS:
+            dstdir = os.path.join(root, 'dst-{}'.format(copier))
+            os.makedirs(dstdir)
+            (duration, peak_memory) = run_copier(copier, srcdir, dstdir, num_workers)
+            print('{:>12}: {:6.2f}s {:8.1f} files/s {:8.1f} MiB/s  peak memory: {}'.format(
+                copier, duration, int(num_files) / duration, total_mib / duration, peak_memory
+            ))
+            shutil.rmtree(dstdir)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,62 @@
+from multivolumecopy import autoscaler
+
+
+class TestThroughputAutoscaler:
+    def setup(self):
+        self.autoscaler = autoscaler.ThroughputAutoscaler(2, min_workers=1, max_workers=4,
+                                                          interval=1.0, hold_windows=2)
+        self.autoscaler.reset(now=0)
+        self.now = 0
+
+    def window(self, bytes, files=10):
+        self.autoscaler.record(bytes, files)
+        self.now += 1.0
+        return self.autoscaler.evaluate(now=self.now)
+
+    def test_does_not_scale_before_window_elapsed(self):
+        self.autoscaler.record(1024)
+        assert self.autoscaler.evaluate(now=0.5) == 2
+
+    def test_extends_window_until_files_copied(self):
+        assert self.autoscaler.evaluate(now=5.0) == 2
+        assert self.autoscaler._window_started_at == 0
+
+    def test_first_window_probes_up(self):
+        assert self.window(1000) == 3
+
+    def test_keeps_adding_workers_while_throughput_rises(self):
+        assert self.window(1000) == 3
+        assert self.window(2000, 20) == 4
+
+    def test_reverts_and_holds_when_throughput_flat(self):
+        assert self.window(1000) == 3
+        assert self.window(1010) == 2
+        assert self.window(1000) == 2
+        assert self.window(1000) == 2
+
+    def test_probes_down_after_hold(self):
+        self.window(1000)
+        self.window(1010)   # knee at 2, reverting
+        self.window(1000)   # hold
+        self.window(1000)   # hold
+        assert self.window(1000) == 1
+
+    def test_keeps_removing_workers_while_throughput_holds(self):
+        self.autoscaler.num_workers = 4
+        assert self.window(1000) == 4  # at max_workers, next probe is downwards
+        assert self.window(1000) == 4  # hold
+        assert self.window(1000) == 4  # hold
+        assert self.window(1000) == 3
+        assert self.window(1000) == 2
+
+    def test_reverts_when_removing_worker_lowers_throughput(self):
+        self.autoscaler.num_workers = 4
+        self.window(1000)
+        self.window(1000)
+        self.window(1000)
+        assert self.window(1000) == 3
+        assert self.window(500, 5) == 4
+
+    def test_respects_min_max_workers(self):
+        scaler = autoscaler.ThroughputAutoscaler(10, min_workers=2, max_workers=6)
+        assert scaler.num_workers == 6
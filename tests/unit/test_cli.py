@@ -6,7 +6,7 @@ from __future__ import print_function
 import sys
 import mock
 import pytest
-from multivolumecopy import cli
+from multivolumecopy import cli, filesystem, topology
 
 
 class Test_CommandlineInterface(object):
@@ -57,6 +57,63 @@ class Test_CommandlineInterface(object):
         sys.argv = ['multivolumecopy', '--workers', '3', '/src', '-o', '/dst']
         self.cli.parse_args()
         assert self.cli.options.num_workers == 3
+        assert 'num_workers' not in self.cli.options.device_tuning
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.MultiProcessCopier')
+    def test_parse_args_does_not_tune_by_default(self, m_copier_cls):
+        sys.argv = ['multivolumecopy', '/src', '-o', '/dst']
+        self.cli.parse_args()
+        assert self.cli.options.device_tuning == set()
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.MultiProcessCopier')
+    def test_parse_args_tune_keeps_workers(self, m_copier_cls):
+        sys.argv = ['multivolumecopy', '--tune', '--workers', '3', '/src', '-o', '/dst']
+        self.cli.parse_args()
+        assert self.cli.options.device_tuning == topology.TUNABLE_OPTIONS - {'num_workers'}
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.MultiProcessCopier')
+    def test_parse_args_sets_autoscale(self, m_copier_cls):
+        sys.argv = ['multivolumecopy', '--autoscale', '/src', '-o', '/dst']
+        self.cli.parse_args()
+        assert self.cli.options.autoscale_workers is True
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.MultiProcessCopier')
+    def test_parse_args_sets_copy_backend(self, m_copier_cls):
+        sys.argv = ['multivolumecopy', '--copy-backend', 'auto', '/src', '-o', '/dst']
+        self.cli.parse_args()
+        assert self.cli.options.copy_backend == 'auto'
+
+    @mock.patch('multivolumecopy.copiers.threadpoolcopier.ThreadPoolCopier')
+    def test_parse_args_selects_threadpool_copier(self, m_copier_cls):
+        sys.argv = ['multivolumecopy', '--copier', 'threadpool', '/src', '-o', '/dst']
+        self.cli.parse_args()
+        assert m_copier_cls.return_value.start.called
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.MultiProcessCopier')
+    def test_parse_args_sets_direct_io_threshold(self, m_copier_cls):
+        sys.argv = ['multivolumecopy', '--direct-io-threshold', '4G', '/src', '-o', '/dst']
+        self.cli.parse_args()
+        assert self.cli.options.direct_io_threshold == filesystem.size_to_bytes('4G')
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.MultiProcessCopier')
+    def test_parse_args_sets_compare_checksum(self, m_copier_cls):
+        sys.argv = ['multivolumecopy', '--checksum', '/src', '-o', '/dst']
+        self.cli.parse_args()
+        assert self.cli.options.compare_checksum is True
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.MultiProcessCopier')
+    def test_parse_args_sets_trust_dst_files(self, m_copier_cls):
+        sys.argv = ['multivolumecopy', '--trust-dst-files', '/src', '-o', '/dst']
+        self.cli.parse_args()
+        assert self.cli.options.trust_dst_files is True
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.MultiProcessCopier')
+    def test_parse_args_sets_rate_limits(self, m_copier_cls):
+        sys.argv = ['multivolumecopy', '--max-read-rate', '50M', '--max-file-rate', '200', '/src', '-o', '/dst']
+        self.cli.parse_args()
+        assert self.cli.options.max_read_bytes_per_second == filesystem.size_to_bytes('50M')
+        assert self.cli.options.max_write_bytes_per_second is None
+        assert self.cli.options.max_files_per_second == 200
 
     @mock.patch('multivolumecopy.resolvers.jobfileresolver.JobFileResolver')
     @mock.patch('multivolumecopy.copiers.multiprocesscopier.MultiProcessCopier')
@@ -1,8 +1,12 @@
 from multivolumecopy.copiers import multiprocesscopier
-from multivolumecopy import copyoptions, copyfile
-from multivolumecopy.resolvers import resolver
+from multivolumecopy import copybackends, copyoptions, copyfile, jobqueue, jobtable, ratelimiter, resultchannel
+from multivolumecopy.resolvers import directorylistresolver, jobfileresolver, resolver
 from multivolumecopy.reconcilers import reconciler
+import json
 import multiprocessing
+import os
+import shutil
+import tempfile
 import pytest
 import mock
 
@@ -35,9 +39,23 @@ class TestMultiProcessCopier:
                                                             self.options,
                                                             self.reconciler)
         self.copier.manager = mock.Mock()
+        self.copier.manager.active_workers.return_value = 0
+        self.copier.manager.sentinels.return_value = []
         self.copier.prompt = mock.Mock()
         self.options.output = '/dst'
 
+        # the copier writes it's jobfile when it starts
+        self.tempdir = tempfile.mkdtemp(prefix='mvcopy-test-')
+        self.options.jobfile = os.path.join(self.tempdir, 'jobfile.json')
+
+    def teardown(self):
+        shutil.rmtree(self.tempdir)
+
+    def put_result(self, filedata, status):
+        writer = self.copier.results.writer()
+        writer.write(filedata.index, status)
+        writer.flush()
+
     def test_copy_finished_returns_false_when_copyfiles_remain(self):
         """ No files have been copied, so job is not complete.
         """
@@ -45,23 +63,23 @@ class TestMultiProcessCopier:
         assert self.copier.copy_finished() is False
 
     def test_copy_finished_returns_true_when_all_copyfiles_completed(self):
-        self.copier.completed_queue.put(MockResolver.FILE_A)
-        self.copier.completed_queue.put(MockResolver.FILE_B)
-        self.copier.completed_queue.put(MockResolver.FILE_C)
+        self.put_result(MockResolver.FILE_A, resultchannel.COMPLETED)
+        self.put_result(MockResolver.FILE_B, resultchannel.COMPLETED)
+        self.put_result(MockResolver.FILE_C, resultchannel.COMPLETED)
         self.copier.start(device_start_index=0, start_index=0, maxloops=1)
         assert self.copier.copy_finished() is True
 
     def test_copy_finished_returns_true_when_all_copyfiles_errored(self):
-        self.copier.error_queue.put(MockResolver.FILE_A)
-        self.copier.error_queue.put(MockResolver.FILE_B)
-        self.copier.error_queue.put(MockResolver.FILE_C)
+        self.put_result(MockResolver.FILE_A, resultchannel.ERROR)
+        self.put_result(MockResolver.FILE_B, resultchannel.ERROR)
+        self.put_result(MockResolver.FILE_C, resultchannel.ERROR)
         self.copier.start(device_start_index=0, start_index=0, maxloops=1)
         assert self.copier.copy_finished() is True
 
     def test_copy_finished_returns_true_when_sum_of_copied_files_and_errors_equals_total_files(self):
-        self.copier.completed_queue.put(MockResolver.FILE_A)
-        self.copier.error_queue.put(MockResolver.FILE_B)
-        self.copier.error_queue.put(MockResolver.FILE_C)
+        self.put_result(MockResolver.FILE_A, resultchannel.COMPLETED)
+        self.put_result(MockResolver.FILE_B, resultchannel.ERROR)
+        self.put_result(MockResolver.FILE_C, resultchannel.ERROR)
         self.copier.start(device_start_index=0, start_index=0, maxloops=1)
         assert self.copier.copy_finished() is True
 
@@ -75,9 +93,9 @@ class TestMultiProcessCopier:
 
     def test_prompt_diskfull_does_not_prompt_if_diskfull_but_job_finished(self):
         self.copier.device_full_lock.set()
-        self.copier.completed_queue.put(MockResolver.FILE_A)
-        self.copier.completed_queue.put(MockResolver.FILE_B)
-        self.copier.completed_queue.put(MockResolver.FILE_C)
+        self.put_result(MockResolver.FILE_A, resultchannel.COMPLETED)
+        self.put_result(MockResolver.FILE_B, resultchannel.COMPLETED)
+        self.put_result(MockResolver.FILE_C, resultchannel.COMPLETED)
         # if test condition is not met, we do not want to wait in endless loop
         self.copier.prompt.input.return_value = 'q'
         self.copier.start(device_start_index=0, start_index=0, maxloops=1)
@@ -85,33 +103,112 @@ class TestMultiProcessCopier:
     def test_requeues_started_copyfiles_when_diskfull(self):
         with pytest.raises(SystemExit):
             self.copier.device_full_lock.set()
-            self.copier.completed_queue.put(MockResolver.FILE_A)
-            self.copier.started_queue.put(MockResolver.FILE_B)
-            self.copier.started_queue.put(MockResolver.FILE_C)
+            self.put_result(MockResolver.FILE_A, resultchannel.COMPLETED)
+            self.put_result(MockResolver.FILE_B, resultchannel.STARTED)
+            self.put_result(MockResolver.FILE_C, resultchannel.STARTED)
             # force quit instead of looping forever or continuing copy
             self.copier.prompt.input.return_value = 'q'
             self.copier.start(device_start_index=0, start_index=0, maxloops=1)
 
-        # items are taken from index-0 first, so order is inverted
-        assert self.copier.joblist[0] == MockResolver.FILE_C
-        assert self.copier.joblist[1] == MockResolver.FILE_B
+        # queued again from the first uncopied file
+        assert self.copier.jobqueue.claim(2) == [MockResolver.FILE_B.index, MockResolver.FILE_C.index]
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.os')
+    def test_removes_partially_copied_files_when_diskfull(self, m_os):
+        m_os.path.isfile.return_value = True
+        with pytest.raises(SystemExit):
+            self.copier.device_full_lock.set()
+            self.put_result(MockResolver.FILE_A, resultchannel.COMPLETED)
+            self.put_result(MockResolver.FILE_B, resultchannel.STARTED)
+            self.copier.prompt.input.return_value = 'q'
+            self.copier.start(device_start_index=0, start_index=0, maxloops=1)
+        m_os.remove.assert_called_once_with(MockResolver.FILE_B.dst)
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.os')
+    def test_requeues_files_copied_past_first_uncopied_file_when_diskfull(self, m_os):
+        m_os.path.isfile.return_value = True
+        with pytest.raises(SystemExit):
+            self.copier.device_full_lock.set()
+            self.put_result(MockResolver.FILE_B, resultchannel.STARTED)
+            self.put_result(MockResolver.FILE_C, resultchannel.COMPLETED)
+            self.copier.prompt.input.return_value = 'q'
+            self.copier.start(device_start_index=0, start_index=0, maxloops=1)
+
+        # volumes hold files in index order, FILE_C is copied to the next device with FILE_B
+        m_os.remove.assert_any_call(MockResolver.FILE_C.dst)
+        assert MockResolver.FILE_C.index not in self.copier._copied_indexes
+        assert MockResolver.FILE_C.index not in self.copier._volume_indexes
+        assert self.copier.jobqueue.claim(3) == [0, 1, 2]
+
+    def test_copies_directory_stats_of_copied_files_when_finished(self):
+        self.put_result(MockResolver.FILE_A, resultchannel.COMPLETED)
+        self.put_result(MockResolver.FILE_B, resultchannel.ERROR)
+        self.put_result(MockResolver.FILE_C, resultchannel.COMPLETED)
+        filepairs = []
+        with mock.patch('{}.filesystem.copydirstats'.format(multiprocesscopier.__name__),
+                        side_effect=lambda pairs: filepairs.extend(pairs)):
+            self.copier.start(device_start_index=0, start_index=0, maxloops=1)
+        assert filepairs == [(MockResolver.FILE_A.src, MockResolver.FILE_A.dst),
+                             (MockResolver.FILE_C.src, MockResolver.FILE_C.dst)]
+
+    def test_records_peak_worker_rss(self):
+        writer = self.copier.results.writer()
+        writer.write(-1, resultchannel.EXITED, bytes=2048)
+        writer.write(-1, resultchannel.RETIRED, bytes=4096, errno=resultchannel.RETIRED_MAX_RSS)
+        writer.write(-1, resultchannel.EXITED, bytes=4096)
+        writer.flush()
+        self.copier.start(device_start_index=0, start_index=0, maxloops=1)
+        assert self.copier._peak_worker_rss == 4096
+        assert self.copier._num_retired_workers == 1
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem.volume_block_size', return_value=512)
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem.volume_free', return_value=1024 * 1024)
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem.physical_offset')
+    def test_physical_order_claims_window_in_disk_order(self, m_physical_offset, m_volume_free, m_block_size):
+        offsets = {MockResolver.FILE_A.src: 300, MockResolver.FILE_B.src: 100, MockResolver.FILE_C.src: 200}
+        m_physical_offset.side_effect = lambda src: offsets[src]
+        self.options.physical_order = True
+        self.options.device_padding = 0
+        self.copier.start(device_start_index=0, start_index=0, maxloops=1)
+        assert self.copier.jobqueue.claim(3) == [1, 2, 0]
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem.volume_block_size', return_value=512)
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem.volume_free', return_value=2200)
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem.physical_offset')
+    def test_physical_order_only_reorders_files_that_fit_on_volume(self, m_physical_offset, m_volume_free,
+                                                                   m_block_size):
+        offsets = {MockResolver.FILE_A.src: 300, MockResolver.FILE_B.src: 100, MockResolver.FILE_C.src: 0}
+        m_physical_offset.side_effect = lambda src: offsets[src]
+        self.options.physical_order = True
+        self.options.device_padding = 0
+        self.copier.start(device_start_index=0, start_index=0, maxloops=1)
+        assert self.copier.jobqueue.claim(3) == [1, 0, 2]
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem.volume_block_size', return_value=4096)
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem.volume_free', return_value=3 * 4096)
+    def test_window_counts_allocated_blocks_and_margin(self, m_volume_free, m_block_size):
+        self.options.device_padding = 0
+        self.copier._copyfiles = self.resolver.get_copyfiles()
+        # 1024 byte files each occupy a 4096 byte block, and part of the free space is kept as a margin
+        assert self.copier._estimate_window_stop(0) == 2
 
 
 class Test_MultiProcessCopierWorkerManager:
     def setup(self):
-        self.joblist = [MockResolver.FILE_A]
-        self.started_queue = multiprocessing.Queue()
-        self.completed_queue = multiprocessing.Queue()
-        self.error_queue = multiprocessing.Queue()
+        self.jobtable = jobtable.JobTable()
+        self.jobtable.load(MockResolver(None).get_copyfiles())
+        self.jobqueue = jobqueue.JobQueue()
+        self.jobqueue.reset(0, 1)
+        self.results = resultchannel.ResultChannel()
         self.device_full_lock = multiprocessing.Lock()
         self.options = copyoptions.CopyOptions()
         self.options.output = '/dst'
         self.options.num_workers = 3
+        self.options.spare_workers = 0
         self.manager = multiprocesscopier._MultiProcessCopierWorkerManager(
-            self.joblist,
-            self.started_queue,
-            self.completed_queue,
-            self.error_queue,
+            self.jobtable,
+            self.jobqueue,
+            self.results,
             self.device_full_lock,
             self.options
         )
@@ -133,6 +230,54 @@ class Test_MultiProcessCopierWorkerManager:
         self.manager.build_workers(maxloops=2)
         self.manager.active_workers() == 3
 
+    def test_build_workers_activates_spare_workers_first(self):
+        spare = mock.Mock()
+        self.manager._spares = [spare]
+        self.manager._workers = [mock.Mock(), mock.Mock()]
+        with mock.patch.object(self.manager, '_start_worker') as m_start_worker:
+            self.manager.build_workers()
+        assert spare.activate.called
+        assert spare in self.manager._workers
+        assert not m_start_worker.called
+
+    def test_build_workers_skips_exited_spare_workers(self):
+        spare = mock.Mock()
+        spare.is_alive.return_value = False
+        self.manager._spares = [spare]
+        self.manager._workers = [mock.Mock(), mock.Mock()]
+        with mock.patch.object(self.manager, '_start_worker') as m_start_worker:
+            self.manager.build_workers()
+        assert not spare.activate.called
+        assert self.manager._spares == []
+        m_start_worker.assert_called_once_with()
+
+    def test_build_workers_replaces_spare_workers(self):
+        self.options.spare_workers = 2
+        self.manager._workers = [mock.Mock(), mock.Mock(), mock.Mock()]
+        with mock.patch.object(self.manager, '_start_worker') as m_start_worker:
+            self.manager.build_workers()
+        assert m_start_worker.call_args_list == [mock.call(spare=True), mock.call(spare=True)]
+        assert len(self.manager._spares) == 2
+
+    def test_build_workers_stops_workers_when_autoscaled_down(self):
+        self.options.autoscale_workers = True
+        self.manager._autoscaler = mock.Mock(num_workers=3)
+        self.manager._autoscaler.evaluate.return_value = 2
+        self.manager._workers = [mock.Mock(), mock.Mock(), mock.Mock()]
+        self.manager.build_workers()
+        assert self.jobqueue.claim() is None
+        assert self.jobqueue.claim() == [0]
+
+    def test_build_workers_builds_workers_when_autoscaled_up(self):
+        self.options.autoscale_workers = True
+        self.manager._autoscaler = mock.Mock(num_workers=3)
+        self.manager._autoscaler.evaluate.return_value = 4
+        self.manager._workers = [mock.Mock(), mock.Mock(), mock.Mock()]
+        self.manager._autoscaler.num_workers = 4
+        with mock.patch.object(self.manager, '_start_worker') as m_start_worker:
+            self.manager.build_workers()
+        assert m_start_worker.call_count == 1
+
     def test_iter_removes_and_closes_exited_workers(self):
         """ __iter__ cleans up references to old workers.
         """
@@ -154,7 +299,43 @@ class Test_MultiProcessCopierWorkerManager:
         worker_b = mock.Mock()
         self.manager._workers = [worker_a, worker_b]
         self.manager.stop()
-        assert self.joblist[:2] == [None, None]
+        assert self.jobqueue.claim() is None
+        assert self.jobqueue.claim() is None
+        assert self.jobqueue.claim() == [0]
+
+    def test_stop_activates_and_issues_poison_pill_to_spare_workers(self):
+        spare = mock.Mock()
+        self.manager._workers = [mock.Mock()]
+        self.manager._spares = [spare]
+        self.manager.stop()
+        assert spare.activate.called
+        assert self.manager._spares == []
+        assert self.jobqueue.claim() is None
+        assert self.jobqueue.claim() is None
+        assert self.jobqueue.claim() == [0]
+
+    def test_stop_can_keep_spare_workers_waiting(self):
+        spare = mock.Mock()
+        self.manager._workers = [mock.Mock()]
+        self.manager._spares = [spare]
+        self.manager.stop(spares=False)
+        assert not spare.activate.called
+        assert self.jobqueue.claim() is None
+        assert self.jobqueue.claim() == [0]
+
+    def test_sentinels_include_exited_workers_not_yet_cleaned_up(self):
+        worker_a = mock.Mock()
+        worker_b = mock.Mock()
+        worker_b.is_alive.return_value = False
+
+        self.manager._workers = [worker_a, worker_b]
+        assert self.manager.sentinels() == [worker_a.sentinel, worker_b.sentinel]
+
+    def test_sentinels_exclude_spare_workers(self):
+        worker_a = mock.Mock()
+        self.manager._workers = [worker_a]
+        self.manager._spares = [mock.Mock()]
+        assert self.manager.sentinels() == [worker_a.sentinel]
 
     def test_terminate_terminates_processes(self):
         worker_a = mock.Mock()
@@ -196,23 +377,72 @@ class Test_MultiProcessCopierWorkerManager:
 
 class Test_MultiProcessCopierWorker:
     def setup(self):
-        self.joblist = [MockResolver.FILE_A]
-        self.started_queue = multiprocessing.Queue()
-        self.completed_queue = multiprocessing.Queue()
-        self.error_queue = multiprocessing.Queue()
+        self.jobtable = jobtable.JobTable()
+        self.jobtable.load(MockResolver(None).get_copyfiles())
+        self.jobqueue = jobqueue.JobQueue()
+        self.jobqueue.reset(0, 1)
+        self.results = resultchannel.ResultChannel()
         self.device_full_lock = multiprocessing.Event()
         self.options = copyoptions.CopyOptions()
         self.options.output = '/dst'
         self.worker = multiprocesscopier._MultiProcessCopierWorker(
-            self.joblist,
-            self.started_queue,
-            self.completed_queue,
-            self.error_queue,
+            self.jobtable,
+            self.jobqueue,
+            self.results.writer(),
             self.device_full_lock,
             self.options,
             maxtasks=3,
         )
 
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
+    def test_spare_worker_waits_for_activation(self, m_filesystem):
+        activation_event = mock.Mock()
+        self.worker._activation_event = activation_event
+        self.jobqueue.put_poison_pills(1)
+        self.worker.run(maxloops=3)
+        assert activation_event.wait.called
+
+    def test_checksum_recopies_files_with_same_size_and_mtime(self, tmpdir):
+        src = tmpdir.join('src.txt')
+        src.write('abc')
+        dst = tmpdir.join('dst.txt')
+        dst.write('xyz')
+        os.utime(str(dst), ns=(os.stat(str(src)).st_atime_ns, os.stat(str(src)).st_mtime_ns))
+        self.options.compare_checksum = True
+        data = copyfile.CopyFile(src=str(src), dst=str(dst), relpath='src.txt', bytes=3, index=0)
+        self.worker._copy(data)
+        assert dst.read() == 'abc'
+
+    def test_recopies_source_modified_since_jobfile_was_written(self, tmpdir):
+        src = tmpdir.mkdir('src').join('a.txt')
+        src.write('abc')
+        dst = tmpdir.mkdir('dst').join('a.txt')
+        dst.write('abc')
+        os.utime(str(dst), ns=(os.stat(str(src)).st_atime_ns, os.stat(str(src)).st_mtime_ns))
+        jobfile = tmpdir.join('jobfile.json')
+        jobfile.write(json.dumps(directorylistresolver._list_copyfiles([str(src.dirpath())], str(dst.dirpath()))))
+
+        # source modified before the job is resumed
+        src.write('xyz')
+        mtime_ns = os.stat(str(src)).st_mtime_ns + 1000000000
+        os.utime(str(src), ns=(mtime_ns, mtime_ns))
+
+        data = jobfileresolver._get_copyfiles(str(jobfile))[0]
+        self.worker._copy(data)
+        assert dst.read() == 'xyz'
+
+    def test_trust_dst_files_skips_files_with_same_size_and_mtime(self, tmpdir):
+        src = tmpdir.join('src.txt')
+        src.write('abc')
+        dst = tmpdir.join('dst.txt')
+        dst.write('xyz')
+        os.utime(str(dst), ns=(os.stat(str(src)).st_atime_ns, os.stat(str(src)).st_mtime_ns))
+        self.options.compare_checksum = True
+        self.options.trust_dst_files = True
+        data = copyfile.CopyFile(src=str(src), dst=str(dst), relpath='src.txt', bytes=3, index=0)
+        self.worker._copy(data)
+        assert dst.read() == 'xyz'
+
     @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
     def test_exits_if_device_full(self, m_filesystem):
         self.device_full_lock.set()
@@ -222,56 +452,253 @@ class Test_MultiProcessCopierWorker:
     @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
     def test_loops_while_list_empty(self, m_filesystem):
         # first iteration will process file A,
-        self.worker._joblist = [MockResolver.FILE_A]
+        self.jobqueue.reset(0, 1)
         self.worker.maxtasks = 5
+        self.worker.idle_timeout = 0
         loops = self.worker.run(maxloops=3)
         assert loops == 3
 
     @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
     def test_poison_pill_kills_process(self, m_filesystem):
-        self.worker._joblist = [None]
+        self.jobqueue.put_poison_pills(1)
         loops = self.worker.run(maxloops=3)
         assert loops == 0
 
     @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
     def test_copies_file(self, m_filesystem):
         filedata = MockResolver.FILE_A
-        self.worker._joblist = [filedata]
+        self.jobqueue.reset(filedata.index, filedata.index + 1)
         loops = self.worker.run(maxloops=1)
         m_filesystem.copyfile.assert_called_with(
             src=filedata.src,
             dst=filedata.dst,
             reraise=True,
-            log_errors=False
+            log_errors=False,
+            backend='kernel',
+            drop_cache=True,
+            throttle=None,
+            compare=False,
+            dircache=self.worker._dircache,
+            copystat=True,
+            srcstat=None,
         )
 
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
+    def test_throttles_copy_when_rate_limited(self, m_filesystem):
+        limiter = mock.Mock(spec=ratelimiter.RateLimiter)
+        limiter.limits_bytes.return_value = True
+        self.worker._ratelimiter = limiter
+        self.worker.run(maxloops=1)
+        limiter.throttle.assert_called_once_with(files=1)
+        assert m_filesystem.copyfile.call_args[1]['throttle'] == limiter.throttle
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
+    def test_copies_file_above_direct_io_threshold_with_direct_io(self, m_filesystem):
+        self.options.direct_io_threshold = 1024
+        self.worker.run(maxloops=1)
+        assert m_filesystem.copyfile.call_args[1]['backend'] == copybackends.DIRECT
+
     @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
     @mock.patch('os.path')
     def test_does_not_copy_file_if_files_not_different(self, m_ospath, m_filesystem):
         m_filesystem.files_different.return_value = False
         m_ospath.isfile.return_value = True
         filedata = MockResolver.FILE_A
-        self.worker._joblist = [filedata]
+        self.jobqueue.reset(filedata.index, filedata.index + 1)
         loops = self.worker.run(maxloops=1)
         assert not m_filesystem.copyfile.called
 
     @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
     def test_copies_file_stats(self, m_filesystem):
         filedata = MockResolver.FILE_A
-        self.worker._joblist = [filedata]
+        self.jobqueue.reset(filedata.index, filedata.index + 1)
         loops = self.worker.run(maxloops=1)
         m_filesystem.copyfile.assert_called_with(
             src=filedata.src,
             dst=filedata.dst,
             reraise=True,
-            log_errors=False
+            log_errors=False,
+            backend='kernel',
+            drop_cache=True,
+            throttle=None,
+            compare=False,
+            dircache=self.worker._dircache,
+            copystat=True,
+            srcstat=None,
         )
 
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
+    def test_writes_started_and_completed_results(self, m_filesystem):
+        filedata = MockResolver.FILE_A
+        self.jobqueue.reset(filedata.index, filedata.index + 1)
+        self.worker.run(maxloops=1)
+        results = self.results.read()
+        assert [(r.index, r.status) for r in results] == [
+            (filedata.index, resultchannel.STARTED),
+            (filedata.index, resultchannel.COMPLETED),
+            (-1, resultchannel.EXITED),
+        ]
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
+    def test_sends_started_result_before_copying_file(self, m_filesystem):
+        self.worker._results = self.results.writer(flush_interval=60)
+        sent = []
+        m_filesystem.copyfile.side_effect = lambda **kwargs: sent.extend(self.results.read())
+        self.worker.run(maxloops=1)
+        assert [(r.index, r.status) for r in sent] == [(MockResolver.FILE_A.index, resultchannel.STARTED)]
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
+    def test_sends_buffered_results_before_copying_chunk(self, m_filesystem):
+        self.worker._results = self.results.writer(flush_interval=60)
+        self.worker._results.write(MockResolver.FILE_B.index, resultchannel.COMPLETED)
+        self.jobqueue.publish_chunks(MockResolver.FILE_A.index, 2)
+        sent = []
+        m_filesystem.copyfile_range.side_effect = lambda *args, **kwargs: sent.extend(self.results.read())
+        self.worker.run(maxloops=1)
+        assert [(r.index, r.status) for r in sent] == [(MockResolver.FILE_B.index, resultchannel.COMPLETED)]
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.pagecache.willneed')
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
+    def test_prefetches_next_queued_files(self, m_filesystem, m_willneed):
+        self.jobqueue.reset(0, 3, prefetch=1)
+        self.options.small_file_batch_size = 1
+        self.worker.run(maxloops=1)
+        m_willneed.assert_called_once_with(MockResolver.FILE_B.src, MockResolver.FILE_B.bytes)
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
+    def test_large_file_copied_in_chunks(self, m_filesystem):
+        self.options.chunked_copy_threshold = 1024
+        self.options.chunked_copy_chunk_size = 512
+        self.worker.maxtasks = None
+        filedata = MockResolver.FILE_A
+        self.jobqueue.reset(filedata.index, filedata.index + 1)
+        m_filesystem.partial_path.side_effect = lambda dst: dst + '.partial'
+        self.worker.run(maxloops=3)
+
+        # chunks are written to a partial file, renamed once the last chunk is written
+        partial = filedata.dst + '.partial'
+        m_filesystem.preallocate.assert_called_with(partial, 1024)
+        assert m_filesystem.copyfile_range.call_args_list == [
+            mock.call(filedata.src, partial, 0, 512, drop_cache=True, direct=False, throttle=None),
+            mock.call(filedata.src, partial, 512, 512, drop_cache=True, direct=False, throttle=None),
+        ]
+        m_filesystem.finish_partial.assert_called_once_with(filedata.dst)
+        assert not m_filesystem.copyfile.called
+
+        # completed once, after last chunk
+        results = self.results.read()
+        assert [(r.index, r.status) for r in results] == [
+            (filedata.index, resultchannel.STARTED),
+            (filedata.index, resultchannel.COMPLETED),
+            (-1, resultchannel.EXITED),
+        ]
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.memory.peak_rss_bytes', return_value=4096)
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
+    def test_reports_peak_rss_on_exit(self, m_filesystem, m_peak_rss_bytes):
+        self.jobqueue.put_poison_pills(1)
+        self.worker.run(maxloops=3)
+        assert [(r.status, r.bytes) for r in self.results.read()] == [(resultchannel.EXITED, 4096)]
+
     @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
     def test_worker_stops_at_maxtasks(self, m_filesystem):
-        self.worker._joblist = [MockResolver.FILE_A, MockResolver.FILE_B, MockResolver.FILE_C]
+        self.options.small_file_batch_size = 1
+        self.jobqueue.reset(0, 3)
         self.worker.maxtasks = 2
         loops = self.worker.run(maxloops=5)
         assert loops == 2
 
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
+    def test_worker_reports_maxtasks_retirement(self, m_filesystem):
+        self.options.small_file_batch_size = 1
+        self.jobqueue.reset(0, 3)
+        self.worker.maxtasks = 1
+        self.worker.run(maxloops=5)
+        retired = [r for r in self.results.read() if r.status == resultchannel.RETIRED]
+        assert [r.errno for r in retired] == [resultchannel.RETIRED_MAX_TASKS]
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.memory')
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
+    def test_worker_retires_when_rss_exceeds_max(self, m_filesystem, m_memory):
+        m_memory.rss_bytes.return_value = 2048
+        m_memory.malloc_trim.return_value = False
+        self.options.max_worker_rss = 1024
+        self.options.small_file_batch_size = 1
+        self.jobqueue.reset(0, 3)
+        self.worker.maxtasks = None
+        loops = self.worker.run(maxloops=5)
+        assert loops == 1
+
+        retired = [r for r in self.results.read() if r.status == resultchannel.RETIRED]
+        assert [(r.errno, r.bytes) for r in retired] == [(resultchannel.RETIRED_MAX_RSS, 2048)]
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.memory')
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
+    def test_worker_continues_if_malloc_trim_releases_memory(self, m_filesystem, m_memory):
+        m_memory.rss_bytes.side_effect = [2048, 512, 2048, 512, 2048, 512]
+        m_memory.malloc_trim.return_value = True
+        self.options.max_worker_rss = 1024
+        self.options.small_file_batch_size = 1
+        self.jobqueue.reset(0, 3)
+        self.worker.maxtasks = None
+        loops = self.worker.run(maxloops=3)
+        assert loops == 3
+        assert m_memory.malloc_trim.call_count == 3
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
+    def test_small_files_copied_in_single_batch(self, m_filesystem):
+        self.jobqueue.reset(0, 3)
+        self.worker.maxtasks = 1
+        loops = self.worker.run(maxloops=5)
+        assert loops == 1
+        assert m_filesystem.copyfile.call_count == 3
+
+        results = self.results.read()
+        assert [(r.index, r.status) for r in results if r.status == resultchannel.COMPLETED] == [
+            (0, resultchannel.COMPLETED),
+            (1, resultchannel.COMPLETED),
+            (2, resultchannel.COMPLETED),
+        ]
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
+    def test_batch_copies_only_file_stats(self, m_filesystem):
+        self.jobqueue.reset(0, 3)
+        with mock.patch('multivolumecopy.copiers.multiprocesscopier.os.path.isfile', return_value=True):
+            with mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem.files_different', return_value=True):
+                self.worker.run(maxloops=1)
+
+        # file stats are copied before each file is renamed into place,
+        # directory stats are copied by the copier once the volume is complete
+        assert m_filesystem.copyfile.call_count == 3
+        assert all(c[1]['copystat'] is True for c in m_filesystem.copyfile.call_args_list)
+        assert not m_filesystem.copyfilestat.called
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
+    def test_batch_stops_when_device_full(self, m_filesystem):
+        m_filesystem.copyfile.side_effect = OSError(multiprocesscopier.POSIX_DISKFULL_ERRNO, 'device full')
+        self.jobqueue.reset(0, 3)
+        with mock.patch('multivolumecopy.copiers.multiprocesscopier.sys.platform', 'linux'):
+            self.worker.run(maxloops=1)
+        assert self.device_full_lock.is_set()
+        assert m_filesystem.copyfile.call_count == 1
+
+        # the rest of the batch is queued again by the main process (with every other uncopied file)
+        results = self.results.read()
+        assert [r.index for r in results if r.status == resultchannel.STARTED] == [0]
+
+    @mock.patch('multivolumecopy.copiers.multiprocesscopier.filesystem')
+    def test_batch_copies_remaining_files_before_raising_error(self, m_filesystem):
+        m_filesystem.copyfile.side_effect = [None, OSError(13, 'permission denied'), None]
+        self.jobqueue.reset(0, 3)
+        with pytest.raises(OSError):
+            self.worker.run(maxloops=1)
+        assert m_filesystem.copyfile.call_count == 3
+
+        results = self.results.read()
+        assert [(r.index, r.status) for r in results if r.status != resultchannel.STARTED] == [
+            (0, resultchannel.COMPLETED),
+            (1, resultchannel.ERROR),
+            (2, resultchannel.COMPLETED),
+            (-1, resultchannel.EXITED),
+        ]
 
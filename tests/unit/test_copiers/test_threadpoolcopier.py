@@ -0,0 +1,56 @@
+from multivolumecopy.copiers import threadpoolcopier
+from multivolumecopy.resolvers import directorylistresolver
+from multivolumecopy import copyoptions, jobqueue, jobtable, resultchannel
+from .test_multiprocesscopier import MockResolver
+import multiprocessing
+import multiprocessing.connection
+
+
+class TestThreadPoolCopier:
+    def test_copies_files(self, tmpdir):
+        src = tmpdir.mkdir('src')
+        for i in range(10):
+            src.join('file{}.txt'.format(i)).write('contents {}'.format(i) * 100)
+
+        options = copyoptions.CopyOptions()
+        options.output = str(tmpdir.mkdir('dst'))
+        options.jobfile = str(tmpdir.join('jobfile.json'))
+        options.device_tuning = set()
+        options.num_workers = 2
+        resolver = directorylistresolver.DirectoryListResolver([str(src)], options)
+        copier = threadpoolcopier.ThreadPoolCopier(resolver, options)
+        copier.start()
+
+        assert copier.copy_finished()
+        for i in range(10):
+            filename = 'file{}.txt'.format(i)
+            assert tmpdir.join('dst', filename).read() == src.join(filename).read()
+
+
+class Test_ThreadPoolCopierWorker:
+    def setup(self):
+        self.jobtable = jobtable.JobTable()
+        self.jobtable.load(MockResolver(None).get_copyfiles())
+        self.jobqueue = jobqueue.JobQueue()
+        self.jobqueue.reset(0, 1)
+        self.results = resultchannel.ResultChannel()
+        self.options = copyoptions.CopyOptions()
+        self.worker = threadpoolcopier._ThreadPoolCopierWorker(
+            self.jobtable,
+            self.jobqueue,
+            self.results.writer(),
+            multiprocessing.Event(),
+            self.options,
+        )
+
+    def test_sentinel_ready_when_thread_exits(self):
+        self.jobqueue.put_poison_pills(1)
+        self.worker.start()
+        assert multiprocessing.connection.wait([self.worker.sentinel], timeout=5) == [self.worker.sentinel]
+        self.worker.join(5)
+        assert not self.worker.is_alive()
+
+    def test_never_retires(self):
+        self.worker.maxtasks = 1
+        self.options.max_worker_rss = 0
+        assert self.worker._retire_if_needed(files_processed=100) is False
@@ -0,0 +1,92 @@
+from multivolumecopy import copybackends
+import errno
+import mock
+import pytest
+
+
+class TestCopyBackends:
+    @pytest.mark.parametrize('backend', copybackends.names())
+    def test_backend_copies_contents(self, backend, tmpdir):
+        (src, dst) = self.create_files(tmpdir)
+        with open(src, 'rb', buffering=0) as fsrc:
+            with open(dst, 'wb', buffering=0) as fdst:
+                # small chunks, so each backend loops
+                used_backend = copybackends.copy(fsrc, fdst, (backend,), chunk_size=4096)
+        assert used_backend == backend
+        assert open(dst, 'rb').read() == open(src, 'rb').read()
+
+    @pytest.mark.parametrize('backend', copybackends.names())
+    def test_backend_throttles_every_byte_copied(self, backend, tmpdir):
+        (src, dst) = self.create_files(tmpdir)
+        throttle = mock.Mock()
+        with open(src, 'rb', buffering=0) as fsrc:
+            with open(dst, 'wb', buffering=0) as fdst:
+                copybackends.copy(fsrc, fdst, (backend,), chunk_size=4096, throttle=throttle)
+        assert sum(call[0][0] for call in throttle.call_args_list) == len(open(src, 'rb').read())
+
+    @pytest.mark.parametrize('backend', copybackends.names())
+    def test_backend_copies_empty_file(self, backend, tmpdir):
+        (src, dst) = self.create_files(tmpdir, data=b'')
+        with open(src, 'rb', buffering=0) as fsrc:
+            with open(dst, 'wb', buffering=0) as fdst:
+                copybackends.copy(fsrc, fdst, (backend,), chunk_size=4096)
+        assert open(dst, 'rb').read() == b''
+
+    def test_falls_back_to_next_backend_when_unsupported(self, tmpdir):
+        (src, dst) = self.create_files(tmpdir)
+        exc = OSError(errno.EXDEV, 'cross-device link')
+        with mock.patch('os.copy_file_range', side_effect=exc, create=True):
+            with open(src, 'rb', buffering=0) as fsrc:
+                with open(dst, 'wb', buffering=0) as fdst:
+                    used_backend = copybackends.copy(fsrc, fdst, copybackends.chain(copybackends.KERNEL), 4096)
+        assert used_backend == copybackends.SENDFILE
+        assert open(dst, 'rb').read() == open(src, 'rb').read()
+
+    def test_raises_when_last_backend_unsupported(self, tmpdir):
+        (src, dst) = self.create_files(tmpdir)
+        exc = OSError(errno.ENOSYS, 'not implemented')
+        with mock.patch('os.sendfile', side_effect=exc, create=True):
+            with open(src, 'rb', buffering=0) as fsrc:
+                with open(dst, 'wb', buffering=0) as fdst:
+                    with pytest.raises(OSError):
+                        copybackends.copy(fsrc, fdst, (copybackends.SENDFILE,), 4096)
+
+    def test_pipeline_failure_leaves_offsets_at_last_write(self, tmpdir):
+        (src, dst) = self.create_files(tmpdir)
+        with open(src, 'rb', buffering=0) as fsrc:
+            with open(dst, 'wb', buffering=0) as fdst:
+                fdst.write = mock.Mock(side_effect=[100, OSError(errno.EINVAL, 'invalid')])
+                with pytest.raises(OSError):
+                    copybackends.copy(fsrc, fdst, (copybackends.PIPELINE,), chunk_size=4096)
+                assert fsrc.tell() == 100
+
+    def test_pipeline_raises_read_errors(self, tmpdir):
+        (src, dst) = self.create_files(tmpdir)
+        with open(src, 'rb', buffering=0) as fsrc:
+            with open(dst, 'wb', buffering=0) as fdst:
+                fsrc.readinto = mock.Mock(side_effect=OSError(errno.EIO, 'io error'))
+                with pytest.raises(OSError):
+                    copybackends.copy(fsrc, fdst, (copybackends.PIPELINE,), chunk_size=4096)
+
+    def test_reusable_buffer_reuses_memory(self):
+        first = copybackends.reusable_buffer(1024)
+        first[0:3] = b'abc'
+        assert len(copybackends.reusable_buffer(512)) == 512
+        assert copybackends.reusable_buffer(1024)[0:3].tobytes() == b'abc'
+
+    def test_reusable_buffer_grows(self):
+        copybackends.reusable_buffer(16, slot='test')
+        assert len(copybackends.reusable_buffer(4096, slot='test')) == 4096
+
+    def test_chain_ends_in_readwrite(self):
+        assert copybackends.chain(copybackends.MMAP) == (copybackends.MMAP, copybackends.READWRITE)
+        assert copybackends.chain(copybackends.READWRITE) == (copybackends.READWRITE,)
+
+    def test_chain_raises_for_unknown_backend(self):
+        with pytest.raises(KeyError):
+            copybackends.chain('invalid')
+
+    def create_files(self, tmpdir, data=b'abcdefg' * 10000):
+        src = tmpdir.join('src.txt')
+        src.write_binary(data)
+        return (str(src), str(tmpdir.join('dst.txt')))
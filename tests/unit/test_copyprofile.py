@@ -0,0 +1,82 @@
+from multivolumecopy import copybackends, copyfile, copyprofile
+import errno
+import json
+import mock
+import pytest
+
+
+class Test_size_class:
+    @pytest.mark.parametrize('filesize, expects', [
+        (0, 'small'),
+        (1024 * 1024, 'medium'),
+        (64 * 1024 * 1024, 'large'),
+    ])
+    def test(self, filesize, expects):
+        assert copyprofile.size_class(filesize) == expects
+
+
+class TestCopyProfile:
+    def test_backend_for_uses_size_class(self):
+        profile = copyprofile.CopyProfile({'small': copybackends.SENDFILE})
+        assert profile.backend_for(1024) == copybackends.SENDFILE
+
+    def test_backend_for_defaults_to_kernel(self):
+        profile = copyprofile.CopyProfile({'small': copybackends.SENDFILE})
+        assert profile.backend_for(1024 * 1024 * 1024) == copybackends.KERNEL
+
+
+class Test_load_or_calibrate:
+    def test_calibrates_and_caches_profile(self, tmpdir):
+        copyfiles = self.create_copyfiles(tmpdir)
+        output = str(tmpdir.mkdir('dst'))
+        cachefile = str(tmpdir.join('cache.json'))
+
+        profile = copyprofile.load_or_calibrate(copyfiles, output, cachefile)
+        assert set(profile.backends) == {'small'}
+        assert profile.backends['small'] in copyprofile.CANDIDATE_BACKENDS
+
+        key = copyprofile.profile_key(copyfiles, output)
+        with open(cachefile, 'r') as fd:
+            assert json.load(fd) == {key: profile.backends}
+
+        # calibration does not leave files behind
+        assert tmpdir.join('dst').listdir() == []
+
+    def test_falls_back_to_default_backend_if_sample_cannot_be_copied(self, tmpdir):
+        copyfiles = self.create_copyfiles(tmpdir)
+        output = str(tmpdir.mkdir('dst'))
+        cachefile = tmpdir.join('cache.json')
+
+        error = OSError(errno.ENOSPC, 'No space left on device')
+        with mock.patch.object(copyprofile.filesystem, 'copyfile_contents', side_effect=error):
+            profile = copyprofile.load_or_calibrate(copyfiles, output, str(cachefile))
+        assert profile == copyprofile.CopyProfile()
+        assert profile.backend_for(4096) == copybackends.KERNEL
+
+        # not cached, and calibration does not leave files behind
+        assert not cachefile.exists()
+        assert tmpdir.join('dst').listdir() == []
+
+    def test_uses_cached_profile(self, tmpdir):
+        copyfiles = self.create_copyfiles(tmpdir)
+        output = str(tmpdir.mkdir('dst'))
+        cachefile = tmpdir.join('cache.json')
+        key = copyprofile.profile_key(copyfiles, output)
+        cachefile.write(json.dumps({key: {'small': copybackends.MMAP}}))
+
+        with mock.patch.object(copyprofile, 'calibrate') as m_calibrate:
+            profile = copyprofile.load_or_calibrate(copyfiles, output, str(cachefile))
+        assert not m_calibrate.called
+        assert profile == copyprofile.CopyProfile({'small': copybackends.MMAP})
+
+    def test_compare_direct_io_reports_throughput(self, tmpdir):
+        copyfiles = self.create_copyfiles(tmpdir)
+        tempdst = str(tmpdir.join('tempdst'))
+        throughput = copyprofile.compare_direct_io(copyfiles, tempdst)
+        assert throughput[copybackends.KERNEL] > 0
+        assert set(throughput) <= {copybackends.KERNEL, copybackends.DIRECT}
+
+    def create_copyfiles(self, tmpdir):
+        src = tmpdir.mkdir('src').join('a.txt')
+        src.write_binary(b'a' * 4096)
+        return (copyfile.CopyFile(src=str(src), dst='/dst/a.txt', relpath='a.txt', bytes=4096, index=0),)
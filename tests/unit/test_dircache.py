@@ -0,0 +1,48 @@
+from multivolumecopy import dircache
+import mock
+import os
+import pytest
+
+
+@pytest.mark.skipif(not dircache.supported(), reason='requires dir_fd support')
+class TestDirectoryCache:
+    def setup(self):
+        self.dircache = dircache.DirectoryCache(max_dirs=2)
+
+    def teardown(self):
+        self.dircache.close()
+
+    def test_creates_missing_directories(self, tmpdir):
+        dirpath = str(tmpdir.join('a', 'b'))
+        fd = self.dircache.open(dirpath)
+        assert os.path.isdir(dirpath)
+        assert os.path.samestat(os.fstat(fd), os.stat(dirpath))
+
+    def test_reuses_open_directory(self, tmpdir):
+        dirpath = str(tmpdir.join('a'))
+        fd = self.dircache.open(dirpath)
+        with mock.patch('{}.os.open'.format(dircache.__name__)) as m_open:
+            assert self.dircache.open(dirpath) == fd
+        assert not m_open.called
+
+    def test_closes_least_recently_used_directory(self, tmpdir):
+        fd_a = self.dircache.open(str(tmpdir.join('a')))
+        self.dircache.open(str(tmpdir.join('b')))
+        self.dircache.open(str(tmpdir.join('a')))
+        self.dircache.open(str(tmpdir.join('c')))
+        assert len(self.dircache) == 2
+        assert self.dircache.open(str(tmpdir.join('a'))) == fd_a
+
+    def test_close_closes_all_directories(self, tmpdir):
+        fd = self.dircache.open(str(tmpdir.join('a')))
+        self.dircache.close()
+        assert len(self.dircache) == 0
+        with pytest.raises(OSError):
+            os.fstat(fd)
+
+
+class TestDirectoryCacheDisabled:
+    def test_creates_directory_without_opening_it(self, tmpdir):
+        dirpath = str(tmpdir.join('a'))
+        assert dircache.DirectoryCache(max_dirs=0).open(dirpath) is None
+        assert os.path.isdir(dirpath)
@@ -2,8 +2,10 @@
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
-from multivolumecopy import filesystem
+from multivolumecopy import copybackends, copyfile, filesystem
+import errno
 import mock
+import os
 import pytest
 
 
@@ -67,6 +69,15 @@ class Test_backup_bytes(object):
                 assert result == 5000
 
 
+class Test_allocated_size(object):
+    def test_rounds_up_to_block_size(self):
+        assert filesystem.allocated_size(1, 4096) == 4096
+        assert filesystem.allocated_size(4097, 4096) == 8192
+
+    def test_exact_multiple_unchanged(self):
+        assert filesystem.allocated_size(8192, 4096) == 8192
+
+
 class Test_get_mount(object):
     def test(self):
         def ismount(path):
@@ -80,71 +91,80 @@ class Test_get_mount(object):
 
 
 class Test_files_different(object):
-    def test_different_mtime(self):
-        result = self.files_different(
-            mtime=True, size=False, checksum=False,
-            mtime_a=111.1, mtime_b=222.2,
-        )
-        assert result is True
-
-    def test_different_size(self):
-        result = self.files_different(
-            mtime=False, size=True, checksum=False,
-            size_a=1024.0, size_b=2048.0,
-        )
-        assert result is False
-
-    def test_same_mtime(self):
-        result = self.files_different(
-            mtime=True, size=False, checksum=False,
-            mtime_a=111.1, mtime_b=111.1,
-        )
-        assert result is False
-
-    def test_same_size(self):
-        result = self.files_different(
-            mtime=False, size=True, checksum=False,
-            size_a=1024.0, size_b=1024.0,
-        )
-        assert result is True
-
-    def files_different(
-        self,
-        mtime=False,
-        size=False,
-        checksum=False,
-        mtime_a=None,
-        mtime_b=None,
-        size_a=None,
-        size_b=None,
-        checksum_a=None,
-        checksum_b=None
-    ):
-        def getmtime(path):
-            if path == '/a.txt':
-                return mtime_a
-            elif path == '/b.txt':
-                return mtime_b
-            raise RuntimeError('bad test data')
-
-        def getsize(path):
-            if path == '/a.txt':
-                return size_a
-            elif path == '/b.txt':
-                return size_b
-            raise RuntimeError('bad test data')
-
-        def getchecksum(path):
-            if path == '/a.txt':
-                return checksum_a
-            elif path == '/b.txt':
-                return checksum_b
-            raise RuntimeError('bad test data')
-
-        with mock.patch('{}.os.path.getmtime'.format(ns), side_effect=getmtime):
-            with mock.patch('{}.os.path.getsize'.format(ns), side_effect=getsize):
-                result = filesystem.files_different('/a.txt', '/b.txt', mtime=mtime, size=size, checksum=checksum)
-                return result
+    def test_different_mtime(self, tmpdir):
+        (a, b) = self.create_files(tmpdir, mtime_a=111.1, mtime_b=222.2)
+        assert filesystem.files_different(a, b, mtime=True, size=False) is True
+
+    def test_same_mtime(self, tmpdir):
+        (a, b) = self.create_files(tmpdir, mtime_a=111.1, mtime_b=111.1)
+        assert filesystem.files_different(a, b, mtime=True, size=False) is False
+
+    def test_mtime_within_tolerance(self, tmpdir):
+        (a, b) = self.create_files(tmpdir, mtime_a=110.0, mtime_b=111.5)
+        assert filesystem.files_different(a, b, mtime=True, size=False, mtime_tolerance=2.0) is False
+        assert filesystem.files_different(a, b, mtime=True, size=False, mtime_tolerance=1.0) is True
+
+    def test_different_size(self, tmpdir):
+        (a, b) = self.create_files(tmpdir, data_a=b'abc', data_b=b'abcdef')
+        assert filesystem.files_different(a, b, mtime=False, size=True) is True
+
+    def test_same_size(self, tmpdir):
+        (a, b) = self.create_files(tmpdir, data_a=b'abc', data_b=b'xyz')
+        assert filesystem.files_different(a, b, mtime=False, size=True) is False
+
+    def test_different_checksum(self, tmpdir):
+        (a, b) = self.create_files(tmpdir, data_a=b'abc', data_b=b'xyz')
+        assert filesystem.files_different(a, b, mtime=False, size=False, checksum=True) is True
+
+    def test_same_checksum(self, tmpdir):
+        (a, b) = self.create_files(tmpdir, mtime_a=111.1, mtime_b=111.1)
+        assert filesystem.files_different(a, b, mtime=True, size=True, checksum=True) is False
+
+    def test_checksum_not_read_when_mtime_differs(self, tmpdir):
+        (a, b) = self.create_files(tmpdir, mtime_a=111.1, mtime_b=222.2)
+        with mock.patch('{}.contents_different'.format(ns)) as m_contents_different:
+            assert filesystem.files_different(a, b, mtime=True, checksum=True) is True
+        assert not m_contents_different.called
+
+    def test_uses_stat_a_if_provided(self, tmpdir):
+        (a, b) = self.create_files(tmpdir, mtime_a=100.0, mtime_b=100.0)
+        stat_a = copyfile.SrcStat(st_size=3, st_mtime_ns=200 * 10 ** 9, st_mode=0o100644, st_ino=1, st_dev=1)
+        assert filesystem.files_different(a, b, stat_a=stat_a) is True
+
+    def test_missing_file_b_is_different(self, tmpdir):
+        (a, b) = self.create_files(tmpdir)
+        assert filesystem.files_different(a, b + '.missing') is True
+
+    def test_directory_file_b_is_different(self, tmpdir):
+        (a, b) = self.create_files(tmpdir)
+        assert filesystem.files_different(a, str(tmpdir)) is True
+
+    def create_files(self, tmpdir, data_a=b'abc', data_b=b'abc', mtime_a=100.0, mtime_b=100.0):
+        a = tmpdir.join('a.txt')
+        b = tmpdir.join('b.txt')
+        a.write_binary(data_a)
+        b.write_binary(data_b)
+        os.utime(str(a), (mtime_a, mtime_a))
+        os.utime(str(b), (mtime_b, mtime_b))
+        return (str(a), str(b))
+
+
+class Test_contents_different(object):
+    @pytest.mark.parametrize('data_b', [b'abcdefgh' * 4, b'abcdefgh' * 3 + b'abcdefgX', b'abcdefgh' * 3])
+    def test_compares_each_chunk(self, tmpdir, data_b):
+        data_a = b'abcdefgh' * 4
+        a = tmpdir.join('a.txt')
+        b = tmpdir.join('b.txt')
+        a.write_binary(data_a)
+        b.write_binary(data_b)
+        assert filesystem.contents_different(str(a), str(b), chunk_size=8) is (data_a != data_b)
+
+    def test_single_chunk(self, tmpdir):
+        a = tmpdir.join('a.txt')
+        b = tmpdir.join('b.txt')
+        a.write_binary(b'abc')
+        b.write_binary(b'abd')
+        assert filesystem.contents_different(str(a), str(b)) is True
 
 
 class Test_copyfile(object):
@@ -160,12 +180,176 @@ class Test_copyfile(object):
         result = self.copyfile(dst_exists=True, dst_different=False)
         assert result is False
 
-    def copyfile(self, dst_exists=False, dst_different=False):
-        with mock.patch('{}.shutil'.format(ns)):
+    def test_dst_is_same_copied_without_compare(self):
+        result = self.copyfile(dst_exists=True, dst_different=False, compare=False)
+        assert result is True
+
+    def test_writes_partial_file_then_renames(self, tmpdir):
+        src = tmpdir.join('src.txt')
+        src.write('abc')
+        dst = str(tmpdir.join('dst', 'file.txt'))
+
+        def copyfile_contents(src, dst, *args):
+            assert dst == filesystem.partial_path(str(tmpdir.join('dst', 'file.txt')))
+            with open(dst, 'w') as fd:
+                fd.write('abc')
+            return ('readwrite', os.stat(src))
+
+        with mock.patch('{}._copyfile_contents'.format(ns), side_effect=copyfile_contents):
+            assert filesystem.copyfile(str(src), dst) is True
+        assert open(dst).read() == 'abc'
+        assert os.listdir(str(tmpdir.join('dst'))) == ['file.txt']
+
+    def test_failed_copy_leaves_existing_dst(self, tmpdir):
+        src = tmpdir.join('src.txt')
+        src.write('abcdef')
+        dst = tmpdir.join('dst.txt')
+        dst.write('old')
+
+        def copyfile_contents(src, dst, *args):
+            with open(dst, 'w') as fd:
+                fd.write('abc')
+            raise OSError(errno.EIO, 'I/O error')
+
+        with mock.patch('{}._copyfile_contents'.format(ns), side_effect=copyfile_contents):
+            with pytest.raises(OSError):
+                filesystem.copyfile(str(src), str(dst), log_errors=False)
+        assert dst.read() == 'old'
+        assert not os.path.exists(filesystem.partial_path(str(dst)))
+
+    def test_applies_srcstat_if_source_unchanged(self, tmpdir):
+        src = tmpdir.join('src.txt')
+        src.write('abc')
+        dst = tmpdir.join('dst.txt')
+        src_stat = os.stat(str(src))
+        srcstat = copyfile.SrcStat(3, src_stat.st_mtime_ns, 0o100600, src_stat.st_ino, src_stat.st_dev)
+        filesystem.copyfile(str(src), str(dst), copystat=True, srcstat=srcstat)
+        assert os.stat(str(dst)).st_mode & 0o777 == 0o600
+
+    def test_ignores_stale_srcstat_if_source_changed(self, tmpdir):
+        src = tmpdir.join('src.txt')
+        src.write('abc')
+        dst = tmpdir.join('dst.txt')
+        srcstat = copyfile.SrcStat(3, 1577836800123456789, 0o100600, 1, 1)
+        filesystem.copyfile(str(src), str(dst), copystat=True, srcstat=srcstat)
+        assert os.stat(str(dst)).st_mtime_ns == os.stat(str(src)).st_mtime_ns
+
+    def copyfile(self, dst_exists=False, dst_different=False, compare=True):
+        with mock.patch('{}._copyfile_contents'.format(ns), return_value=('readwrite', None)), \
+                mock.patch('{}.partial_path'.format(ns)), \
+                mock.patch('{}.finish_partial'.format(ns)):
             with mock.patch('{}.os'.format(ns)) as mock_os:
-                with mock.patch('{}.files_different'.format(ns), return_value=dst_different):
+                # (a missing dst is different)
+                with mock.patch('{}.files_different'.format(ns), return_value=dst_different or not dst_exists):
                     mock_os.path.isfile = mock.Mock(return_value=dst_exists)
-                    return filesystem.copyfile('/src/file.txt', '/dst/file.txt')
+                    return filesystem.copyfile('/src/file.txt', '/dst/file.txt', compare=compare)
+
+
+class Test_partial_path(object):
+    def test_hidden_in_same_directory(self):
+        assert filesystem.partial_path('/dst/path/file.txt') == '/dst/path/.file.txt.mvcopy-partial'
+
+    def test_long_names_are_hashed(self):
+        partial = filesystem.partial_path('/dst/' + 'a' * 250)
+        assert os.path.dirname(partial) == '/dst'
+        assert len(os.path.basename(partial)) <= 255
+
+
+class Test_copyfile_contents(object):
+    def test_copies_contents(self, tmpdir):
+        (src, dst) = self.create_files(tmpdir)
+        filesystem.copyfile_contents(src, dst)
+        assert open(dst, 'rb').read() == open(src, 'rb').read()
+
+    def test_falls_back_when_copy_file_range_unsupported(self, tmpdir):
+        (src, dst) = self.create_files(tmpdir)
+        exc = OSError(errno.EXDEV, 'cross-device link')
+        with mock.patch('{}.os.copy_file_range'.format(ns), side_effect=exc, create=True):
+            method = filesystem.copyfile_contents(src, dst)
+        assert method == copybackends.SENDFILE
+        assert open(dst, 'rb').read() == open(src, 'rb').read()
+
+    def test_falls_back_to_readwrite_when_kernel_copies_unsupported(self, tmpdir):
+        (src, dst) = self.create_files(tmpdir)
+        exc = OSError(errno.ENOSYS, 'not implemented')
+        with mock.patch('{}.os.copy_file_range'.format(ns), side_effect=exc, create=True):
+            with mock.patch('{}.os.sendfile'.format(ns), side_effect=exc, create=True):
+                method = filesystem.copyfile_contents(src, dst)
+        assert method == copybackends.READWRITE
+        assert open(dst, 'rb').read() == open(src, 'rb').read()
+
+    def test_creates_dst_relative_to_dir_fd(self, tmpdir):
+        (src, dst) = self.create_files(tmpdir)
+        dir_fd = os.open(str(tmpdir), os.O_RDONLY)
+        try:
+            with mock.patch('{}.os.open'.format(ns), wraps=os.open) as m_open:
+                filesystem.copyfile_contents(src, dst, dir_fd=dir_fd)
+        finally:
+            os.close(dir_fd)
+        assert mock.call(os.path.basename(dst), mock.ANY, 0o666, dir_fd=dir_fd) in m_open.call_args_list
+        assert open(dst, 'rb').read() == open(src, 'rb').read()
+
+    def test_drop_cache_advises_src_and_dst(self, tmpdir):
+        (src, dst) = self.create_files(tmpdir)
+        with mock.patch('{}.pagecache.dontneed'.format(ns)) as m_dontneed:
+            filesystem.copyfile_contents(src, dst, drop_cache=True)
+        assert m_dontneed.call_count == 2
+        assert open(dst, 'rb').read() == open(src, 'rb').read()
+
+    @pytest.mark.parametrize('size', [0, 4096, 300000])
+    def test_direct_copies_contents(self, size, tmpdir):
+        (src, dst) = self.create_files(tmpdir)
+        tmpdir.join('src.txt').write_binary(b'abc' * (size // 3))
+        method = filesystem.copyfile_contents(src, dst, copybackends.DIRECT)
+        assert method in (copybackends.DIRECT, copybackends.COPY_FILE_RANGE)
+        assert open(dst, 'rb').read() == open(src, 'rb').read()
+
+    def test_direct_falls_back_when_refused(self, tmpdir):
+        (src, dst) = self.create_files(tmpdir)
+        exc = OSError(errno.EINVAL, 'invalid argument')
+        with mock.patch('{}.copybackends.copy_direct'.format(ns), side_effect=exc):
+            method = filesystem.copyfile_contents(src, dst, copybackends.DIRECT)
+        assert method != copybackends.DIRECT
+        assert open(dst, 'rb').read() == open(src, 'rb').read()
+
+    def test_raises_when_device_full(self, tmpdir):
+        (src, dst) = self.create_files(tmpdir)
+        exc = OSError(errno.ENOSPC, 'no space left on device')
+        with mock.patch('{}.os.copy_file_range'.format(ns), side_effect=exc, create=True):
+            with pytest.raises(OSError):
+                filesystem.copyfile_contents(src, dst)
+
+    def create_files(self, tmpdir):
+        src = tmpdir.join('src.txt')
+        src.write_binary(b'abc' * 100000)
+        return (str(src), str(tmpdir.join('dst.txt')))
+
+
+class Test_copyfile_range(object):
+    def test_copies_ranges_of_preallocated_file(self, tmpdir):
+        data = bytes(bytearray(range(256))) * 40
+        src = tmpdir.join('src.img')
+        src.write_binary(data)
+        dst = str(tmpdir.join('dst', 'dst.img'))
+
+        filesystem.preallocate(dst, len(data))
+        # copied out of order, as several workers would
+        filesystem.copyfile_range(str(src), dst, 4096, len(data) - 4096)
+        filesystem.copyfile_range(str(src), dst, 0, 4096)
+        assert open(dst, 'rb').read() == data
+
+    def test_falls_back_when_copy_file_range_unsupported(self, tmpdir):
+        data = b'abc' * 1000
+        src = tmpdir.join('src.img')
+        src.write_binary(data)
+        dst = str(tmpdir.join('dst.img'))
+
+        filesystem.preallocate(dst, len(data))
+        exc = OSError(errno.EXDEV, 'cross-device link')
+        with mock.patch('{}.os.copy_file_range'.format(ns), side_effect=exc, create=True):
+            backend = filesystem.copyfile_range(str(src), dst, 0, len(data))
+        assert backend == copybackends.PREADV
+        assert open(dst, 'rb').read() == data
 
 
 class Test_copyfilestat(object):
@@ -181,12 +365,60 @@ class Test_copyfilestat(object):
             mock.call.copystat('/src/path/to/file.txt', '/dst/path/to/file.txt'),
         ]
 
-    def copyfilestat(self, src, dst):
+    def test_without_parents(self):
+        calls = self.copyfilestat('/src/path/to/file.txt', '/dst/path/to/file.txt', parents=False)
+        assert calls == [mock.call.copystat('/src/path/to/file.txt', '/dst/path/to/file.txt')]
+
+    def test_applies_srcstat_instead_of_src_stat(self, tmpdir):
+        src = tmpdir.join('src.txt')
+        dst = tmpdir.join('dst.txt')
+        src.write('abc')
+        dst.write('abc')
+        srcstat = copyfile.SrcStat(st_size=3, st_mtime_ns=1577836800123456789, st_mode=0o100600, st_ino=1, st_dev=1)
+        with mock.patch('{}.shutil'.format(ns)) as mock_shutil:
+            filesystem.copyfilestat(str(src), str(dst), parents=False, srcstat=srcstat)
+        assert not mock_shutil.copystat.called
+        assert os.stat(str(dst)).st_mtime_ns == 1577836800123456789
+        assert os.stat(str(dst)).st_mode & 0o777 == 0o600
+
+    def copyfilestat(self, src, dst, parents=True):
         with mock.patch('{}.shutil'.format(ns)) as mock_shutil:
-            filesystem.copyfilestat(src, dst)
+            filesystem.copyfilestat(src, dst, parents=parents)
             return mock_shutil.mock_calls
 
 
+class Test_copydirstats(object):
+    def test_copies_each_directory_once_deepest_first(self):
+        with mock.patch('{}.shutil'.format(ns)) as mock_shutil:
+            num_directories = filesystem.copydirstats([
+                ('/src/path/to/a.txt', '/dst/path/to/a.txt'),
+                ('/src/path/to/b.txt', '/dst/path/to/b.txt'),
+                ('/src/path/c.txt',    '/dst/path/c.txt'),
+            ])
+        assert num_directories == 2
+        assert mock_shutil.mock_calls == [
+            mock.call.copystat('/src/path/to', '/dst/path/to'),
+            mock.call.copystat('/src/path',    '/dst/path'),
+        ]
+
+
+class Test_physical_offset(object):
+    def test_empty_file_is_zero(self, tmpdir):
+        filepath = tmpdir.join('empty.txt')
+        filepath.write('')
+        assert filesystem.physical_offset(str(filepath)) == 0
+
+    def test_unsupported_returns_none(self, tmpdir):
+        filepath = tmpdir.join('file.txt')
+        filepath.write('abc')
+        with mock.patch('fcntl.ioctl', side_effect=OSError(errno.ENOTTY, 'ENOTTY')):
+            assert filesystem.physical_offset(str(filepath)) is None
+
+    def test_missing_file_raises(self, tmpdir):
+        with pytest.raises(OSError):
+            filesystem.physical_offset(str(tmpdir.join('missing.txt')))
+
+
 class Test_common_relpath(object):
     def test_file2file(self):
         result = filesystem.common_relpath('/src/file.txt', '/dst/file.txt')
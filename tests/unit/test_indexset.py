@@ -0,0 +1,69 @@
+from multivolumecopy import indexset
+import pytest
+
+
+class TestIndexSet:
+    def test_add_and_contains(self):
+        indexes = indexset.IndexSet()
+        indexes.add(9)
+        assert 9 in indexes
+        assert 8 not in indexes
+        assert 1000 not in indexes
+
+    def test_len_counts_unique_indexes(self):
+        indexes = indexset.IndexSet([1, 2, 2, 3])
+        assert len(indexes) == 3
+
+    def test_discard_removes_index(self):
+        indexes = indexset.IndexSet([1, 2])
+        indexes.discard(1)
+        indexes.discard(50)
+        assert list(indexes) == [2]
+        assert len(indexes) == 1
+
+    def test_iter_is_sorted(self):
+        indexes = indexset.IndexSet([17, 3, 8, 0])
+        assert list(indexes) == [0, 3, 8, 17]
+
+    @pytest.mark.parametrize('start,stop', [(0, 0), (0, 8), (3, 5), (3, 20), (9, 10), (5, 100)])
+    def test_from_range(self, start, stop):
+        indexes = indexset.IndexSet.from_range(start, stop)
+        assert list(indexes) == list(range(start, stop))
+        assert len(indexes) == len(range(start, stop))
+
+    def test_add_range_counts_existing_indexes_once(self):
+        indexes = indexset.IndexSet([0, 10, 40])
+        indexes.add_range(5, 30)
+        assert len(indexes) == 27
+
+    def test_add_negative_index_raises(self):
+        with pytest.raises(IndexError):
+            indexset.IndexSet().add(-1)
+
+    def test_serializes_to_bytes(self):
+        indexes = indexset.IndexSet([0, 7, 8, 63])
+        restored = indexset.IndexSet.from_bytes(indexes.to_bytes())
+        assert restored == indexes
+        assert len(restored) == 4
+
+    def test_clear(self):
+        indexes = indexset.IndexSet([1, 2])
+        indexes.clear()
+        assert len(indexes) == 0
+        assert list(indexes) == []
+
+    def test_union(self):
+        union = indexset.IndexSet([1, 20]).union(indexset.IndexSet([2]))
+        assert list(union) == [1, 2, 20]
+        assert len(union) == 3
+
+    @pytest.mark.parametrize('indexes, start, expects', [
+        ([], 0, 0),
+        ([0, 1, 2], 0, 3),
+        (range(0, 16), 0, 16),
+        ([0, 1, 3], 0, 2),
+        ([0, 1, 3], 3, 4),
+        (range(0, 20), 25, 25),
+    ])
+    def test_first_missing(self, indexes, start, expects):
+        assert indexset.IndexSet(indexes).first_missing(start) == expects
@@ -0,0 +1,190 @@
+from multivolumecopy import jobqueue
+import multiprocessing
+import threading
+import pytest
+
+
+class TestJobQueue:
+    def setup(self):
+        self.queue = jobqueue.JobQueue()
+        self.queue.reset(0, 5)
+
+    def test_claim_returns_indexes_in_order(self):
+        assert self.queue.claim(2) == [0, 1]
+        assert self.queue.claim(2) == [2, 3]
+
+    def test_claim_stops_at_last_index(self):
+        self.queue.reset(3, 5)
+        assert self.queue.claim(4) == [3, 4]
+        assert self.queue.claim(4) == []
+
+    def test_poison_pill_claimed_before_jobs(self):
+        self.queue.put_poison_pills(1)
+        assert self.queue.claim() is None
+        assert self.queue.claim() == [0]
+
+    def test_clear_poison_pills(self):
+        self.queue.put_poison_pills(2)
+        self.queue.clear_poison_pills()
+        assert self.queue.claim() == [0]
+
+    def test_reset_discards_claimed_and_unclaimed_indexes(self):
+        self.queue.claim(4)
+        self.queue.reset(1, 3)
+        assert self.queue.claim(4) == [1, 2]
+        assert self.queue.claim(4) == []
+
+    def test_remaining_counts_unclaimed_indexes(self):
+        self.queue.claim(4)
+        assert self.queue.remaining() == 1
+
+    def test_claim_prefetches_each_index_once(self):
+        self.queue.reset(0, 5, prefetch=2)
+        (prefetch_a, prefetch_b, prefetch_c) = ([], [], [])
+        assert self.queue.claim(2, prefetch=prefetch_a) == [0, 1]
+        assert self.queue.claim(1, prefetch=prefetch_b) == [2]
+        assert self.queue.claim(2, prefetch=prefetch_c) == [3, 4]
+        assert (prefetch_a, prefetch_b, prefetch_c) == ([2, 3], [4], [])
+
+    def test_claim_timeout_returns_empty_when_nothing_queued(self):
+        self.queue.reset(5, 5)
+        assert self.queue.claim(timeout=0.01) == []
+
+    def test_claim_wakes_when_poison_pill_added(self):
+        self.queue.reset(5, 5)
+        timer = threading.Timer(0.01, self.queue.put_poison_pills, args=(1,))
+        timer.start()
+        assert self.queue.claim(timeout=5) is None
+        timer.join()
+
+    def test_batchable_limits_claim_to_consecutive_batchable_indexes(self):
+        batchable = lambda index: index != 2
+        assert self.queue.claim(4, batchable=batchable) == [0, 1]
+        assert self.queue.claim(4, batchable=batchable) == [2]
+        assert self.queue.claim(4, batchable=batchable) == [3, 4]
+
+
+class TestJobQueueChunks:
+    def setup(self):
+        self.queue = jobqueue.JobQueue(chunk_capacity=1)
+        self.queue.reset(0, 5)
+
+    def test_claim_chunk_returns_each_chunk_once(self):
+        self.queue.publish_chunks(3, 2)
+        assert self.queue.claim_chunk() == (3, 0)
+        assert self.queue.claim_chunk() == (3, 1)
+        assert self.queue.claim_chunk() is None
+
+    def test_publish_chunks_returns_false_when_full(self):
+        assert self.queue.publish_chunks(3, 2) is True
+        assert self.queue.publish_chunks(4, 2) is False
+
+    def test_complete_chunk_true_for_last_chunk(self):
+        self.queue.publish_chunks(3, 2)
+        assert self.queue.complete_chunk(3) is False
+        assert self.queue.complete_chunk(3) is True
+        # slot is released
+        assert self.queue.publish_chunks(4, 2) is True
+
+    def test_fail_chunks_only_reported_once(self):
+        self.queue.publish_chunks(3, 2)
+        self.queue.claim_chunk()
+        assert self.queue.fail_chunks(3) is True
+        assert self.queue.fail_chunks(3) is False
+        assert self.queue.claim_chunk() is None
+        assert self.queue.complete_chunk(3) is False
+
+    def test_poison_pill_claimed_before_chunks(self):
+        self.queue.publish_chunks(3, 2)
+        self.queue.put_poison_pills(1)
+        assert self.queue.claim_chunk() is None
+        assert self.queue.claim() is None
+        assert self.queue.claim_chunk() == (3, 0)
+
+    def test_clear_chunks(self):
+        self.queue.publish_chunks(3, 2)
+        self.queue.clear_chunks()
+        assert self.queue.claim_chunk() is None
+
+
+class TestJobQueueLanes:
+    def setup(self):
+        self.queue = jobqueue.JobQueue(lane_capacity=4)
+        # device 0 has two lanes
+        self.queue.reset(0, 30, lanes=[(0, 10, 0), (10, 20, 1), (20, 30, 0)], max_readers=1)
+
+    def test_interleaves_devices(self):
+        assert self.queue.claim() == [0]
+        assert self.queue.claim() == [10]
+
+    def test_device_at_max_readers_is_skipped_until_released(self):
+        self.queue.claim()
+        self.queue.claim()
+        assert self.queue.claim() == []
+        self.queue.release(10)
+        assert self.queue.claim() == [11]
+
+    def test_unlimited_readers_prefers_least_busy_device(self):
+        self.queue.reset(0, 30, lanes=[(0, 10, 0), (10, 20, 1), (20, 30, 0)])
+        assert self.queue.claim() == [0]
+        assert self.queue.claim() == [10]
+        assert self.queue.claim() == [1]
+
+    def test_claims_in_order_past_window(self):
+        self.queue.set_window(5)
+        for index in range(5):
+            assert self.queue.claim() == [index]
+            self.queue.release(index)
+        # lane 1 is past the window, index 5 must be claimed first
+        assert self.queue.claim() == [5]
+        assert self.queue.claim() == []
+
+    def test_lanes_are_clipped_to_start(self):
+        self.queue.reset(15, 30, lanes=[(0, 10, 0), (10, 20, 1), (20, 30, 0)], max_readers=1)
+        assert self.queue.claim() == [15]
+        assert self.queue.claim() == [20]
+        assert self.queue.remaining() == 13
+
+    def test_reset_raises_when_lane_capacity_exceeded(self):
+        with pytest.raises(IndexError):
+            self.queue.reset(0, 5, lanes=[(i, i + 1, 0) for i in range(5)])
+
+    def test_claim_prefetches_following_indexes_of_claimed_lane(self):
+        self.queue.reset(0, 30, lanes=[(0, 10, 0), (10, 20, 1), (20, 30, 0)], max_readers=1, prefetch=2)
+        (prefetch_a, prefetch_b) = ([], [])
+        assert self.queue.claim(prefetch=prefetch_a) == [0]
+        assert self.queue.claim(prefetch=prefetch_b) == [10]
+        assert (prefetch_a, prefetch_b) == ([1, 2], [11, 12])
+
+    def test_set_order_changes_order_claimed_within_lane(self):
+        self.queue.set_order(0, [2, 0, 1])
+        assert self.queue.claim(3) == [2, 0, 1]
+        assert self.queue.claim(2) == [10, 11]
+
+    def test_set_order_claims_positions_after_order_by_index(self):
+        self.queue.reset(0, 30)
+        self.queue.set_order(0, [1, 0])
+        assert self.queue.claim(3) == [1, 0, 2]
+
+    def test_set_order_raises_outside_allocated_positions(self):
+        with pytest.raises(IndexError):
+            self.queue.set_order(29, [30, 29])
+
+    def test_worker_started_before_set_order_claims_in_new_order(self):
+        # (ex: a spare worker, started before the window of the next device is ordered)
+        activation_event = multiprocessing.Event()
+        (reader, writer) = multiprocessing.Pipe(duplex=False)
+        worker = multiprocessing.Process(target=_claim_when_activated, args=(self.queue, activation_event, writer))
+        worker.start()
+        try:
+            self.queue.set_order(0, [2, 0, 1])
+            activation_event.set()
+            assert reader.poll(5)
+            assert reader.recv() == [2, 0, 1]
+        finally:
+            worker.join(5)
+
+
+def _claim_when_activated(queue, activation_event, connection):
+    activation_event.wait(5)
+    connection.send(queue.claim(3))
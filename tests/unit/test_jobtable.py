@@ -0,0 +1,36 @@
+from multivolumecopy import copyfile, jobtable
+import pytest
+
+
+class TestJobTable:
+    def setup(self):
+        self.copyfiles = (
+            copyfile.CopyFile(src='/src/a.txt', dst='/dst/a.txt', relpath='a.txt', bytes=1024, index=0),
+            copyfile.CopyFile(src='/src/b/\udcff.txt', dst='/dst/b/\udcff.txt', relpath='b/\udcff.txt',
+                              bytes=2048, index=1),
+            copyfile.CopyFile(src='/src/c.txt', dst='/dst/c.txt', relpath='c.txt', bytes=0, index=2,
+                              mtime_ns=1577836800000000000, mode=0o100644, inode=1234, device=2049),
+        )
+        self.table = jobtable.JobTable()
+        self.table.load(self.copyfiles)
+
+    def test_len(self):
+        assert len(self.table) == 3
+
+    def test_getitem_returns_copyfile(self):
+        assert self.table[0] == self.copyfiles[0]
+
+    def test_getitem_preserves_undecodable_paths(self):
+        assert self.table[1] == self.copyfiles[1]
+
+    def test_getitem_preserves_src_stat(self):
+        assert self.table[2] == self.copyfiles[2]
+
+    def test_getitem_raises_indexerror(self):
+        with pytest.raises(IndexError):
+            self.table[3]
+
+    def test_empty(self):
+        table = jobtable.JobTable()
+        table.load(tuple())
+        assert len(table) == 0
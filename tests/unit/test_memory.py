@@ -0,0 +1,31 @@
+from multivolumecopy import memory
+import mock
+import sys
+import pytest
+
+
+class Test_rss_bytes:
+    @pytest.mark.skipif(not sys.platform.startswith('linux'), reason='requires /proc')
+    def test_measures_resident_memory(self):
+        before = memory.rss_bytes()
+        data = bytearray(64 * 1024 * 1024)
+        data[::4096] = b'\x01' * len(data[::4096])  # touch every page
+        assert memory.rss_bytes() > before
+
+    def test_falls_back_to_resource_without_proc(self):
+        with mock.patch('multivolumecopy.memory.open', side_effect=OSError(), create=True):
+            assert memory.rss_bytes() > 0
+
+
+class Test_peak_rss_bytes:
+    def test_at_least_current_rss(self):
+        assert memory.peak_rss_bytes() >= memory.rss_bytes()
+
+
+class Test_malloc_trim:
+    def test_returns_false_when_unavailable(self):
+        with mock.patch('multivolumecopy.memory._LIBC', False):
+            assert memory.malloc_trim() is False
+
+    def test_returns_bool(self):
+        assert memory.malloc_trim() in (True, False)
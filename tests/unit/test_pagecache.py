@@ -0,0 +1,44 @@
+from multivolumecopy import pagecache, copyfile
+import mock
+import pytest
+
+
+def _copyfile(src, bytes):
+    return copyfile.CopyFile(src=src, dst='/dst/file', relpath='file', bytes=bytes, index=0)
+
+
+@pytest.mark.skipif(not pagecache.supported(), reason='requires posix_fadvise')
+class Test_willneed:
+    def test_advises_existing_file(self, tmpdir):
+        filepath = tmpdir.join('file.txt')
+        filepath.write('abc')
+        assert pagecache.willneed(str(filepath)) is True
+
+    def test_missing_file_returns_false(self, tmpdir):
+        assert pagecache.willneed(str(tmpdir.join('missing.txt'))) is False
+
+
+class Test_dontneed:
+    def test_returns_false_when_unsupported(self):
+        with mock.patch('multivolumecopy.pagecache.supported', return_value=False):
+            assert pagecache.dontneed(0) is False
+
+    @pytest.mark.skipif(not pagecache.supported(), reason='requires posix_fadvise')
+    def test_advises_open_file(self, tmpdir):
+        filepath = tmpdir.join('file.txt')
+        filepath.write('abc')
+        with open(str(filepath), 'rb') as fd:
+            assert pagecache.dontneed(fd.fileno()) is True
+
+
+class TestPrefetcher:
+    @mock.patch('multivolumecopy.pagecache.willneed', return_value=True)
+    def test_limited_to_max_bytes(self, m_willneed):
+        prefetcher = pagecache.Prefetcher(max_files=8, max_bytes=1536)
+        prefetcher.prefetch([_copyfile('/src/a', 1024), _copyfile('/src/b', 1024), _copyfile('/src/c', 1024)])
+        assert m_willneed.call_args_list == [mock.call('/src/a', 1024), mock.call('/src/b', 512)]
+
+    @mock.patch('multivolumecopy.pagecache.willneed', return_value=True)
+    def test_limited_to_max_files(self, m_willneed):
+        prefetcher = pagecache.Prefetcher(max_files=1)
+        assert prefetcher.prefetch([_copyfile('/src/a', 1024), _copyfile('/src/b', 1024)]) == 1
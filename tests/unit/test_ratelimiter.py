@@ -0,0 +1,61 @@
+from multivolumecopy import ratelimiter
+import mock
+
+
+class TestRateLimiter:
+    def setup(self):
+        self.limiter = ratelimiter.RateLimiter(read_bytes=1000, files=10)
+
+    def test_unlimited_buckets_have_no_rate(self):
+        assert self.limiter.rate(ratelimiter.READ_BYTES) == 1000
+        assert self.limiter.rate(ratelimiter.WRITE_BYTES) is None
+
+    def test_limited(self):
+        assert self.limiter.limited()
+        assert not ratelimiter.RateLimiter().limited()
+
+    def test_limits_bytes(self):
+        assert self.limiter.limits_bytes()
+        assert not ratelimiter.RateLimiter(files=10).limits_bytes()
+
+    @mock.patch('multivolumecopy.ratelimiter.time')
+    def test_throttle_sleeps_while_in_debt(self, m_time):
+        m_time.monotonic.return_value = 100.0
+        self.limiter.set_rate(ratelimiter.READ_BYTES, 1000)
+        delay = self.limiter.throttle(500)
+        assert delay == 0.5
+        m_time.sleep.assert_called_once_with(0.5)
+
+    @mock.patch('multivolumecopy.ratelimiter.time')
+    def test_throttle_uses_slowest_bucket(self, m_time):
+        m_time.monotonic.return_value = 100.0
+        self.limiter.set_rate(ratelimiter.READ_BYTES, 1000)
+        self.limiter.set_rate(ratelimiter.WRITE_BYTES, 100)
+        assert self.limiter.throttle(100) == 1.0
+
+    @mock.patch('multivolumecopy.ratelimiter.time')
+    def test_tokens_are_refilled_over_time(self, m_time):
+        m_time.monotonic.return_value = 100.0
+        self.limiter.set_rate(ratelimiter.FILES, 10)
+        self.limiter.throttle(files=10)
+        m_time.monotonic.return_value = 102.0
+        assert self.limiter.throttle(files=10) == 0
+
+    @mock.patch('multivolumecopy.ratelimiter.time')
+    def test_unused_budget_is_capped_at_burst(self, m_time):
+        m_time.monotonic.return_value = 100.0
+        self.limiter.set_rate(ratelimiter.FILES, 10)
+        m_time.monotonic.return_value = 110.0
+        # only one second of budget is saved up
+        assert self.limiter.throttle(files=20) == 1.0
+
+    @mock.patch('multivolumecopy.ratelimiter.time')
+    def test_unlimited_is_never_throttled(self, m_time):
+        m_time.monotonic.return_value = 100.0
+        limiter = ratelimiter.RateLimiter()
+        assert limiter.throttle(10 ** 12, files=10 ** 6) == 0
+        assert not m_time.sleep.called
+
+    def test_set_rate_none_is_unlimited(self):
+        self.limiter.set_rate(ratelimiter.READ_BYTES, None)
+        assert self.limiter.rate(ratelimiter.READ_BYTES) is None
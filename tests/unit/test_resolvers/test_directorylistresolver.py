@@ -54,6 +54,12 @@ class TestDirectoryListResolver:
         copyfiles = self.get_copyfiles(self.resolver, walk_paths)
         assert copyfiles[0].bytes == 1024
 
+    def test_sets_src_stat(self):
+        walk_paths = {'/src': [('/src', [], ['a.txt'])]}
+        copyfiles = self.get_copyfiles(self.resolver, walk_paths)
+        assert (copyfiles[0].mtime_ns, copyfiles[0].mode, copyfiles[0].inode, copyfiles[0].device) == \
+            (1577836800000000000, 0o100644, 1234, 2049)
+
     def test_sets_index(self):
         walk_paths = {'/src': [('/src', ['a'], ['a.txt']), ('/src/a', [], ['b.txt'])]}
         copyfiles = self.get_copyfiles(self.resolver, walk_paths)
@@ -116,7 +122,8 @@ class TestDirectoryListResolver:
             for copyfile in walk_paths[srcpath]:
                 yield copyfile
 
-        with mock.patch('{}.os.path.getsize'.format(NS), return_value=1024):
+        stat = mock.Mock(st_size=1024, st_mtime_ns=1577836800000000000, st_mode=0o100644, st_ino=1234, st_dev=2049)
+        with mock.patch('{}.os.stat'.format(NS), return_value=stat):
             with mock.patch('{}.os.walk'.format(NS), side_effect=walk_results):
                 with mock.patch.object(os, 'getcwd', return_value='/var/tmp'):
                     with multiprocessinghelpers.mock_pool():
@@ -0,0 +1,55 @@
+from multivolumecopy import resultchannel
+import multiprocessing.connection
+
+
+class TestResultChannel:
+    def setup(self):
+        self.channel = resultchannel.ResultChannel()
+
+    def test_read_returns_nothing_when_empty(self):
+        assert self.channel.read() == []
+
+    def test_results_are_buffered_until_flush(self):
+        writer = self.channel.writer(batch_size=10, flush_interval=60)
+        writer.write(1, resultchannel.STARTED)
+        assert self.channel.read() == []
+        writer.flush()
+        assert self.channel.read() == [resultchannel.Result(1, resultchannel.STARTED, 0, 0.0, 0)]
+
+    def test_flushes_when_batch_full(self):
+        writer = self.channel.writer(batch_size=2, flush_interval=60)
+        writer.write(1, resultchannel.STARTED)
+        writer.write(1, resultchannel.COMPLETED, bytes=1024, duration=0.5)
+        assert self.channel.read() == [
+            resultchannel.Result(1, resultchannel.STARTED, 0, 0.0, 0),
+            resultchannel.Result(1, resultchannel.COMPLETED, 1024, 0.5, 0),
+        ]
+
+    def test_flushes_when_interval_elapsed(self):
+        writer = self.channel.writer(batch_size=10, flush_interval=0)
+        writer.write(1, resultchannel.ERROR, errno=13)
+        assert self.channel.read() == [resultchannel.Result(1, resultchannel.ERROR, 0, 0.0, 13)]
+
+    def test_reads_from_multiple_writers(self):
+        writer_a = self.channel.writer()
+        writer_b = self.channel.writer()
+        writer_a.write(1, resultchannel.COMPLETED)
+        writer_b.write(2, resultchannel.COMPLETED)
+        writer_a.flush()
+        writer_b.flush()
+        assert [r.index for r in self.channel.read()] == [1, 2]
+
+    def test_channel_is_waitable(self):
+        writer = self.channel.writer()
+        assert multiprocessing.connection.wait([self.channel], timeout=0) == []
+        writer.write(1, resultchannel.COMPLETED)
+        writer.flush()
+        assert multiprocessing.connection.wait([self.channel], timeout=0) == [self.channel]
+
+    def test_deferred_results_sent_on_exit(self):
+        writer = self.channel.writer(batch_size=1, flush_interval=0)
+        with writer.deferred():
+            writer.write(1, resultchannel.STARTED)
+            writer.write(1, resultchannel.COMPLETED)
+            assert self.channel.read() == []
+        assert len(self.channel.read()) == 2
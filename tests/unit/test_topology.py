@@ -0,0 +1,142 @@
+from multivolumecopy import copyfile, copyoptions, topology
+import mock
+import os
+import pytest
+
+
+MOUNTINFO = (
+    '22 1 259:2 / / rw,relatime shared:1 - ext4 /dev/nvme0n1p2 rw\n'
+    '40 22 8:1 / /mnt/usb\\040disk rw,relatime shared:2 - ext4 /dev/sda1 rw\n'
+    '41 22 0:50 / /mnt/nas rw,relatime shared:3 - nfs4 nas:/backups rw\n'
+)
+
+
+class Test_read_mountinfo:
+    def test_parses_mounts(self, tmpdir):
+        mountinfo = tmpdir.join('mountinfo')
+        mountinfo.write(MOUNTINFO)
+        mounts = topology.read_mountinfo(str(mountinfo))
+        assert mounts == [
+            topology.MountInfo('/', '259:2', 'ext4', '/dev/nvme0n1p2'),
+            topology.MountInfo('/mnt/usb disk', '8:1', 'ext4', '/dev/sda1'),
+            topology.MountInfo('/mnt/nas', '0:50', 'nfs4', 'nas:/backups'),
+        ]
+
+    def test_returns_empty_list_if_unavailable(self, tmpdir):
+        assert topology.read_mountinfo(str(tmpdir.join('missing'))) == []
+
+
+class Test_is_rotational:
+    def setup_sysfs(self, tmpdir):
+        disk = tmpdir.mkdir('devices').mkdir('sda')
+        disk.mkdir('queue').join('rotational').write('1\n')
+        disk.mkdir('sda1')
+        block = tmpdir.mkdir('dev').mkdir('block')
+        os.symlink(str(disk), str(block.join('8:0')))
+        os.symlink(str(disk.join('sda1')), str(block.join('8:1')))
+
+    def test_reads_disk_queue(self, tmpdir):
+        self.setup_sysfs(tmpdir)
+        assert topology.is_rotational('8:0', sysfs=str(tmpdir)) is True
+
+    def test_partition_uses_parent_disk_queue(self, tmpdir):
+        self.setup_sysfs(tmpdir)
+        assert topology.is_rotational('8:1', sysfs=str(tmpdir)) is True
+
+    def test_returns_none_for_non_block_devices(self, tmpdir):
+        self.setup_sysfs(tmpdir)
+        assert topology.is_rotational('0:50', sysfs=str(tmpdir)) is None
+
+
+class Test_device_class:
+    @pytest.mark.parametrize('info, expects', [
+        (topology.DeviceInfo('/', 'ext4', '/dev/sda1', True), topology.HDD),
+        (topology.DeviceInfo('/', 'ext4', '/dev/nvme0n1p2', False), topology.SSD),
+        (topology.DeviceInfo('/mnt/nas', 'nfs4', 'nas:/backups', None), topology.NETWORK),
+        (topology.DeviceInfo('/tmp', 'tmpfs', 'tmpfs', None), topology.MEMORY),
+        (topology.DeviceInfo('/mnt/x', 'overlay', 'overlay', None), None),
+        (None, None),
+    ])
+    def test(self, info, expects):
+        assert topology.device_class(info) == expects
+
+
+class Test_profile_for:
+    @pytest.mark.parametrize('src, dst, expects', [
+        (topology.SSD, topology.HDD, topology.HDD),
+        (topology.NETWORK, topology.SSD, topology.NETWORK),
+        (topology.HDD, topology.NETWORK, topology.HDD),
+        (topology.SSD, topology.MEMORY, topology.SSD),
+        (topology.SSD, None, None),
+    ])
+    def test(self, src, dst, expects):
+        assert topology.profile_for([src, dst]) == expects
+
+    def test_slowest_of_several_source_devices(self):
+        assert topology.profile_for([topology.SSD, topology.HDD, topology.SSD]) == topology.HDD
+
+
+class Test_tune:
+    def setup(self):
+        self.options = copyoptions.CopyOptions()
+        self.options.num_workers = 6
+        self.options.device_tuning = set(topology.TUNABLE_OPTIONS)
+        self.copyfiles = (copyfile.CopyFile(src=__file__, dst='/dst/a', relpath='a', bytes=1, index=0),)
+
+    def tune(self, src_class, dst_class, other_src_classes=None):
+        classes = {os.path.dirname(__file__): src_class, '/dst': dst_class}
+        classes.update(other_src_classes or {})
+        device_info = lambda path, mounts: mock.Mock(path=path, source=path)
+        with mock.patch.object(topology, 'read_mountinfo', return_value=[mock.Mock()]):
+            with mock.patch.object(topology, 'device_info', side_effect=device_info):
+                with mock.patch.object(topology, 'device_class', side_effect=lambda info: classes[info.path]):
+                    return topology.tune(self.options, self.copyfiles, '/dst')
+
+    def test_single_worker_for_spinning_disks(self):
+        assert self.tune(topology.SSD, topology.HDD) == topology.HDD
+        assert self.options.num_workers == 1
+        assert self.options.chunked_copy_chunk_size == topology.PROFILES[topology.HDD]['chunked_copy_chunk_size']
+
+    def test_many_workers_for_ssds(self):
+        assert self.tune(topology.SSD, topology.SSD) == topology.SSD
+        assert self.options.num_workers == topology.PROFILES[topology.SSD]['num_workers']
+
+    def test_keeps_options_not_in_device_tuning(self):
+        self.options.device_tuning.discard('num_workers')
+        self.tune(topology.SSD, topology.HDD)
+        assert self.options.num_workers == 6
+        assert self.options.small_file_batch_size == topology.PROFILES[topology.HDD]['small_file_batch_size']
+
+    def test_profile_chosen_from_every_source_device(self):
+        self.copyfiles += (copyfile.CopyFile(src='/mnt/hdd/b', dst='/dst/b', relpath='b', bytes=1, index=1, device=-1),)
+        assert self.tune(topology.SSD, topology.SSD, {'/mnt/hdd': topology.HDD}) == topology.HDD
+
+    def test_at_least_one_worker_per_source_device(self):
+        self.copyfiles += (copyfile.CopyFile(src='/mnt/hdd/b', dst='/dst/b', relpath='b', bytes=1, index=1, device=-1),)
+        self.tune(topology.HDD, topology.HDD, {'/mnt/hdd': topology.HDD})
+        assert self.options.num_workers == 2
+
+    def test_unknown_devices_are_not_tuned(self):
+        assert self.tune(None, topology.HDD) is None
+        assert self.options.num_workers == 6
+
+
+class Test_device_lanes:
+    def copyfiles(self, srcs):
+        return tuple(copyfile.CopyFile(src=src, dst='/dst', relpath='x', bytes=1, index=i)
+                     for (i, src) in enumerate(srcs))
+
+    def test_groups_consecutive_files_by_device(self):
+        devices = {'/a': 1, '/a/b': 1, '/c': 2, '/d': 1}
+        srcs = ['/a/1', '/a/b/2', '/c/3', '/c/4', '/d/5']
+        with mock.patch('os.stat', side_effect=lambda path: mock.Mock(st_dev=devices[path])) as m_stat:
+            lanes = topology.device_lanes(self.copyfiles(srcs))
+        assert lanes == [(0, 2, 0), (2, 4, 1), (4, 5, 0)]
+        # once per directory
+        assert m_stat.call_count == 4
+
+    def test_single_device_is_one_lane(self, tmpdir):
+        tmpdir.join('a').write('a')
+        tmpdir.join('b').write('b')
+        srcs = [str(tmpdir.join('a')), str(tmpdir.join('b'))]
+        assert topology.device_lanes(self.copyfiles(srcs)) == [(0, 2, 0)]